@@ -0,0 +1,388 @@
+# agent/catalog_qa.py
+import os
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+from loaders.schema_catalog import SchemaSnapshot, TableInfo, quote_ident, render_schema
+
+CATALOG_QA = os.getenv("CATALOG_QA", "1") != "0"
+# tables (plus FK neighbours) sent to the LLM when the catalog cannot answer
+CATALOG_FRAGMENT_TABLES = int(os.getenv("CATALOG_FRAGMENT_TABLES", "12"))
+
+
+# ----------------------------------------------------------------------
+# TOKENS
+# ----------------------------------------------------------------------
+# OrderDate -> order, date; order_details -> order, details; CustomerID -> customer, id
+_WORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+# first word of each group is the canonical token
+SYNONYMS = [
+    ["customer", "client", "buyer", "purchaser"],
+    ["order", "purchase"],
+    ["product", "item", "good", "merchandise"],
+    ["employee", "staff", "worker", "personnel"],
+    ["supplier", "vendor"],
+    ["invoice", "bill", "billing"],
+    ["price", "cost", "amount", "total"],
+    ["quantity", "qty"],
+    ["date", "time", "timestamp", "day", "when"],
+    ["artist", "singer", "musician", "band", "performer"],
+    ["track", "song"],
+    ["movie", "film"],
+    ["genre", "category", "kind"],
+    ["name", "title", "label"],
+    ["id", "identifier", "key"],
+    ["address", "street"],
+    ["phone", "telephone"],
+    ["email", "mail"],
+    ["country", "nation"],
+    ["city", "town"],
+]
+_CANONICAL = {word: group[0] for group in SYNONYMS for word in group}
+
+# question words that carry intent, not content
+STOPWORDS = {
+    "a", "about", "all", "an", "and", "any", "are", "as", "at", "be", "between", "by", "can",
+    "column", "connect", "connected", "contain", "contains", "database", "db", "do", "does",
+    "each", "field", "find", "for", "from", "get", "give", "have", "has", "how", "i", "in",
+    "info", "information", "is", "it", "join", "joined", "kept", "link", "linked", "list",
+    "me", "of", "on", "or", "other", "relate", "related", "relation", "relationship", "schema",
+    "show", "store", "stored", "table", "tell", "that", "the", "their", "there", "these",
+    "they", "this", "those", "to", "type", "we", "what", "where", "which", "with", "you",
+    "attribute", "hold", "holds", "data", "record", "keep", "keeps",
+}
+
+# question term -> substrings of a declared column type
+TYPE_TERMS = {
+    "date": ("DATE", "TIME"),
+    "text": ("CHAR", "TEXT", "CLOB"),
+    "string": ("CHAR", "TEXT", "CLOB"),
+    "number": ("INT", "REAL", "NUM", "DEC", "FLOA", "DOUB"),
+    "numeric": ("INT", "REAL", "NUM", "DEC", "FLOA", "DOUB"),
+    "integer": ("INT",),
+    "blob": ("BLOB",),
+}
+
+
+def stem(word: str) -> str:
+    word = word.lower()
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokens(text: str, drop: Set[str] = frozenset()) -> List[str]:
+    """Canonical tokens of an identifier or a question (split, stemmed, synonym-mapped)."""
+    out = []
+    for word in _WORD.findall(text):
+        if word.lower() in drop:
+            continue
+        word = stem(word)
+        if word not in drop:
+            out.append(_CANONICAL.get(word, word))
+    return out
+
+
+# ----------------------------------------------------------------------
+# INDEX
+# ----------------------------------------------------------------------
+class CatalogIndex:
+    """Token postings over every table and column of a set of snapshots."""
+
+    def __init__(self, snapshots: Dict[str, SchemaSnapshot]):
+        self.snapshots = snapshots
+        # token -> {(db, table)} / {(db, table, column)}
+        self.table_postings: Dict[str, Set[Tuple[str, str]]] = {}
+        self.column_postings: Dict[str, Set[Tuple[str, str, str]]] = {}
+        self.db_tokens: Dict[str, str] = {}
+        for db, snap in snapshots.items():
+            for tok in tokens(os.path.splitext(db)[0]):
+                self.db_tokens[tok] = db
+            for name, table in snap.tables.items():
+                for tok in tokens(name):
+                    self.table_postings.setdefault(tok, set()).add((db, name))
+                for col in table.columns:
+                    for tok in tokens(col.name):
+                        self.column_postings.setdefault(tok, set()).add((db, name, col.name))
+
+    def table_info(self, db: str, table: str) -> TableInfo:
+        return self.snapshots[db].tables[table]
+
+    def tables_for(self, term: str, dbs: Set[str]) -> Set[Tuple[str, str]]:
+        return {t for t in self.table_postings.get(term, ()) if t[0] in dbs}
+
+    def columns_for(self, term: str, dbs: Set[str], tables=None) -> Set[Tuple[str, str, str]]:
+        found = {c for c in self.column_postings.get(term, ()) if c[0] in dbs}
+        if term in TYPE_TERMS:
+            kinds = TYPE_TERMS[term]
+            for db in dbs:
+                for name, table in self.snapshots[db].tables.items():
+                    for col in table.columns:
+                        if any(k in col.type.upper() for k in kinds):
+                            found.add((db, name, col.name))
+        if tables is not None:
+            found = {c for c in found if (c[0], c[1]) in tables}
+        return found
+
+    # ------------------------------------------------------------------
+    # FK GRAPH
+    # ------------------------------------------------------------------
+    def fk_edges(self, db: str) -> Dict[str, List[Tuple[str, str]]]:
+        """Undirected FK adjacency of one database: table -> [(other, "A.col → B.col")]."""
+        snap = self.snapshots[db]
+        graph: Dict[str, List[Tuple[str, str]]] = {name: [] for name in snap.tables}
+        for name, table in snap.tables.items():
+            for fk in table.foreign_keys:
+                ref = snap.table(fk.ref_table)
+                if ref is None:
+                    continue
+                ref_col = fk.ref_column or ", ".join(ref.primary_key) or "?"
+                label = f"{quote_ident(name)}.{fk.column} → {quote_ident(ref.name)}.{ref_col}"
+                graph[name].append((ref.name, label))
+                graph[ref.name].append((name, label))
+        return graph
+
+    def fk_path(self, db: str, start: str, goal: str) -> Optional[List[str]]:
+        """Shortest FK join path (edge labels) between two tables, by BFS."""
+        graph = self.fk_edges(db)
+        prev: Dict[str, Tuple[str, str]] = {start: ("", "")}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            if node == goal:
+                path = []
+                while node != start:
+                    node, label = prev[node]
+                    path.append(label)
+                return path[::-1]
+            for other, label in graph.get(node, ()):
+                if other not in prev:
+                    prev[other] = (node, label)
+                    queue.append(other)
+        return None
+
+
+# ----------------------------------------------------------------------
+# ANSWERS
+# ----------------------------------------------------------------------
+_CLAUSE_SPLIT = re.compile(r"\?|;|\n|\band\s+(?=(?:what|which|how|where|list|show)\b)", re.I)
+_ASKS_FOR = re.compile(
+    r"\b(?:which|what|list|show|find)\s+(?:are\s+|is\s+)?(?:the\s+|all\s+)?(?:[\w ]{0,40}?\s)??"
+    r"(tables?|columns?|fields?)\b",
+    re.I,
+)
+_RELATION = re.compile(r"\b(relat\w*|connect\w*|link\w*|join\w*|path)\b", re.I)
+_COLUMNS = re.compile(r"\b(columns?|fields?|attributes?)\b", re.I)
+_TABLES = re.compile(r"\b(tables?|stored?|stores|kept)\b", re.I)
+
+
+def _intent(clause: str) -> Optional[str]:
+    if _RELATION.search(clause):
+        return "relation"
+    m = _ASKS_FOR.search(clause)
+    if m:
+        return "columns" if m.group(1).lower().startswith(("column", "field")) else "tables"
+    if _COLUMNS.search(clause):
+        return "columns"
+    if _TABLES.search(clause):
+        return "tables"
+    return None
+
+
+def _label(db: str, table: str, multi_db: bool) -> str:
+    return f"{db}: {table}" if multi_db else table
+
+
+class CatalogAnswer:
+    def __init__(self, text: Optional[str], hits: Set[Tuple[str, str]]):
+        self.text = text  # None = no confident answer
+        self.hits = hits  # (db, table) pairs the question touched
+
+
+class CatalogQA:
+    """
+    Answers "which tables / which columns / how are X and Y related"
+    questions from the introspected schemas, without an LLM call. Every
+    content word of a clause must match a table, column, type or database;
+    otherwise the question goes to the LLM with only the matching fragment.
+    """
+
+    def __init__(self, fragment_tables: int = CATALOG_FRAGMENT_TABLES):
+        self.fragment_tables = fragment_tables
+        self._lock = threading.Lock()
+        self._index: Optional[CatalogIndex] = None
+        self._key: tuple = ()
+        self._stats = {"answered": 0, "fallbacks": 0}
+
+    def index(self, snapshots: Dict[str, SchemaSnapshot]) -> CatalogIndex:
+        key = tuple((db, snap.fingerprint) for db, snap in sorted(snapshots.items()))
+        with self._lock:
+            if self._index is None or self._key != key:
+                self._index, self._key = CatalogIndex(snapshots), key
+            return self._index
+
+    def answer(self, question: str, snapshots: Dict[str, SchemaSnapshot]) -> CatalogAnswer:
+        index = self.index(snapshots)
+        parts, hits, confident = [], set(), True
+        for clause in _CLAUSE_SPLIT.split(question):
+            if not clause.strip():
+                continue
+            text, clause_hits = self._clause(index, clause)
+            hits |= clause_hits
+            if text is None:
+                confident = False
+            else:
+                parts.append(text)
+
+        with self._lock:
+            self._stats["answered" if confident and parts else "fallbacks"] += 1
+        return CatalogAnswer("\n\n".join(parts) if confident and parts else None, hits)
+
+    # ------------------------------------------------------------------
+    # CLAUSES
+    # ------------------------------------------------------------------
+    def _clause(self, index: CatalogIndex, clause: str) -> Tuple[Optional[str], Set[Tuple[str, str]]]:
+        intent = _intent(clause)
+        terms = tokens(clause, drop=STOPWORDS)
+
+        # "in chinook" narrows to one database
+        dbs = {index.db_tokens[t] for t in terms if t in index.db_tokens and not index.tables_for(t, set(index.snapshots))}
+        terms = [t for t in terms if not (t in index.db_tokens and index.db_tokens[t] in dbs)]
+        dbs = dbs or set(index.snapshots)
+
+        hits = set()
+        for t in terms:
+            hits |= index.tables_for(t, dbs)
+            hits |= {(c[0], c[1]) for c in index.columns_for(t, dbs)}
+
+        if intent is None or not terms:
+            return None, hits
+        handler = getattr(self, f"_{intent}")
+        return handler(index, terms, dbs), hits
+
+    def _tables(self, index: CatalogIndex, terms: List[str], dbs: Set[str]) -> Optional[str]:
+        by_name: Set[Tuple[str, str]] = set()
+        by_column: Dict[Tuple[str, str], List[str]] = {}
+        for t in terms:
+            named = index.tables_for(t, dbs)
+            cols = index.columns_for(t, dbs)
+            if not named and not cols:
+                return None  # a word we cannot place: not confident
+            by_name |= named
+            for db, table, col in cols:
+                by_column.setdefault((db, table), []).append(col)
+
+        multi = len({db for db, _ in by_name | set(by_column)}) > 1
+        lines = [f"- {_label(db, t, multi)}" for db, t in sorted(by_name)]
+        if not lines:
+            lines = [
+                f"- {_label(db, t, multi)} (column{'s' if len(set(cols)) > 1 else ''} {', '.join(sorted(set(cols)))})"
+                for (db, t), cols in sorted(by_column.items())
+            ]
+        subject = " ".join(terms)
+        return f"Tables for '{subject}':\n" + "\n".join(lines)
+
+    def _columns(self, index: CatalogIndex, terms: List[str], dbs: Set[str]) -> Optional[str]:
+        table_terms = [t for t in terms if index.tables_for(t, dbs)]
+        column_terms = [t for t in terms if t not in table_terms]
+
+        tables: Set[Tuple[str, str]] = set()
+        for t in table_terms:
+            tables |= index.tables_for(t, dbs)
+        if not tables:
+            tables = {(db, name) for db in dbs for name in index.snapshots[db].tables}
+
+        if column_terms:
+            cols = None
+            for t in column_terms:
+                found = index.columns_for(t, dbs, tables)
+                cols = found if cols is None else cols & found
+            if not cols:
+                # "order date" where OrderDate matches both words as a column
+                cols = set.intersection(*(index.columns_for(t, dbs, tables) or set() for t in terms))
+            if not cols:
+                return None
+        else:
+            if not table_terms:
+                return None
+            cols = {(db, t, c.name) for db, t in tables for c in index.table_info(db, t).columns}
+
+        multi = len({c[0] for c in cols}) > 1
+        by_table: Dict[Tuple[str, str], List[str]] = {}
+        for db, table, col in cols:
+            by_table.setdefault((db, table), []).append(col)
+        lines = []
+        for (db, table), names in sorted(by_table.items()):
+            info = index.table_info(db, table)
+            order = {c.name: i for i, c in enumerate(info.columns)}
+            types = {c.name: c.type for c in info.columns}
+            described = ", ".join(
+                f"{n} ({types[n]})" if types[n] else n for n in sorted(names, key=order.get)
+            )
+            lines.append(f"- {_label(db, table, multi)}: {described}")
+        subject = " ".join(terms)
+        return f"Columns for '{subject}':\n" + "\n".join(lines)
+
+    def _relation(self, index: CatalogIndex, terms: List[str], dbs: Set[str]) -> Optional[str]:
+        groups = []
+        for t in terms:
+            found = index.tables_for(t, dbs)
+            if not found:
+                return None
+            if found not in groups:
+                groups.append(found)
+        if len(groups) != 2:
+            return None
+
+        best = None
+        for db_a, a in sorted(groups[0]):
+            for db_b, b in sorted(groups[1]):
+                if db_a != db_b or a == b:
+                    continue
+                path = index.fk_path(db_a, a, b)
+                if path is not None and (best is None or len(path) < len(best[3])):
+                    best = (db_a, a, b, path)
+        if best is None:
+            pairs = sorted({(a[1], b[1]) for a in groups[0] for b in groups[1]})
+            a, b = pairs[0] if pairs else ("?", "?")
+            return f"No foreign-key path between {a} and {b}."
+        db, a, b, path = best
+        multi = len(dbs) > 1
+        joins = "\n".join(f"- {edge}" for edge in path)
+        return f"{_label(db, a, multi)} and {b} are related through:\n{joins}"
+
+    # ------------------------------------------------------------------
+    # FALLBACK FRAGMENT
+    # ------------------------------------------------------------------
+    def fragment(self, hits: Set[Tuple[str, str]], snapshots: Dict[str, SchemaSnapshot]) -> Dict[str, str]:
+        """
+        {db: schema text} of the tables a question touched, plus their FK
+        neighbours, capped at ``fragment_tables``; names only if none matched.
+        """
+        if not hits:
+            return {db: "Tables: " + ", ".join(snap.tables) for db, snap in snapshots.items()}
+
+        index = self.index(snapshots)
+        chosen: List[Tuple[str, str]] = sorted(hits)[: self.fragment_tables]
+        for db, table in list(chosen):
+            for other, _ in index.fk_edges(db).get(table, ()):
+                if len(chosen) >= self.fragment_tables:
+                    break
+                if (db, other) not in chosen:
+                    chosen.append((db, other))
+
+        by_db: Dict[str, Dict[str, TableInfo]] = {}
+        for db, table in chosen:
+            by_db.setdefault(db, {})[table] = snapshots[db].tables[table]
+        return {db: render_schema(tables) for db, tables in sorted(by_db.items())}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,158 @@
+# agent/cross_db.py
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Dict, List, Tuple
+
+from loaders.connection_pool import AttachedConnectionPool
+from loaders.schema_catalog import ForeignKey, SchemaSnapshot, get_schema_catalog, render_schema
+
+# SQLite refuses more than 10 attached databases unless rebuilt with a higher
+# SQLITE_MAX_ATTACHED; keep well below that by default
+CROSS_MAX_ATTACHED = min(int(os.getenv("CROSS_MAX_ATTACHED", "6")), 10)
+CROSS_POOL_CACHE = int(os.getenv("CROSS_POOL_CACHE", "4"))
+CROSS_POOL_SIZE = int(os.getenv("CROSS_POOL_SIZE", "4"))
+
+CROSS_PREFIX = "cross:"
+
+
+class CrossDBError(Exception):
+    """The requested database combination cannot be attached."""
+
+
+def schema_alias(db_name: str) -> str:
+    """chinook.db -> chinook; anything that is not an identifier becomes _."""
+    alias = re.sub(r"\W", "_", os.path.splitext(db_name)[0]).lower()
+    return alias if alias[:1].isalpha() else f"db_{alias}"
+
+
+def combine_snapshots(name: str, snapshots: Dict[str, SchemaSnapshot]) -> SchemaSnapshot:
+    """
+    One snapshot over several attached databases: tables are keyed and
+    rendered as "alias.table" and FKs point at the qualified table.
+    """
+    tables = {}
+    schemas = {}
+    for alias, snap in snapshots.items():
+        schemas[alias] = snap.db_path
+        for table in snap.tables.values():
+            key = f"{alias}.{table.name}"
+            fks = [ForeignKey(fk.column, f"{alias}.{fk.ref_table}", fk.ref_column) for fk in table.foreign_keys]
+            tables[key] = replace(table, name=key, foreign_keys=fks)
+
+    digest = hashlib.sha256(
+        "|".join(f"{a}:{s.fingerprint}" for a, s in snapshots.items()).encode("utf-8")
+    ).hexdigest()[:16]
+    return SchemaSnapshot(
+        db_path=name,
+        schema_version=sum(s.schema_version for s in snapshots.values()),
+        mtime_ns=max(s.mtime_ns for s in snapshots.values()),
+        tables=tables,
+        text=render_schema(tables, schemas),
+        fingerprint=digest,
+        schemas=schemas,
+    )
+
+
+class CrossDatabases:
+    """
+    Registry of database combinations used in cross mode.
+
+    A combination is named "cross:<alias>+<alias>..." and resolves to an
+    AttachedConnectionPool (LRU of at most ``cache_size`` pools, evicted
+    pools are closed) and a combined SchemaSnapshot rebuilt only when a
+    member's schema changes.
+    """
+
+    def __init__(
+        self,
+        max_attached: int = CROSS_MAX_ATTACHED,
+        cache_size: int = CROSS_POOL_CACHE,
+        pool_size: int = CROSS_POOL_SIZE,
+    ):
+        self.max_attached = max_attached
+        self.cache_size = cache_size
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._members: Dict[str, Dict[str, str]] = {}  # name -> {alias: path}
+        self._pools: "OrderedDict[str, AttachedConnectionPool]" = OrderedDict()
+        self._snapshots: Dict[str, Tuple[tuple, SchemaSnapshot]] = {}
+        self._stats = {"pool_hits": 0, "pool_misses": 0, "evictions": 0}
+
+    def target(self, db_paths: Dict[str, str]) -> str:
+        """Registers a combination of {db_name: path} and returns its name."""
+        if not db_paths:
+            raise CrossDBError("Cross mode needs at least one database")
+        if len(db_paths) > self.max_attached:
+            raise CrossDBError(
+                f"Cross mode can attach at most {self.max_attached} databases "
+                f"({len(db_paths)} requested)"
+            )
+        members = {schema_alias(db): os.path.abspath(path) for db, path in sorted(db_paths.items())}
+        if len(members) != len(db_paths):
+            raise CrossDBError(f"Database names collide as schema aliases: {sorted(db_paths)}")
+        name = CROSS_PREFIX + "+".join(members)
+        with self._lock:
+            self._members.setdefault(name, members)
+        return name
+
+    @staticmethod
+    def is_target(name: str) -> bool:
+        return name.startswith(CROSS_PREFIX)
+
+    def members(self, name: str) -> Dict[str, str]:
+        with self._lock:
+            members = self._members.get(name)
+        if members is None:
+            raise CrossDBError(f"Unknown database combination: {name}")
+        return members
+
+    def pool(self, name: str) -> AttachedConnectionPool:
+        members = self.members(name)
+        evicted: List[AttachedConnectionPool] = []
+        with self._lock:
+            pool = self._pools.get(name)
+            if pool is not None:
+                self._pools.move_to_end(name)
+                self._stats["pool_hits"] += 1
+                return pool
+            self._stats["pool_misses"] += 1
+            pool = AttachedConnectionPool(members, max_size=self.pool_size)
+            self._pools[name] = pool
+            while len(self._pools) > self.cache_size:
+                _, old = self._pools.popitem(last=False)
+                self._stats["evictions"] += 1
+                evicted.append(old)
+        for old in evicted:
+            old.close()  # in-use connections are closed when released
+        return pool
+
+    def snapshot(self, name: str) -> SchemaSnapshot:
+        catalog = get_schema_catalog()
+        parts = {alias: catalog.get(path) for alias, path in self.members(name).items()}
+        key = tuple((a, s.fingerprint, s.mtime_ns) for a, s in parts.items())
+        with self._lock:
+            cached = self._snapshots.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        snap = combine_snapshots(name, parts)
+        with self._lock:
+            self._snapshots[name] = (key, snap)
+        return snap
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_pools"] = len(self._pools)
+            stats["combinations"] = len(self._members)
+        return stats
+
+    def close(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
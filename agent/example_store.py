@@ -0,0 +1,313 @@
+# agent/example_store.py
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from agent.result_cache import normalize_sql
+from agent.sql_cache import normalize_question
+
+# verified question→SQL examples shown to the LLM as few-shot guidance
+EXAMPLE_STORE = os.getenv("EXAMPLE_STORE", "1") != "0"
+EXAMPLE_SHOTS = int(os.getenv("EXAMPLE_SHOTS", "3"))
+# cosine similarity below which a stored question is not considered related
+EXAMPLE_MIN_SCORE = float(os.getenv("EXAMPLE_MIN_SCORE", "0.5"))
+EXAMPLE_STORE_MAX_PER_DB = int(os.getenv("EXAMPLE_STORE_MAX_PER_DB", "200"))
+
+
+class Example:
+    __slots__ = ("question", "sql", "fingerprint", "vector", "created", "last_used")
+
+    def __init__(self, question: str, sql: str, fingerprint: str, vector: np.ndarray,
+                 created: float = None, last_used: float = None):
+        self.question = question
+        self.sql = sql
+        self.fingerprint = fingerprint
+        self.vector = vector
+        self.created = created or time.time()
+        self.last_used = last_used or self.created
+
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+
+class _DBExamples:
+    """Examples of one database, LRU-ordered, with a lazily rebuilt similarity matrix."""
+
+    def __init__(self):
+        self.entries: "OrderedDict[str, Example]" = OrderedDict()
+        self.matrix: Optional[np.ndarray] = None
+        self.keys: List[str] = []
+
+    def changed(self):
+        self.matrix = None
+
+    def index(self, dim: int):
+        if self.matrix is None:
+            self.keys = [k for k, e in self.entries.items() if e.vector.shape[0] == dim]
+            self.matrix = (
+                np.stack([self.entries[k].vector for k in self.keys])
+                if self.keys else np.zeros((0, dim), dtype=np.float32)
+            )
+        return self.keys, self.matrix
+
+
+class ExampleStore:
+    """
+    Verified (question, database, SQL) triples — SQL that executed
+    successfully — searched by question embedding for few-shot prompting.
+
+    - deduplicated per database on the normalized question (newer SQL
+      replaces older) and on the normalized SQL (paraphrases keep the first)
+    - capped at ``max_per_db`` entries per database, least recently used
+      evicted first
+    - stamped with the schema fingerprint they were verified against; after
+      a schema change each one is compiled again and dropped if it fails
+    - persisted to a SQLite file when ``disk_path`` is set
+
+    Also counts how generated SQL fares (first attempt / repaired / failed),
+    split by whether examples were in the prompt.
+    """
+
+    def __init__(
+        self,
+        shots: int = EXAMPLE_SHOTS,
+        min_score: float = EXAMPLE_MIN_SCORE,
+        max_per_db: int = EXAMPLE_STORE_MAX_PER_DB,
+        disk_path: Optional[str] = None,
+        enabled: bool = True,
+    ):
+        self.shots = shots
+        self.min_score = min_score
+        self.max_per_db = max_per_db
+        self.enabled = enabled and shots > 0 and max_per_db > 0
+
+        self._lock = threading.Lock()
+        self._dbs: Dict[str, _DBExamples] = {}
+        self._stats = {
+            "stores": 0,
+            "duplicates": 0,
+            "evicted_capacity": 0,
+            "evicted_schema": 0,
+            "revalidated": 0,
+            "searches": 0,
+            "examples_served": 0,
+        }
+        self._outcomes: Dict[str, int] = {}
+
+        self._disk: Optional[sqlite3.Connection] = None
+        if disk_path and self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS examples ("
+                " db TEXT NOT NULL, key TEXT NOT NULL, question TEXT NOT NULL,"
+                " sql TEXT NOT NULL, fingerprint TEXT NOT NULL, vector BLOB NOT NULL,"
+                " created REAL NOT NULL, last_used REAL NOT NULL,"
+                " PRIMARY KEY (db, key))"
+            )
+            self._disk.commit()
+            self._load()
+
+    @classmethod
+    def from_env(cls) -> "ExampleStore":
+        return cls(disk_path=os.getenv("EXAMPLE_STORE_PATH") or None, enabled=EXAMPLE_STORE)
+
+    def _load(self):
+        rows = self._disk.execute(
+            "SELECT db, key, question, sql, fingerprint, vector, created, last_used"
+            " FROM examples ORDER BY last_used"
+        ).fetchall()
+        for db, key, question, sql, fingerprint, blob, created, last_used in rows:
+            vector = np.frombuffer(blob, dtype=np.float32).copy()
+            self._db(db).entries[key] = Example(question, sql, fingerprint, vector, created, last_used)
+
+    def _db(self, db_name: str) -> _DBExamples:
+        # caller holds the lock (or is __init__)
+        examples = self._dbs.get(db_name)
+        if examples is None:
+            examples = self._dbs[db_name] = _DBExamples()
+        return examples
+
+    # ------------------------------------------------------------------
+    # STORE
+    # ------------------------------------------------------------------
+    def add(self, db_name: str, question: str, sql: str, fingerprint: str, vector):
+        """Record SQL that executed successfully for ``question``."""
+        if not self.enabled:
+            return
+        key = normalize_question(question)
+        norm_sql = normalize_sql(sql)
+        now = time.time()
+        with self._lock:
+            examples = self._db(db_name)
+            same = examples.entries.get(key)
+            if same is None:
+                same_key = next(
+                    (k for k, e in examples.entries.items() if normalize_sql(e.sql) == norm_sql), None
+                )
+                if same_key is not None:
+                    # a paraphrase of a stored question: keep the first wording
+                    examples.entries.move_to_end(same_key)
+                    examples.entries[same_key].last_used = now
+                    self._stats["duplicates"] += 1
+                    return
+            elif normalize_sql(same.sql) == norm_sql and same.fingerprint == fingerprint:
+                examples.entries.move_to_end(key)
+                same.last_used = now
+                self._stats["duplicates"] += 1
+                return
+
+            entry = Example(question, sql, fingerprint, _unit(vector), now, now)
+            examples.entries[key] = entry
+            examples.entries.move_to_end(key)
+            evicted = []
+            while len(examples.entries) > self.max_per_db:
+                evicted.append(examples.entries.popitem(last=False)[0])
+                self._stats["evicted_capacity"] += 1
+            examples.changed()
+            self._stats["stores"] += 1
+
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO examples"
+                    " (db, key, question, sql, fingerprint, vector, created, last_used)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (db_name, key, question, sql, fingerprint, entry.vector.tobytes(), now, now),
+                )
+                self._delete(db_name, evicted)
+                self._disk.commit()
+
+    def _delete(self, db_name: str, keys: List[str]):
+        # caller holds the lock and commits
+        if self._disk is not None and keys:
+            self._disk.executemany(
+                "DELETE FROM examples WHERE db = ? AND key = ?", [(db_name, k) for k in keys]
+            )
+
+    # ------------------------------------------------------------------
+    # SEARCH
+    # ------------------------------------------------------------------
+    def size(self, db_name: str) -> int:
+        with self._lock:
+            examples = self._dbs.get(db_name)
+            return len(examples.entries) if examples else 0
+
+    def revalidate(self, db_name: str, fingerprint: str, compiles: Callable[[str], bool]):
+        """Re-checks examples verified against another schema version; drops those that no longer compile."""
+        with self._lock:
+            examples = self._dbs.get(db_name)
+            stale = [
+                (k, e.sql) for k, e in examples.entries.items() if e.fingerprint != fingerprint
+            ] if examples else []
+        if not stale:
+            return
+
+        # compile outside the lock; only examples still unchanged are updated
+        verdicts = [(key, sql, compiles(sql)) for key, sql in stale]
+        with self._lock:
+            examples = self._db(db_name)
+            dropped = []
+            for key, sql, ok in verdicts:
+                entry = examples.entries.get(key)
+                if entry is None or entry.sql != sql:
+                    continue
+                if ok:
+                    entry.fingerprint = fingerprint
+                    self._stats["revalidated"] += 1
+                else:
+                    del examples.entries[key]
+                    dropped.append(key)
+                    self._stats["evicted_schema"] += 1
+            examples.changed()
+            if self._disk is not None:
+                self._disk.executemany(
+                    "UPDATE examples SET fingerprint = ? WHERE db = ? AND key = ?",
+                    [(fingerprint, db_name, k) for k, _, ok in verdicts if ok],
+                )
+                self._delete(db_name, dropped)
+                self._disk.commit()
+
+    def search(self, db_name: str, vector, fingerprint: str, compiles: Callable[[str], bool] = None,
+               k: int = None) -> List[Example]:
+        """Up to ``k`` verified examples closest to the question, most similar first."""
+        if not self.enabled:
+            return []
+        if compiles is not None:
+            self.revalidate(db_name, fingerprint, compiles)
+        q = _unit(vector)
+        with self._lock:
+            self._stats["searches"] += 1
+            examples = self._dbs.get(db_name)
+            if not examples or not examples.entries:
+                return []
+            keys, matrix = examples.index(q.shape[0])
+            if not keys:
+                return []
+            sims = matrix @ q
+            found, seen_sql = [], set()
+            for i in np.argsort(-sims):
+                if sims[i] < self.min_score or len(found) >= (k or self.shots):
+                    break
+                entry = examples.entries[keys[i]]
+                if entry.fingerprint != fingerprint:
+                    continue  # not (yet) verified against this schema
+                norm_sql = normalize_sql(entry.sql)
+                if norm_sql in seen_sql:
+                    continue
+                seen_sql.add(norm_sql)
+                entry.last_used = time.time()
+                examples.entries.move_to_end(keys[i])
+                found.append(entry)
+            self._stats["examples_served"] += len(found)
+            return found
+
+    # ------------------------------------------------------------------
+    # OUTCOMES (first-attempt success / repair rate)
+    # ------------------------------------------------------------------
+    def record_outcome(self, outcome: str, shots: int = 0):
+        """outcome: "first_attempt" | "repaired" | "failed", for one generated SQL."""
+        suffix = "with_examples" if shots else "without_examples"
+        with self._lock:
+            for key in (outcome, f"{outcome}_{suffix}", "generations", f"generations_{suffix}"):
+                self._outcomes[key] = self._outcomes.get(key, 0) + 1
+
+    # ------------------------------------------------------------------
+    # MAINTENANCE
+    # ------------------------------------------------------------------
+    def clear(self, db_name: Optional[str] = None):
+        with self._lock:
+            if db_name is None:
+                self._dbs.clear()
+            else:
+                self._dbs.pop(db_name, None)
+            if self._disk is not None:
+                if db_name is None:
+                    self._disk.execute("DELETE FROM examples")
+                else:
+                    self._disk.execute("DELETE FROM examples WHERE db = ?", (db_name,))
+                self._disk.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+            outcomes = dict(self._outcomes)
+            stats["entries"] = sum(len(e.entries) for e in self._dbs.values())
+        stats.update(outcomes)
+        for suffix in ("", "_with_examples", "_without_examples"):
+            total = outcomes.get(f"generations{suffix}", 0)
+            stats[f"first_attempt_rate{suffix}"] = (
+                outcomes.get(f"first_attempt{suffix}", 0) / total if total else 0.0
+            )
+            # share of generations that needed the LLM repair round-trip
+            repairs = outcomes.get(f"repaired{suffix}", 0) + outcomes.get(f"failed{suffix}", 0)
+            stats[f"repair_rate{suffix}"] = repairs / total if total else 0.0
+        return stats
@@ -0,0 +1,473 @@
+# agent/jobs.py
+import csv
+import hashlib
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from agent.query_guard import QueryCancelled
+from agent.sql_cache import normalize_question
+from utils.logger import request_id_var
+
+# long-running queries exported to a file by background workers
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", "100"))
+JOBS_DIR = os.getenv("JOBS_DIR") or os.path.join(tempfile.gettempdir(), "sqlagent-jobs")
+# finished jobs (and their files) are deleted this long after finishing or last reuse
+JOBS_RETENTION_SECONDS = float(os.getenv("JOBS_RETENTION_SECONDS", "3600"))
+# wall-clock budget of a job's statement, reading and writing included (0 = none);
+# replaces the interactive QUERY_TIMEOUT_S / QUERY_STREAM_TIMEOUT_S
+JOBS_TIMEOUT_S = float(os.getenv("JOBS_TIMEOUT_S", "3600"))
+# rows buffered per Parquet row group
+JOBS_CHUNK_ROWS = int(os.getenv("JOBS_CHUNK_ROWS", "50000"))
+
+_SWEEP_INTERVAL_S = 60.0
+_FINISHED = ("done", "failed", "cancelled")
+
+
+class JobQueueFull(Exception):
+    """Too many jobs queued or running; retry later."""
+
+
+def parquet_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+# ----------------------------------------------------------------------
+# ARTIFACT WRITERS (one batch at a time; never the whole result in memory)
+# ----------------------------------------------------------------------
+class _CSVWriter:
+    def __init__(self, path: str, columns: List[str]):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, batch: List[tuple]):
+        self._writer.writerows(batch)
+
+    def close(self):
+        self._file.close()
+
+
+def _arrow_type(values: List[Any]):
+    """Storage class of a column's sample — SQLite's declared types do not bind values."""
+    import pyarrow as pa
+
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, int) for v in present):
+        return pa.int64()
+    if present and all(isinstance(v, (int, float)) for v in present):
+        return pa.float64()
+    if present and all(isinstance(v, bytes) for v in present):
+        return pa.binary()
+    return pa.string()
+
+
+def _wider(arrow_type):
+    import pyarrow as pa
+
+    return pa.float64() if arrow_type == pa.int64() else pa.string()
+
+
+def _column(values: List[Any], arrow_type):
+    """
+    Arrow array of ``values`` in ``arrow_type`` or the narrowest wider type
+    (int64 → float64 → string) that holds them. The sample is checked
+    first: pyarrow would silently truncate 2.5 into an int64 column.
+    """
+    import pyarrow as pa
+
+    if any(v is not None for v in values):
+        needed = _arrow_type(values)
+        if needed != arrow_type:
+            numeric = (pa.int64(), pa.float64())
+            arrow_type = pa.float64() if arrow_type in numeric and needed in numeric else pa.string()
+    while True:
+        if arrow_type == pa.string():
+            values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+        try:
+            return pa.array(values, type=arrow_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+            arrow_type = _wider(arrow_type)  # e.g. an integer beyond int64
+
+
+class _ParquetWriter:
+    """
+    Row groups of ``chunk_rows``. Column types come from the first chunk;
+    when a later chunk does not fit (a REAL after INTEGERs, text in a
+    numeric column) the column is widened and the row groups already
+    written are re-typed, one at a time.
+    """
+
+    def __init__(self, path: str, columns: List[str], chunk_rows: int = JOBS_CHUNK_ROWS):
+        self.path = path
+        self.columns = columns
+        self.chunk_rows = max(1, chunk_rows)
+        self.retyped = 0
+        self._pending: List[tuple] = []
+        self._schema = None
+        self._writer = None
+
+    def write(self, batch: List[tuple]):
+        self._pending.extend(batch)
+        if len(self._pending) >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows, self._pending = self._pending, []
+        data = list(zip(*rows)) if rows else [() for _ in self.columns]
+        if self._schema is None:
+            self._schema = pa.schema(
+                [(name, _arrow_type(list(values))) for name, values in zip(self.columns, data)]
+            )
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        arrays = [_column(list(values), field.type) for field, values in zip(self._schema, data)]
+        schema = pa.schema([(name, array.type) for name, array in zip(self.columns, arrays)])
+        if not schema.equals(self._schema):
+            self._retype(schema)
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def _retype(self, schema):
+        """Rewrites the row groups written so far with the widened schema."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._writer.close()
+        old = self.path + ".old"
+        os.replace(self.path, old)
+        try:
+            self._writer = pq.ParquetWriter(self.path, schema)
+            with pq.ParquetFile(old) as source:
+                for i in range(source.num_row_groups):
+                    try:
+                        group = source.read_row_group(i).cast(schema)
+                    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                        # e.g. BLOBs that are not UTF-8 widened to text
+                        raise ValueError(f"cannot widen the Parquet schema ({e}); export with format=csv") from e
+                    self._writer.write_table(group)
+        finally:
+            os.remove(old)
+        self._schema = schema
+        self.retyped += 1
+
+    def close(self):
+        if self._pending or self._writer is None:
+            self._flush()
+        self._writer.close()
+
+
+FORMATS = {
+    "csv": ("text/csv", _CSVWriter),
+    "parquet": ("application/vnd.apache.parquet", _ParquetWriter),
+}
+
+
+# ----------------------------------------------------------------------
+# JOBS
+# ----------------------------------------------------------------------
+class Job:
+    def __init__(self, query: str, explicit_db: Optional[str], mode: str, format: str, key: str):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.explicit_db = explicit_db
+        self.mode = mode
+        self.format = format
+        self.key = key  # identical submissions share it
+        self.status = "queued"  # queued | running | done | failed | cancelled
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.expires: Optional[float] = None
+        self.database: Optional[str] = None
+        self.sql: Optional[str] = None
+        self.columns: List[str] = []
+        self.types: List[str] = []
+        self.rows = 0
+        self.bytes = 0
+        self.error: Optional[str] = None
+        self.path: Optional[str] = None
+        self.data_tag: Optional[tuple] = None
+        self.reused = 0
+        self.cancel_requested = False
+        self.future: Optional[Future] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "query": self.query,
+            "mode": self.mode,
+            "format": self.format,
+            "database": self.database,
+            "sql": self.sql,
+            "columns": self.columns,
+            "types": self.types,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "expires": self.expires,
+            "reused": self.reused,
+        }
+
+
+class JobQueue:
+    """
+    Background execution of long-running queries.
+
+    - a bounded worker pool; submissions beyond ``max_pending`` queued or
+      running jobs raise JobQueueFull
+    - each job runs the normal pipeline with stream=True, under its own
+      ``timeout_s`` budget, and writes the rows batch by batch to a CSV or
+      Parquet file under ``directory``
+    - cancel() interrupts the running SQLite statement (the job ID is its
+      request ID)
+    - finished jobs and their files are deleted ``retention_s`` after they
+      finish or were last reused
+    - an identical submission (same question, database, mode and format)
+      is answered with the finished job while the data it read is unchanged,
+      or joins the job still running
+    """
+
+    def __init__(
+        self,
+        agent,
+        workers: int = JOBS_WORKERS,
+        directory: str = JOBS_DIR,
+        retention_s: float = JOBS_RETENTION_SECONDS,
+        max_pending: int = JOBS_MAX_PENDING,
+        timeout_s: float = JOBS_TIMEOUT_S,
+    ):
+        self.agent = agent
+        self.directory = os.path.abspath(directory)
+        self.retention_s = retention_s
+        self.max_pending = max_pending
+        self.timeout_s = timeout_s
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[str, str] = {}
+        self._last_sweep = 0.0
+        self._stats = {"submitted": 0, "reused": 0, "done": 0, "failed": 0, "cancelled": 0, "expired": 0}
+
+    @staticmethod
+    def make_key(query: str, explicit_db: Optional[str], mode: str, format: str) -> str:
+        raw = json.dumps([normalize_question(query), explicit_db or "", mode, format])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def submit(self, query: str, explicit_db: str = None, mode: str = "db", format: str = "csv") -> Job:
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported format: {format}")
+        if format == "parquet" and not parquet_available():
+            raise ValueError("format=parquet needs pyarrow (pip install pyarrow)")
+        self._sweep()
+
+        key = self.make_key(query, explicit_db, mode, format)
+        prior = self._reusable(key)
+        if prior is not None:
+            return prior
+
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j.status not in _FINISHED)
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"⚠️ {pending} jobs already queued or running, retry later")
+            job = Job(query, explicit_db, mode, format, key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+            self._stats["submitted"] += 1
+            job.future = self._pool.submit(self._run, job)
+        return job
+
+    def _reusable(self, key: str) -> Optional[Job]:
+        with self._lock:
+            prior = self._jobs.get(self._by_key.get(key, ""))
+            if prior is None or prior.status in ("failed", "cancelled"):
+                return None
+            done = prior.status == "done"
+            database, tag = prior.database, prior.data_tag
+        if done:
+            # the export is only as fresh as the data version it read
+            if not os.path.exists(prior.path or ""):
+                return None
+            try:
+                current = self.agent._data_tag(database)
+            except Exception:
+                return None
+            if current != tag:
+                return None
+        with self._lock:
+            prior.reused += 1
+            if prior.expires is not None:
+                prior.expires = time.time() + self.retention_s
+            self._stats["reused"] += 1
+        return prior
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._sweep()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in _FINISHED:
+                return job
+            job.cancel_requested = True
+            if job.future is not None and job.future.cancel():
+                self._finish(job, "cancelled")
+                return job
+            if job.status == "queued":
+                # a worker picked it up but has not started: _run sees the flag
+                # and finishes it, so there is no statement to interrupt
+                return job
+        # running: interrupt its statement (or the next one it starts)
+        self.agent.cancel(job.id)
+        return job
+
+    def artifact(self, job_id: str) -> Optional[Job]:
+        """The job if its file is ready to download."""
+        job = self.get(job_id)
+        if job is None or job.status != "done" or not os.path.exists(job.path or ""):
+            return None
+        return job
+
+    # ------------------------------------------------------------------
+    # WORKER
+    # ------------------------------------------------------------------
+    def _run(self, job: Job):
+        with self._lock:
+            if job.cancel_requested:
+                self._finish(job, "cancelled")
+                return
+            job.status = "running"
+            job.started = time.time()
+        token = request_id_var.set(job.id)  # agent.cancel(job.id) reaches the statement
+        try:
+            self._export(job)
+        except Exception as e:
+            with self._lock:
+                job.error = str(e)
+                self._finish(job, "cancelled" if job.cancel_requested else "failed")
+        finally:
+            request_id_var.reset(token)
+            self._sweep()
+
+    def _export(self, job: Job):
+        res = self.agent.run_user_query(
+            job.query, explicit_db=job.explicit_db, stream=True, mode=job.mode, timeout_s=self.timeout_s
+        )
+        if not isinstance(res, dict):
+            raise RuntimeError(str(res))
+
+        result = res["rows"]
+        with self._lock:
+            job.database, job.sql = res["database"], res["sql"]
+            job.columns, job.types = res["columns"], res["types"]
+            job.data_tag = getattr(result, "data_tag", None)
+
+        path = os.path.join(self.directory, f"{job.id}.{job.format}")
+        part = path + ".part"
+        writer = FORMATS[job.format][1](part, job.columns)
+        try:
+            for batch in result.batches():
+                if job.cancel_requested:
+                    raise QueryCancelled("Query cancelled")
+                writer.write(batch)
+                job.rows += len(batch)
+            writer.close()
+            writer = None
+            os.replace(part, path)
+        finally:
+            result.close()
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+            if os.path.exists(part):
+                os.remove(part)
+
+        with self._lock:
+            job.path = path
+            job.bytes = os.path.getsize(path)
+            self._finish(job, "done")
+
+    def _finish(self, job: Job, status: str):
+        # caller holds the lock
+        job.status = status
+        job.finished = time.time()
+        job.expires = job.finished + self.retention_s
+        self._stats[status] += 1
+
+    # ------------------------------------------------------------------
+    # RETENTION
+    # ------------------------------------------------------------------
+    def _sweep(self, force: bool = False):
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_sweep < _SWEEP_INTERVAL_S:
+                return
+            self._last_sweep = now
+            expired = [j for j in self._jobs.values() if j.expires is not None and j.expires <= now]
+            for job in expired:
+                del self._jobs[job.id]
+                if self._by_key.get(job.key) == job.id:
+                    del self._by_key[job.key]
+                self._stats["expired"] += 1
+            live = {j.path for j in self._jobs.values() if j.path}
+        for job in expired:
+            if job.path and os.path.exists(job.path):
+                os.remove(job.path)
+        # files of jobs this process does not know (an earlier run), past retention
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if path not in live and now - os.path.getmtime(path) > self.retention_s:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queued"] = sum(1 for j in self._jobs.values() if j.status == "queued")
+            stats["running"] = sum(1 for j in self._jobs.values() if j.status == "running")
+            stats["stored_bytes"] = sum(j.bytes for j in self._jobs.values() if j.status == "done")
+        return stats
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ----------------------------------------------------------------------
+# PROCESS-WIDE QUEUE (jobs live in the worker process that accepted them)
+# ----------------------------------------------------------------------
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue(create: bool = True) -> Optional[JobQueue]:
+    global _queue
+    if _queue is None and create:
+        from agent.registry import get_agent
+
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(get_agent())
+    return _queue
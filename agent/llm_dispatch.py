@@ -0,0 +1,284 @@
+# agent/llm_dispatch.py
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from agent.llm_limiter import AdaptiveLimiter, LLMBusy
+
+# (prompt key, messages, future, purpose)
+Item = Tuple[str, Any, Any, str]
+
+
+def prompt_key(messages: Any) -> str:
+    """Stable identity of a prompt (plain string or list of messages)."""
+    if isinstance(messages, str):
+        return messages
+    return "\x1e".join(f"{type(m).__name__}:{getattr(m, 'content', m)}" for m in messages)
+
+
+class _AsyncState:
+    """Per-event-loop coalescing / batching state."""
+
+    def __init__(self):
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.pending: List[Item] = []
+        self.flush_handle = None
+        # the loop only keeps weak references to tasks; hold them until done
+        self.tasks: Set[asyncio.Task] = set()
+
+
+class LLMDispatcher:
+    """
+    Sits between the agent and the chat model.
+
+    - single-flight: identical prompts already in flight share one upstream
+      call and its result
+    - micro-batching: distinct prompts arriving within ``window_s`` of each
+      other go upstream together through batch() / abatch()
+
+    Works for both the sync pipeline (a collector thread) and the async one
+    (per event loop). With ``factory`` set and no ``llm``, the chat model is
+    built on the first upstream call.
+
+    With a ``limiter``, every distinct prompt holds one of its slots from
+    before it joins a batch until its result is back: batch() / abatch()
+    still send one HTTP request per input. The slot is taken in the caller's
+    context so the wait shows up as that request's "queue" stage; coalesced
+    waiters take none.
+    """
+
+    def __init__(
+        self,
+        llm,
+        window_s: float = None,
+        max_batch: int = None,
+        max_concurrency: int = 32,
+        factory: Callable[[], Any] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ):
+        self._llm = llm
+        self._factory = factory
+        self._factory_lock = threading.Lock()
+        self.window_s = window_s if window_s is not None else float(os.getenv("LLM_BATCH_WINDOW_MS", "10")) / 1000
+        self.max_batch = max_batch or int(os.getenv("LLM_MAX_BATCH", "16"))
+        self.limiter = limiter
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._inflight: Dict[str, Future] = {}
+        self._pending: List[Item] = []
+        self._collector = None
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-batch")
+        self._async_states: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+        self._stats = {"requests": 0, "coalesced": 0, "upstream_prompts": 0, "batches": 0, "errors": 0}
+        self._batch_sizes: Counter = Counter()
+
+    @property
+    def llm(self):
+        if self._llm is None and self._factory is not None:
+            with self._factory_lock:
+                if self._llm is None:
+                    self._llm = self._factory()
+        return self._llm
+
+    @llm.setter
+    def llm(self, value):
+        self._llm = value
+
+    # ------------------------------------------------------------------
+    # SYNC
+    # ------------------------------------------------------------------
+    def invoke(self, messages: Any, purpose: str = "generate") -> Any:
+        key = prompt_key(messages)
+        with self._cond:
+            self._stats["requests"] += 1
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = self._inflight[key] = Future()
+            else:
+                self._stats["coalesced"] += 1
+        if owner:
+            self._admit((key, messages, fut, purpose))
+        return fut.result()
+
+    def _admit(self, item: Item):
+        key, _, fut, purpose = item
+        limiter = self._limiter()
+        try:
+            if limiter is not None:
+                limiter.acquire(purpose)
+        except LLMBusy as e:
+            with self._cond:
+                self._inflight.pop(key, None)
+                self._stats["errors"] += 1
+            fut.set_exception(e)
+            return
+        with self._cond:
+            self._pending.append(item)
+            self._ensure_collector()
+            self._cond.notify()
+
+    def _ensure_collector(self):
+        # caller holds the lock
+        if self._collector is None or not self._collector.is_alive():
+            self._collector = threading.Thread(target=self._collect, name="llm-collector", daemon=True)
+            self._collector.start()
+
+    def _collect(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window_s
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            self._executor.submit(self._run_batch, batch)
+
+    def _limiter(self) -> Optional[AdaptiveLimiter]:
+        return self.limiter if self.limiter is not None and self.limiter.enabled else None
+
+    def _release(self, latency: float, results: List[Any]):
+        """Every prompt held its own slot; hand each back with its own outcome."""
+        limiter = self._limiter()
+        if limiter is not None:
+            for result in results:
+                limiter.release(latency, result if isinstance(result, Exception) else None)
+
+    def _run_batch(self, batch: List[Item]):
+        inputs = [messages for _, messages, _, _ in batch]
+        start = time.monotonic()
+        try:
+            if len(inputs) == 1:
+                results = [self.llm.invoke(inputs[0])]
+            else:
+                results = self.llm.batch(inputs, return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(inputs)
+        self._release(time.monotonic() - start, results)
+        self._settle(batch, results)
+
+    def _settle(self, batch, results):
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["upstream_prompts"] += len(batch)
+            self._batch_sizes[len(batch)] += 1
+            for key, _, _, _ in batch:
+                self._inflight.pop(key, None)
+        for (_, _, fut, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                with self._lock:
+                    self._stats["errors"] += 1
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+    # ------------------------------------------------------------------
+    # ASYNC
+    # ------------------------------------------------------------------
+    async def ainvoke(self, messages: Any, purpose: str = "generate") -> Any:
+        loop = asyncio.get_running_loop()
+        state = self._async_states.get(loop)
+        if state is None:
+            state = self._async_states[loop] = _AsyncState()
+
+        key = prompt_key(messages)
+        with self._lock:
+            self._stats["requests"] += 1
+        fut = state.inflight.get(key)
+        if fut is not None:
+            with self._lock:
+                self._stats["coalesced"] += 1
+        else:
+            fut = loop.create_future()
+            state.inflight[key] = fut
+            # admitted in a task of its own (copying this context, so the
+            # queue wait lands on this request's trace): cancelling the owner
+            # must not strand the waiters coalesced onto it
+            self._spawn(state, loop.create_task(self._aadmit(loop, state, (key, messages, fut, purpose))))
+        # shield: one cancelled waiter must not cancel the shared call
+        return await asyncio.shield(fut)
+
+    @staticmethod
+    def _spawn(state: _AsyncState, task: asyncio.Task):
+        state.tasks.add(task)
+        task.add_done_callback(state.tasks.discard)
+
+    async def _aadmit(self, loop, state: _AsyncState, item: Item):
+        key, _, fut, purpose = item
+        limiter = self._limiter()
+        try:
+            if limiter is not None:
+                await limiter.aacquire(purpose)
+        except LLMBusy as e:
+            state.inflight.pop(key, None)
+            with self._lock:
+                self._stats["errors"] += 1
+            if not fut.done():
+                fut.set_exception(e)
+            return
+        state.pending.append(item)
+        if len(state.pending) >= self.max_batch:
+            self._aflush(loop, state)
+        elif state.flush_handle is None:
+            state.flush_handle = loop.call_later(self.window_s, self._aflush, loop, state)
+
+    def _aflush(self, loop, state: _AsyncState):
+        if state.flush_handle is not None:
+            state.flush_handle.cancel()
+            state.flush_handle = None
+        batch, state.pending = state.pending, []
+        if batch:
+            self._spawn(state, loop.create_task(self._arun_batch(state, batch)))
+
+    async def _arun_batch(self, state: _AsyncState, batch: List[Item]):
+        inputs = [messages for _, messages, _, _ in batch]
+        start = time.monotonic()
+        try:
+            if len(inputs) == 1:
+                results = [await self.llm.ainvoke(inputs[0])]
+            else:
+                results = await self.llm.abatch(inputs, return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(inputs)
+        self._release(time.monotonic() - start, results)
+
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["upstream_prompts"] += len(batch)
+            self._batch_sizes[len(batch)] += 1
+        for (key, _, fut, _), result in zip(batch, results):
+            state.inflight.pop(key, None)
+            if fut.done():
+                continue
+            if isinstance(result, Exception):
+                with self._lock:
+                    self._stats["errors"] += 1
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+    # ------------------------------------------------------------------
+    # METRICS
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._pending) + sum(
+                len(s.pending) for s in list(self._async_states.values())
+            )
+            stats["batch_sizes"] = dict(sorted(self._batch_sizes.items()))
+        stats["coalescing_ratio"] = stats["coalesced"] / stats["requests"] if stats["requests"] else 0.0
+        stats["avg_batch_size"] = stats["upstream_prompts"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
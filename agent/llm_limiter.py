@@ -0,0 +1,305 @@
+# agent/llm_limiter.py
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+from utils import tracing
+
+LLM_LIMITER = os.getenv("LLM_LIMITER", "1") != "0"
+LLM_CONCURRENCY_INITIAL = float(os.getenv("LLM_CONCURRENCY_INITIAL", "32"))
+LLM_CONCURRENCY_MIN = float(os.getenv("LLM_CONCURRENCY_MIN", "2"))
+LLM_CONCURRENCY_MAX = float(os.getenv("LLM_CONCURRENCY_MAX", "256"))
+# waiters per priority class; beyond that calls are shed at once
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "256"))
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "15"))
+# opt-in: also back off when average latency exceeds this multiple of the
+# recent best. Off by default — prompts of very different sizes (a short
+# chat turn vs. a pruned wide schema) make latency a noisy overload signal.
+LLM_LATENCY_TOLERANCE = float(os.getenv("LLM_LATENCY_TOLERANCE", "0"))
+
+# lower value = served first; repairs wait behind first attempts
+PRIORITIES = {"generate": 0, "chat": 0, "repair": 1}
+_CLASSES = ("first_attempt", "repair")
+
+
+class LLMBusy(Exception):
+    """The LLM admission queue is full or timed out; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """HTTP 429 / provider RateLimitError, whatever client raised it."""
+    for obj in (exc, getattr(exc, "response", None)):
+        if getattr(obj, "status_code", None) == 429 or getattr(obj, "status", None) == 429:
+            return True
+    return "ratelimit" in type(exc).__name__.lower()
+
+
+class _Waiter:
+    __slots__ = ("priority", "granted", "event", "loop", "future")
+
+    def __init__(self, priority: int, loop=None):
+        self.priority = priority
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self):
+        # caller holds the limiter lock
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class AdaptiveLimiter:
+    """
+    Admission control for LLM calls, shared by the sync and async pipelines.
+
+    - concurrency limit adapted AIMD-style: +1/limit per success while the
+      limit is in use, x0.5 on a 429 and, if ``latency_tolerance`` is set,
+      x0.9 when average latency drifts past that multiple of the recent best
+    - one bounded FIFO per priority class; first attempts are admitted
+      before repairs
+    - calls that find their queue full, or wait longer than
+      ``queue_timeout_s``, are shed with LLMBusy instead of piling onto an
+      overloaded provider
+    """
+
+    def __init__(
+        self,
+        initial: float = LLM_CONCURRENCY_INITIAL,
+        min_limit: float = LLM_CONCURRENCY_MIN,
+        max_limit: float = LLM_CONCURRENCY_MAX,
+        queue_size: int = LLM_QUEUE_SIZE,
+        queue_timeout_s: float = LLM_QUEUE_TIMEOUT_S,
+        latency_tolerance: float = LLM_LATENCY_TOLERANCE,
+        enabled: bool = LLM_LIMITER,
+    ):
+        self.min_limit = max(1.0, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.queue_size = queue_size
+        self.queue_timeout_s = queue_timeout_s
+        self.latency_tolerance = latency_tolerance
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._queues: List[Deque[_Waiter]] = [deque() for _ in _CLASSES]
+        self._avg_latency: Optional[float] = None
+        self._recent: Deque[float] = deque(maxlen=200)
+        self._last_decrease = 0.0
+        self._stats = {
+            "admitted": 0,
+            "queued": 0,
+            "shed_full": 0,
+            "shed_timeout": 0,
+            "rate_limited": 0,
+            "increases": 0,
+            "decreases": 0,
+        }
+
+    # ------------------------------------------------------------------
+    # ADMISSION
+    # ------------------------------------------------------------------
+    def _enter(self, priority: int, loop=None) -> Optional[_Waiter]:
+        """None if admitted at once, else the queued waiter; raises LLMBusy when full."""
+        with self._lock:
+            ahead = any(self._queues[p] for p in range(priority + 1))
+            if self._inflight < int(self.limit) and not ahead:
+                self._inflight += 1
+                self._stats["admitted"] += 1
+                return None
+            queue = self._queues[priority]
+            if len(queue) >= self.queue_size:
+                self._stats["shed_full"] += 1
+                raise self._busy(f"LLM queue full ({_CLASSES[priority]})")
+            waiter = _Waiter(priority, loop)
+            queue.append(waiter)
+            self._stats["queued"] += 1
+            return waiter
+
+    def _timed_out(self, waiter: _Waiter) -> bool:
+        """After a wait ended without a wake-up: True if the waiter was dequeued (shed)."""
+        with self._lock:
+            if waiter.granted:
+                return False  # granted right at the deadline: keep the slot
+            try:
+                self._queues[waiter.priority].remove(waiter)
+            except ValueError:
+                pass
+            self._stats["shed_timeout"] += 1
+            return True
+
+    def _abandon(self, waiter: _Waiter):
+        # async waiter cancelled: give back a slot it may already have been handed
+        with self._lock:
+            if not waiter.granted:
+                try:
+                    self._queues[waiter.priority].remove(waiter)
+                except ValueError:
+                    pass
+                return
+            self._inflight -= 1
+            self._grant()
+
+    def _grant(self):
+        # caller holds the lock
+        for queue in self._queues:
+            while queue and self._inflight < int(self.limit):
+                waiter = queue.popleft()
+                waiter.granted = True
+                self._inflight += 1
+                self._stats["admitted"] += 1
+                waiter.wake()
+
+    def _busy(self, reason: str) -> LLMBusy:
+        # caller holds the lock
+        retry_after = max(1.0, math.ceil(self._avg_latency or 1.0))
+        return LLMBusy(f"⚠️ Server busy: {reason}, retry in {retry_after:.0f}s", retry_after)
+
+    def acquire(self, purpose: str):
+        """
+        Blocks until a slot is free. Call it in the requesting context: the
+        wait is recorded as that request's "queue" stage.
+        """
+        priority = PRIORITIES.get(purpose, 0)
+        waiter = self._enter(priority)
+        if waiter is None:
+            return
+        start = time.perf_counter()
+        try:
+            if not waiter.event.wait(self.queue_timeout_s) and self._timed_out(waiter):
+                with self._lock:
+                    raise self._busy(f"waited {self.queue_timeout_s:g}s for an LLM slot")
+        finally:
+            tracing.record_wait("queue", time.perf_counter() - start)
+
+    async def aacquire(self, purpose: str):
+        priority = PRIORITIES.get(purpose, 0)
+        waiter = self._enter(priority, asyncio.get_running_loop())
+        if waiter is None:
+            return
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            if self._timed_out(waiter):
+                with self._lock:
+                    raise self._busy(f"waited {self.queue_timeout_s:g}s for an LLM slot")
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        finally:
+            tracing.record_wait("queue", time.perf_counter() - start)
+
+    # ------------------------------------------------------------------
+    # FEEDBACK (AIMD)
+    # ------------------------------------------------------------------
+    def release(self, latency: float, error: Optional[BaseException] = None):
+        now = time.monotonic()
+        with self._lock:
+            saturated = self._inflight >= int(self.limit)
+            self._inflight -= 1
+            if error is not None and is_rate_limited(error):
+                self._stats["rate_limited"] += 1
+                self._decrease(0.5, now)
+            elif error is None:
+                self._recent.append(latency)
+                self._avg_latency = (
+                    latency if self._avg_latency is None else 0.9 * self._avg_latency + 0.1 * latency
+                )
+                floor = min(self._recent)
+                if (
+                    self.latency_tolerance > 0
+                    and len(self._recent) >= 10
+                    and self._avg_latency > self.latency_tolerance * floor
+                ):
+                    self._decrease(0.9, now)
+                elif saturated and self.limit < self.max_limit:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                    self._stats["increases"] += 1
+            self._grant()
+
+    def _decrease(self, factor: float, now: float):
+        # caller holds the lock; one cut per round-trip, not one per failed call
+        if now - self._last_decrease < (self._avg_latency or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+        self._stats["decreases"] += 1
+
+    # ------------------------------------------------------------------
+    # ENTRY
+    # ------------------------------------------------------------------
+    @contextmanager
+    def slot(self, purpose: str):
+        """Holds one LLM slot for the block (blocking wait); no-op when disabled."""
+        if not self.enabled:
+            yield
+            return
+        self.acquire(purpose)
+        start, error = time.monotonic(), None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.release(time.monotonic() - start, error)
+
+    @asynccontextmanager
+    async def aslot(self, purpose: str):
+        if not self.enabled:
+            yield
+            return
+        await self.aacquire(purpose)
+        start, error = time.monotonic(), None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.release(time.monotonic() - start, error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["limit"] = round(self.limit, 2)
+            stats["inflight"] = self._inflight
+            for name, queue in zip(_CLASSES, self._queues):
+                stats[f"queued_{name}"] = len(queue)
+            stats["avg_latency_s"] = round(self._avg_latency or 0.0, 4)
+        return stats
+
+
+# ----------------------------------------------------------------------
+# PROCESS-WIDE LIMITER (provider rate limits are per key, not per agent)
+# ----------------------------------------------------------------------
+_limiter: Optional[AdaptiveLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_llm_limiter() -> AdaptiveLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = AdaptiveLimiter()
+    return _limiter
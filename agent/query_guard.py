@@ -0,0 +1,289 @@
+# agent/query_guard.py
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loaders.connection_pool import SQLiteConnectionPool
+from loaders.schema_catalog import SchemaSnapshot
+
+
+class QueryRejected(Exception):
+    """The plan was refused before execution (e.g. full scan of a huge table)."""
+
+
+class QueryBudgetExceeded(Exception):
+    """The statement was interrupted by its wall-clock or VM-step budget."""
+
+
+class QueryCancelled(QueryBudgetExceeded):
+    """The statement was cancelled by the caller."""
+
+
+# ----------------------------------------------------------------------
+# POLICIES
+# ----------------------------------------------------------------------
+class QueryPolicy:
+    """
+    Execution limits for one database.
+
+    max_rows / stream_max_rows : LIMIT injected into unbounded SELECTs (0 = none)
+    full_scan_rows             : full scans of tables above this size are flagged
+    full_scan_action           : "flag" (warn and run) | "reject"
+    timeout_s / stream_timeout_s : wall-clock budget (0 = none)
+    max_vm_steps               : SQLite VM instruction budget (0 = none)
+    """
+
+    def __init__(
+        self,
+        max_rows: int = 1000,
+        stream_max_rows: int = 0,
+        full_scan_rows: int = 1_000_000,
+        full_scan_action: str = "flag",
+        timeout_s: float = 30.0,
+        stream_timeout_s: float = 300.0,
+        max_vm_steps: int = 0,
+        progress_interval: int = 10_000,
+    ):
+        if full_scan_action not in ("flag", "reject"):
+            raise ValueError(f"full_scan_action must be 'flag' or 'reject', got {full_scan_action!r}")
+        self.max_rows = max_rows
+        self.stream_max_rows = stream_max_rows
+        self.full_scan_rows = full_scan_rows
+        self.full_scan_action = full_scan_action
+        self.timeout_s = timeout_s
+        self.stream_timeout_s = stream_timeout_s
+        self.max_vm_steps = max_vm_steps
+        self.progress_interval = progress_interval
+
+    def copy(self, **overrides) -> "QueryPolicy":
+        return QueryPolicy(**{**vars(self), **overrides})
+
+    @classmethod
+    def from_env(cls) -> "QueryPolicy":
+        return cls(
+            max_rows=int(os.getenv("QUERY_MAX_ROWS", "1000")),
+            full_scan_rows=int(os.getenv("QUERY_FULL_SCAN_ROWS", "1000000")),
+            full_scan_action=os.getenv("QUERY_FULL_SCAN_ACTION", "flag"),
+            timeout_s=float(os.getenv("QUERY_TIMEOUT_S", "30")),
+            stream_timeout_s=float(os.getenv("QUERY_STREAM_TIMEOUT_S", "300")),
+            max_vm_steps=int(os.getenv("QUERY_MAX_VM_STEPS", "0")),
+        )
+
+
+DEFAULT_POLICY = QueryPolicy.from_env()
+_policies: Dict[str, QueryPolicy] = {}
+
+
+def configure_policy(db_name: str, **overrides):
+    """Per-database overrides on top of the default policy."""
+    _policies[db_name] = get_policy(db_name).copy(**overrides)
+
+
+def get_policy(db_name: str) -> QueryPolicy:
+    return _policies.get(db_name, DEFAULT_POLICY)
+
+
+def _load_env_policies():
+    """QUERY_POLICIES='{"imdb.db": {"full_scan_action": "reject", "timeout_s": 10}}'"""
+    raw = os.getenv("QUERY_POLICIES")
+    if raw:
+        for db_name, overrides in json.loads(raw).items():
+            configure_policy(db_name, **overrides)
+
+
+# ----------------------------------------------------------------------
+# AUTOMATIC LIMIT
+# ----------------------------------------------------------------------
+_LEADING_COMMENTS = re.compile(r"^\s*(?:--[^\n]*\n\s*|/\*.*?\*/\s*)*", re.S)
+_TRAILING_LIMIT = re.compile(
+    r"\bLIMIT\s+(\d+)(\s*(?:OFFSET\s+\d+|,\s*\d+))?\s*$", re.I
+)
+
+
+def apply_limit(sql: str, max_rows: int) -> str:
+    """
+    Append LIMIT to an unbounded SELECT / WITH statement, or lower an
+    existing top-level LIMIT that exceeds max_rows.
+    """
+    sql = sql.strip().rstrip(";").rstrip()
+    if max_rows <= 0:
+        return sql
+    body = _LEADING_COMMENTS.sub("", sql)
+    if not re.match(r"(SELECT|WITH)\b", body, re.I):
+        return sql
+
+    m = _TRAILING_LIMIT.search(sql)
+    if m:
+        if "," in (m.group(2) or ""):
+            return sql  # "LIMIT offset, count" — leave as written
+        if int(m.group(1)) <= max_rows:
+            return sql
+        return sql[:m.start(1)] + str(max_rows) + sql[m.end(1):]
+    return f"{sql}\nLIMIT {max_rows}"
+
+
+# ----------------------------------------------------------------------
+# EXECUTION BUDGET (progress handler)
+# ----------------------------------------------------------------------
+class ExecutionBudget:
+    """
+    Wall-clock + VM-step budget enforced through sqlite3's progress handler.
+    The handler runs every ``interval`` VM instructions; returning non-zero
+    makes SQLite abort the statement with "interrupted".
+
+    ``cancelled`` (optional) is polled by the same handler, so a statement
+    can be cancelled from another thread or process.
+    """
+
+    def __init__(
+        self,
+        timeout_s: float = 0,
+        max_vm_steps: int = 0,
+        interval: int = 10_000,
+        cancelled: Optional[Callable[[], bool]] = None,
+    ):
+        self.timeout_s = timeout_s
+        self.max_vm_steps = max_vm_steps
+        self.interval = interval
+        self.cancelled = cancelled
+        self.steps = 0
+        self.tripped: Optional[str] = None
+        self._deadline = None
+
+    def _handler(self) -> int:
+        self.steps += self.interval
+        if self.cancelled is not None and self.cancelled():
+            self.tripped = "cancelled"
+            return 1
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            self.tripped = f"exceeded {self.timeout_s:g}s time budget"
+            return 1
+        if self.max_vm_steps and self.steps > self.max_vm_steps:
+            self.tripped = f"exceeded {self.max_vm_steps} VM-step budget"
+            return 1
+        return 0
+
+    def install(self, conn: sqlite3.Connection):
+        if not self.timeout_s and not self.max_vm_steps and self.cancelled is None:
+            return
+        self._deadline = time.monotonic() + self.timeout_s if self.timeout_s else None
+        conn.set_progress_handler(self._handler, self.interval)
+
+    def remove(self, conn: sqlite3.Connection):
+        conn.set_progress_handler(None, 0)
+
+    def translate(self, error: Exception) -> Exception:
+        """Turn SQLite's generic "interrupted" into a descriptive error."""
+        if self.tripped == "cancelled" and isinstance(error, sqlite3.OperationalError):
+            return QueryCancelled("Query cancelled")
+        if self.tripped and isinstance(error, sqlite3.OperationalError):
+            return QueryBudgetExceeded(f"Query stopped: {self.tripped}")
+        return error
+
+
+# ----------------------------------------------------------------------
+# PLAN INSPECTION
+# ----------------------------------------------------------------------
+# FROM/JOIN <[schema.]table> [AS] <alias>
+_IDENT = r'(?:"[^"]+"|\[[^\]]+\]|`[^`]+`|\w+)'
+_TABLE_REF = re.compile(
+    rf"\b(?:FROM|JOIN)\s+(?P<table>{_IDENT}(?:\s*\.\s*{_IDENT})?)(?:\s+(?:AS\s+)?(?P<alias>\w+))?",
+    re.I,
+)
+_IDENT_PART = re.compile(r'"([^"]+)"|\[([^\]]+)\]|`?(\w+)`?')
+_NOT_ALIAS = {
+    "WHERE", "JOIN", "LEFT", "RIGHT", "INNER", "OUTER", "CROSS", "NATURAL", "ON",
+    "USING", "GROUP", "ORDER", "LIMIT", "HAVING", "UNION", "EXCEPT", "INTERSECT", "WINDOW",
+}
+
+
+class QueryGuard:
+    """EXPLAIN QUERY PLAN inspection with cached per-table row estimates."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estimates: Dict[Tuple[str, str], Tuple[int, int]] = {}
+
+    def _estimate_rows(self, conn: sqlite3.Connection, snapshot: SchemaSnapshot, table: str) -> int:
+        path = snapshot.path_of(table)
+        key = (path, snapshot.split(table)[1])
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._estimates.get(key)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+
+        try:
+            # max(rowid) is an O(log n) b-tree lookup, unlike COUNT(*)
+            rows = conn.execute(f"SELECT MAX(rowid) FROM {snapshot.table_ref(table)}").fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            rows = 0  # WITHOUT ROWID table or a view — no cheap estimate
+        with self._lock:
+            self._estimates[key] = (mtime_ns, rows)
+        return rows
+
+    @staticmethod
+    def _aliases(sql: str, snapshot: SchemaSnapshot) -> Dict[str, str]:
+        """{name the plan may print: table key}; the plan shows aliases, not tables."""
+        aliases = {}
+        for m in _TABLE_REF.finditer(sql):
+            parts = [a or b or c for a, b, c in _IDENT_PART.findall(m.group("table"))]
+            info = snapshot.table(".".join(parts))
+            if info is None:
+                continue
+            aliases[parts[-1]] = info.name
+            if m.group("alias") and m.group("alias").upper() not in _NOT_ALIAS:
+                aliases[m.group("alias")] = info.name
+        return aliases
+
+    def _scanned_tables(self, plan: List[tuple], snapshot: SchemaSnapshot, sql: str = "") -> List[str]:
+        aliases = self._aliases(sql, snapshot)
+        for name in snapshot.tables:
+            aliases.setdefault(snapshot.split(name)[1], name)
+        # longest name first so "Order Details" wins over "Order"
+        names = sorted(aliases, key=len, reverse=True)
+        scanned = []
+        for row in plan:
+            detail = row[-1]
+            # SEARCH = index lookup; SCAN (with or without an index) = full pass
+            m = re.match(r"SCAN (?:TABLE )?(.+)$", detail)
+            if not m:
+                continue
+            rest = m.group(1)
+            for name in names:
+                if rest == name or rest.startswith(name + " "):
+                    scanned.append(aliases[name])
+                    break
+        return scanned
+
+    def inspect(
+        self,
+        pool: SQLiteConnectionPool,
+        sql: str,
+        snapshot: SchemaSnapshot,
+        policy: QueryPolicy,
+    ) -> List[str]:
+        """Returns warnings; raises QueryRejected when the policy says so."""
+        if policy.full_scan_rows <= 0:
+            return []
+        warnings = []
+        with pool.connection() as conn:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+            for table in self._scanned_tables(plan, snapshot, sql):
+                rows = self._estimate_rows(conn, snapshot, table)
+                if rows > policy.full_scan_rows:
+                    msg = f"full scan of {table} (~{rows:,} rows)"
+                    if policy.full_scan_action == "reject":
+                        raise QueryRejected(
+                            f"Query rejected: {msg} exceeds {policy.full_scan_rows:,} rows; "
+                            f"filter on an indexed column or aggregate a smaller table"
+                        )
+                    warnings.append(msg)
+        return warnings
+
+
+_load_env_policies()
@@ -0,0 +1,52 @@
+# agent/registry.py
+import os
+import threading
+from typing import Dict, Optional
+
+# agent.sql_agent is imported on the first get_agent() call, so importing
+# this module (e.g. from a web app) stays cheap
+
+_agents: Dict[str, "MultiDBAgent"] = {}
+_default_dir: Optional[str] = None
+_lock = threading.Lock()
+
+
+def _resolve(db_dir: Optional[str]) -> str:
+    return os.path.abspath(db_dir or _default_dir or os.path.join(os.getcwd(), "databases"))
+
+
+def get_agent(db_dir: Optional[str] = None, create: bool = True):
+    """
+    Process-wide MultiDBAgent for ``db_dir`` (default ./databases), built on
+    first use and shared by every caller — Streamlit reruns, FastAPI
+    requests, background jobs. With create=False returns None if it has not
+    been built yet.
+    """
+    path = _resolve(db_dir)
+    agent = _agents.get(path)
+    if agent is not None or not create:
+        return agent
+    with _lock:
+        agent = _agents.get(path)
+        if agent is None:
+            from agent.sql_agent import MultiDBAgent
+
+            agent = _agents[path] = MultiDBAgent(db_dir=path)
+        return agent
+
+
+def set_agent(agent, default: bool = True):
+    """Registers a pre-built agent (custom LLM, tests, benchmarks) for its db_dir."""
+    global _default_dir
+    path = os.path.abspath(agent.db_dir)
+    with _lock:
+        _agents[path] = agent
+        if default:
+            _default_dir = path
+
+
+def reset_agents():
+    global _default_dir
+    with _lock:
+        _agents.clear()
+        _default_dir = None
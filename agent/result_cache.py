@@ -0,0 +1,224 @@
+# agent/result_cache.py
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from loaders.result_set import ResultSet, batch_bytes
+
+# per-row bookkeeping on top of the payload (tuple + list slot)
+_ROW_OVERHEAD = 64
+
+_SQL_TOKEN = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])|(\s+)""")
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapses whitespace outside quoted literals/identifiers; drops trailing semicolons."""
+    sql = _SQL_TOKEN.sub(lambda m: m.group(1) or " ", sql.strip())
+    return sql.rstrip("; ").strip()
+
+
+class ResultCache:
+    """
+    Cache of executed SELECT results, keyed on (database, normalized SQL).
+
+    Every entry carries the data tag of its database(s) — PRAGMA data_version
+    and file mtime, read *before* the statement ran — and is only served
+    while the tag is unchanged.
+
+    - memory tier: LRU bounded by ``max_bytes`` of (approximate) row payload
+    - disk tier (optional): results larger than ``max_entry_bytes`` are
+      spilled to a SQLite file bounded by ``max_disk_bytes``; without it
+      they are not cached
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entry_bytes: int = 4 * 1024 * 1024,
+        disk_path: Optional[str] = None,
+        max_disk_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.max_disk_bytes = max_disk_bytes
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[Any, tuple, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "stale": 0,
+            "stores": 0,
+            "spilled": 0,
+            "skipped": 0,
+            "evictions": 0,
+            "bytes_saved": 0,
+            "rows_saved": 0,
+        }
+
+        self._disk: Optional[sqlite3.Connection] = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache ("
+                " key TEXT PRIMARY KEY, tag BLOB NOT NULL, payload BLOB NOT NULL,"
+                " nbytes INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._disk.commit()
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        return cls(
+            max_bytes=int(os.getenv("RESULT_CACHE_BYTES", str(64 * 1024 * 1024))),
+            max_entry_bytes=int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024))),
+            disk_path=os.getenv("RESULT_CACHE_PATH") or None,
+            max_disk_bytes=int(os.getenv("RESULT_CACHE_DISK_BYTES", str(1024 * 1024 * 1024))),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or self._disk is not None
+
+    # ------------------------------------------------------------------
+    # KEYS
+    # ------------------------------------------------------------------
+    @staticmethod
+    def make_key(db_name: str, sql: str) -> str:
+        raw = "\x1f".join([db_name, normalize_sql(sql)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # LOOKUP / STORE
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _pack(result: ResultSet) -> tuple:
+        return (result.columns, result.types, result.rows, result.sql, list(result.warnings), result.bytes_read)
+
+    @staticmethod
+    def _unpack(payload: tuple) -> ResultSet:
+        columns, types, rows, sql, warnings, bytes_read = payload
+        result = ResultSet.from_rows(columns, types, rows)
+        result.sql = sql
+        result.warnings = list(warnings)
+        result.bytes_read = bytes_read
+        return result
+
+    def _hit(self, payload: tuple, tier: str) -> ResultSet:
+        # caller holds the lock
+        self._stats["hits"] += 1
+        self._stats[f"{tier}_hits"] += 1
+        self._stats["bytes_saved"] += payload[5]
+        self._stats["rows_saved"] += len(payload[2])
+        return self._unpack(payload)
+
+    def get(self, key: str, tag: Any) -> Optional[ResultSet]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                entry_tag, payload, nbytes = entry
+                if entry_tag == tag:
+                    self._memory.move_to_end(key)
+                    return self._hit(payload, "memory")
+                del self._memory[key]
+                self._memory_bytes -= nbytes
+                self._stats["stale"] += 1
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT tag, payload FROM result_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if pickle.loads(row[0]) == tag:
+                        self._disk.execute(
+                            "UPDATE result_cache SET last_used = ? WHERE key = ?", (time.time(), key)
+                        )
+                        self._disk.commit()
+                        return self._hit(pickle.loads(row[1]), "disk")
+                    self._disk.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+                    self._disk.commit()
+                    self._stats["stale"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, tag: Any, result: ResultSet):
+        """Store a fully-buffered result; ``tag`` must be read before it executed."""
+        rows = result.rows
+        nbytes = batch_bytes(rows) + _ROW_OVERHEAD * len(rows)
+        payload = self._pack(result)
+        with self._lock:
+            if nbytes <= self.max_entry_bytes:
+                self._remember(key, tag, payload, nbytes)
+                self._stats["stores"] += 1
+            elif self._disk is not None and nbytes <= self.max_disk_bytes:
+                self._spill(key, tag, payload, nbytes)
+                self._stats["stores"] += 1
+                self._stats["spilled"] += 1
+            else:
+                self._stats["skipped"] += 1
+
+    def _remember(self, key: str, tag: Any, payload: tuple, nbytes: int):
+        # caller holds the lock
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old[2]
+        self._memory[key] = (tag, payload, nbytes)
+        self._memory_bytes += nbytes
+        while self._memory_bytes > self.max_bytes and self._memory:
+            _, (_, _, size) = self._memory.popitem(last=False)
+            self._memory_bytes -= size
+            self._stats["evictions"] += 1
+
+    def _spill(self, key: str, tag: Any, payload: tuple, nbytes: int):
+        # caller holds the lock
+        self._disk.execute(
+            "INSERT OR REPLACE INTO result_cache (key, tag, payload, nbytes, last_used)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, pickle.dumps(tag), pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL), nbytes, time.time()),
+        )
+        # oldest entries go first once the running total passes the budget
+        evicted = self._disk.execute(
+            "DELETE FROM result_cache WHERE key IN ("
+            " SELECT key FROM (SELECT key, SUM(nbytes) OVER (ORDER BY last_used DESC) AS total"
+            " FROM result_cache) WHERE total > ?)",
+            (self.max_disk_bytes,),
+        ).rowcount
+        self._stats["evictions"] += max(evicted, 0)
+        self._disk.commit()
+
+    # ------------------------------------------------------------------
+    # MAINTENANCE
+    # ------------------------------------------------------------------
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM result_cache")
+                self._disk.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+            if self._disk is not None:
+                count, size = self._disk.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM result_cache"
+                ).fetchone()
+                stats["disk_entries"] = count
+                stats["disk_bytes"] = size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
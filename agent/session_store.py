@@ -0,0 +1,130 @@
+# agent/session_store.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from utils.tracing import count_tokens
+
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "3600"))
+# history sent with a follow-up is trimmed (oldest turns first) to this many tokens
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "1000"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "20"))
+
+
+class Turn:
+    __slots__ = ("question", "sql", "database", "answer")
+
+    def __init__(self, question: str, sql: str = None, database: str = None, answer: str = None):
+        self.question = question
+        self.sql = sql
+        self.database = database
+        self.answer = answer
+
+    def render(self) -> str:
+        lines = [f"Q: {self.question}"]
+        if self.sql:
+            lines.append(f"SQL ({self.database}): {' '.join(self.sql.split())}")
+        elif self.answer:
+            lines.append(f"A: {self.answer[:300]}")
+        return "\n".join(lines)
+
+
+class _Session:
+    __slots__ = ("turns", "last_used")
+
+    def __init__(self):
+        self.turns: List[Turn] = []
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    """
+    Per-session conversation history for follow-up questions.
+
+    Sessions are kept in LRU order: at most ``max_sessions``, and one idle
+    for ``idle_seconds`` is dropped. Each keeps its last ``max_turns``
+    turns; history() returns the most recent ones that fit ``max_tokens``.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX,
+        idle_seconds: float = SESSION_IDLE_SECONDS,
+        max_tokens: int = SESSION_HISTORY_TOKENS,
+        max_turns: int = SESSION_MAX_TURNS,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._stats = {"turns": 0, "followups": 0, "evicted_idle": 0, "evicted_lru": 0, "trimmed_turns": 0}
+
+    def _expire(self, now: float):
+        # caller holds the lock; oldest first, so stop at the first live one
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            self._stats["evicted_idle"] += 1
+
+    def history(self, session_id: Optional[str], model: Optional[str] = None) -> List[Turn]:
+        """Most recent turns (oldest first) within the token cap; [] without a session."""
+        if not session_id:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            turns = list(session.turns)
+
+        kept, budget = [], self.max_tokens
+        for turn in reversed(turns):
+            cost = count_tokens(turn.render(), model)
+            if cost > budget:
+                break
+            kept.append(turn)
+            budget -= cost
+        with self._lock:
+            self._stats["trimmed_turns"] += len(turns) - len(kept)
+            if kept:
+                self._stats["followups"] += 1
+        return kept[::-1]
+
+    def append(self, session_id: Optional[str], turn: Turn):
+        if not session_id:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self._stats["evicted_lru"] += 1
+            session.turns.append(turn)
+            del session.turns[:-self.max_turns]
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            self._stats["turns"] += 1
+
+    def clear(self, session_id: Optional[str] = None):
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "sessions": len(self._sessions)}
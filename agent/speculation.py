@@ -0,0 +1,71 @@
+# agent/speculation.py
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from rag.router_index import ROUTER_MIN_MARGIN, RouteResult
+
+# candidates generated side by side when routing is ambiguous (1 = never)
+ROUTER_SPECULATE_TOP_N = int(os.getenv("ROUTER_SPECULATE_TOP_N", "2"))
+# extra (speculative) SQL generations allowed per minute, process-wide
+ROUTER_SPECULATE_BUDGET = float(os.getenv("ROUTER_SPECULATE_BUDGET", "30"))
+
+
+def speculation_candidates(
+    route: RouteResult,
+    top_n: int = ROUTER_SPECULATE_TOP_N,
+    margin: float = ROUTER_MIN_MARGIN,
+) -> List[Tuple[str, float]]:
+    """Candidates within ``margin`` of the best score (at most top_n); one means no speculation."""
+    if not route.ranked:
+        return []
+    best = route.ranked[0][1]
+    if best <= 0:
+        return route.ranked[:1]  # no signal at all: guessing wider would only burn LLM calls
+    return [(db, s) for db, s in route.ranked[:max(1, top_n)] if best - s < margin]
+
+
+class SpeculationBudget:
+    """
+    Token bucket bounding the extra LLM generations spent on speculative
+    routing, plus counters of which candidate rank ends up winning.
+    """
+
+    def __init__(self, per_minute: float = ROUTER_SPECULATE_BUDGET):
+        self.capacity = max(0.0, per_minute)
+        self.rate = self.capacity / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "speculations": 0,
+            "extra_generations": 0,
+            "budget_denied": 0,
+            "no_winner": 0,
+        }
+
+    def take(self, wanted: int) -> int:
+        """Extra generations granted now (0..wanted)."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            granted = min(wanted, int(self._tokens))
+            self._tokens -= granted
+            if granted:
+                self._stats["speculations"] += 1
+                self._stats["extra_generations"] += granted
+            elif wanted:
+                self._stats["budget_denied"] += 1
+            return granted
+
+    def record(self, rank: int):
+        """Rank (0 = router's favourite) of the candidate that won; -1 if none validated."""
+        key = f"wins_rank_{rank}" if rank >= 0 else "no_winner"
+        with self._lock:
+            self._stats[key] = self._stats.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
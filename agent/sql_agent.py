@@ -1,62 +1,232 @@
 # agent/sql_agent.py
+import asyncio
+import contextvars
 import os
 import re
-import sqlite3
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Callable, Generator, List, Sequence, Tuple
 
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_community.utilities import SQLDatabase
-from langchain.schema import HumanMessage
+
+from agent.catalog_qa import CATALOG_QA, CatalogQA
+from agent.cross_db import CrossDatabases, CrossDBError
+from agent.example_store import ExampleStore
+from agent.llm_dispatch import LLMDispatcher
+from agent.llm_limiter import LLMBusy, get_llm_limiter
+from agent.query_guard import (
+    ExecutionBudget, QueryBudgetExceeded, QueryGuard, apply_limit, get_policy,
+)
+from agent.result_cache import ResultCache
+from agent.session_store import SessionStore, Turn
+from agent.speculation import ROUTER_SPECULATE_TOP_N, SpeculationBudget, speculation_candidates
+from agent.sql_cache import SQLGenerationCache
+from agent.sql_executor import Cancellations, get_executor
+from agent.sql_preflight import SQLPreflight
+from loaders.connection_pool import SQLDatabases, SQLiteConnectionPool, get_pool
+from loaders.data_version import get_data_versions
+from loaders.result_set import ResultSet
+from loaders.schema_catalog import SchemaSnapshot, get_schema_catalog
+from loaders.schema_encoder import get_schema_encoder
+from rag.embeddings import get_embeddings
+from rag.router_index import RouteResult, get_router_index
+from rag.table_index import SCHEMA_FULL_THRESHOLD, get_table_index
+from utils import tracing
 
 load_dotenv()
 
 
-class MultiDBAgent:
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-            temperature=0
-        )
+# ----------------------------------------------------------------------
+# PIPELINE STEPS
+# The query pipeline is written once as a generator that yields the
+# blocking work it needs done; run_user_query drives it synchronously and
+# arun_user_query drives it on the event loop.
+# ----------------------------------------------------------------------
+class LLMCall:
+    def __init__(self, messages: Any, purpose: str, prefix: str = None):
+        self.messages = messages
+        self.purpose = purpose  # "generate" | "repair" | "chat"
+        self.prefix = prefix  # stable leading part of the prompt (prefix-cache accounting)
+
+
+class Blocking:
+    def __init__(self, fn: Callable, *args):
+        self.fn = fn
+        self.args = args
+
+
+class Race:
+    """Runs sub-pipelines concurrently; the value is (index of the first that won, results)."""
+
+    def __init__(self, steps: List["Steps"], won: Callable[[Any], bool]):
+        self.steps = steps
+        self.won = won
+
+
+Steps = Generator[Any, Any, Any]
+
+# keyword rules of the built-in sample databases, strongest signal first
+ROUTE_KEYWORDS = {
+    # 🎬 Movies / IMDb
+    "imdb.db": ["movie", "movies", "film", "director", "actor", "rating", "popularity"],
+    # 🎵 Music / Chinook
+    "chinook.db": ["artist", "album", "track", "song", "playlist", "genre"],
+    # 📦 Orders / Northwind
+    "northwind.db": ["order", "orders", "ship", "customer", "supplier", "employee"],
+    # 🏭 Sales / AdventureWorks
+    "adventureworks.db": ["product", "sales", "inventory", "price", "purchase"],
+}
+# score per keyword hit, on the same scale as the embedding router's cosine scores
+ROUTER_KEYWORD_WEIGHT = float(os.getenv("ROUTER_KEYWORD_WEIGHT", "0.1"))
+
+
+# langchain / langchain_openai are imported on first use, not at startup
+def _chat_model():
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+        temperature=0
+    )
 
-        self.databases: Dict[str, SQLDatabase] = {}
+
+def _messages(prefix: str, turn: str) -> list:
+    """
+    Stable part (rules, schema) as the system message, per-turn part last,
+    so consecutive prompts share a byte-identical prefix the provider can cache.
+    """
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    return [SystemMessage(content=prefix), HumanMessage(content=turn)]
+
+
+class MultiDBAgent:
+    def __init__(self, llm=None, db_dir: str = None):
+        # adaptive concurrency limit + priority queues, shared process-wide
+        self.llm_limiter = get_llm_limiter()
+        # identical in-flight prompts are coalesced, distinct ones micro-batched
+        # (each upstream call holds a limiter slot); the default chat model is
+        # built on the first LLM call
+        self.llm_dispatch = LLMDispatcher(llm, factory=_chat_model, limiter=self.llm_limiter)
+
+        self.db_dir = db_dir or os.path.join(os.getcwd(), "databases")
+        self.db_paths: Dict[str, str] = {}
         self._load_databases()
+        # SQLDatabase objects (table reflection) are built on first access
+        self.databases = SQLDatabases(self.db_paths)
+
+        # question→SQL cache; only SQL that executed successfully is stored
+        self.sql_cache = SQLGenerationCache.from_env()
+
+        # embedding backend for table-level schema retrieval (lazy)
+        self._embeddings = None
+
+        # local compile check + identifier auto-repair before the LLM repair
+        self.preflight = SQLPreflight()
+
+        # verified question→SQL pairs, retrieved as few-shot examples;
+        # recorded off the response path by one background worker
+        self.examples = ExampleStore.from_env()
+        self._example_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="examples")
+
+        # which tables / columns / how related — answered without the LLM
+        self.catalog_qa = CatalogQA()
+
+        # plan inspection + row / time budgets at the execute stage
+        self.guard = QueryGuard()
+
+        # executed results, valid while PRAGMA data_version / mtime are unchanged
+        self.result_cache = ResultCache.from_env()
+
+        # ambiguous routes: speculative generation on the top candidates, budgeted
+        self.speculation = SpeculationBudget()
+        self._race_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculate")
+
+        # per-session history for follow-up questions (FastAPI session_id)
+        self.sessions = SessionStore()
+
+        # cross mode: several databases ATTACHed to one read-only connection
+        self.cross = CrossDatabases()
+
+        # where SQL runs: inline, or a process pool (SQL_EXECUTOR=process)
+        self.executor = get_executor()
+        self.cancellations = Cancellations()
+
+    @property
+    def llm(self):
+        return self.llm_dispatch.llm
+
+    @llm.setter
+    def llm(self, value):
+        self.llm_dispatch.llm = value
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = get_embeddings()
+        return self._embeddings
 
     # ------------------------------------------------------------------
     # DATABASE LOADING
     # ------------------------------------------------------------------
     def _load_databases(self):
-        base = os.path.join(os.getcwd(), "databases")
-        for f in os.listdir(base):
+        base = self.db_dir
+        for f in sorted(os.listdir(base)):
             if f.endswith(".db"):
-                path = os.path.join(base, f)
-                uri = f"sqlite:///{path}"
-                self.databases[f] = SQLDatabase.from_uri(uri)
+                # read-only pooled connections shared process-wide, opened on first use
+                self.db_paths[f] = os.path.join(base, f)
 
     # ------------------------------------------------------------------
-    # SAFE SCHEMA EXTRACTION (NO SAMPLE ROWS)
+    # SAFE SCHEMA EXTRACTION (NO SAMPLE ROWS, CACHED PER SCHEMA VERSION)
     # ------------------------------------------------------------------
+    def _db_path(self, db_name: str) -> str:
+        return self.db_paths[db_name]
+
+    def _snapshot(self, db_name: str) -> SchemaSnapshot:
+        """Schema of one database, or the combined schema of a cross target."""
+        if self.cross.is_target(db_name):
+            return self.cross.snapshot(db_name)
+        return get_schema_catalog().get(self._db_path(db_name))
+
+    def _pool(self, db_name: str) -> SQLiteConnectionPool:
+        if self.cross.is_target(db_name):
+            return self.cross.pool(db_name)
+        return get_pool(self._db_path(db_name))
+
     def _get_db_schema(self, db_name: str) -> str:
-        db_path = self.databases[db_name]._engine.url.database
-        conn = sqlite3.connect(db_path)
-        cur = conn.cursor()
+        return self._snapshot(db_name).text
+
+    def _schema_fingerprint(self, db_name: str) -> str:
+        return self._snapshot(db_name).fingerprint
+
+    def _get_prompt_schema(self, db_name: str, question: str, sql: str = None) -> str:
+        """
+        Schema for a prompt: the full schema for small databases, otherwise
+        only the top-k tables relevant to the question (plus FK neighbours
+        and any table the SQL already references), encoded within the
+        model's schema token budget.
+        """
+        snapshot = self._snapshot(db_name)
+        encoder = get_schema_encoder()
+        keep = snapshot.referenced_tables(sql) if sql else []
+        if len(snapshot.tables) <= SCHEMA_FULL_THRESHOLD:
+            return encoder.encode(snapshot, None, question, self._model_name, keep=keep)
 
-        schema_text = []
-        tables = cur.execute(
-            "SELECT name FROM sqlite_master WHERE type='table';"
-        ).fetchall()
+        try:
+            tables = get_table_index(snapshot, self.embeddings).select_tables(question)
+        except Exception:
+            # retrieval is an optimisation, never a failure
+            return encoder.encode(snapshot, None, question, self._model_name, keep=keep)
 
-        for (table,) in tables:
-            schema_text.append(f"Table: {table}")
-            cols = cur.execute(f"PRAGMA table_info('{table}')").fetchall()
-            for _, name, col_type, *_ in cols:
-                schema_text.append(f"  - {name} ({col_type})")
+        tables += [t for t in keep if t not in tables]
+        return encoder.encode(snapshot, tables, question, self._model_name, keep=keep)
 
-        conn.close()
-        return "\n".join(schema_text)
+    def _all_snapshots(self) -> Dict[str, SchemaSnapshot]:
+        # per-database introspection fans out over the executor
+        snaps = self.executor.snapshots([self._db_path(db) for db in self.databases])
+        return {db: snaps[self._db_path(db)] for db in self.databases}
 
     def _get_all_schemas(self) -> Dict[str, str]:
-        return {db: self._get_db_schema(db) for db in self.databases}
+        return {db: snap.text for db, snap in self._all_snapshots().items()}
 
     # ------------------------------------------------------------------
     # INTENT ROUTING
@@ -71,32 +241,76 @@ class MultiDBAgent:
         ]
         return any(k in q for k in db_keywords)
 
-    def _route_db(self, query: str) -> str:
+    def _rank_db(self, query: str) -> RouteResult:
+        """
+        Databases ranked for a question, best first.
+
+        Keyword rules score first; the embedding router is only consulted
+        when they do not single out one database. An explicit mention of a
+        database name always wins.
+        """
         q = query.lower()
 
-        # 🎬 Movies / IMDb
-        if any(k in q for k in ["movie", "movies", "film", "director", "actor", "rating", "popularity"]):
-            return "imdb.db"
+        # ✅ Explicit DB mention still wins
+        mentioned = self._mentioned_db(q)
+        if mentioned is not None:
+            return RouteResult([(mentioned, 1.0)] + [(d, 0.0) for d in self.databases if d != mentioned])
 
-        # 🎵 Music / Chinook
-        if any(k in q for k in ["artist", "album", "track", "song", "playlist", "genre"]):
-            return "chinook.db"
+        scores = self._keyword_scores(q)
 
-        # 📦 Orders / Northwind
-        if any(k in q for k in ["order", "orders", "ship", "customer", "supplier", "employee"]):
-            return "northwind.db"
+        hit = [db for db, score in scores.items() if score > 0]
+        if len(hit) != 1 and len(scores) > 1:
+            try:
+                for db, score in get_router_index(self.embeddings).rank(query, self.db_paths).ranked:
+                    scores[db] += max(score, 0.0)
+            except Exception:
+                pass  # no embedding backend: keywords only
 
-        # 🏭 Sales / AdventureWorks
-        if any(k in q for k in ["product", "sales", "inventory", "price", "purchase"]):
-            return "adventureworks.db"
+        # ✅ Final fallback: the movie database, as before
+        fallback = "imdb.db" if "imdb.db" in scores else next(iter(scores), None)
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0] != fallback, kv[0]))
+        return RouteResult(ranked)
 
-        # ✅ Explicit DB mention still wins
+    def _mentioned_db(self, q: str):
         for db in self.databases:
             if db.replace(".db", "") in q:
                 return db
+        return None
 
-        # ✅ Final fallback
-        return "imdb.db"
+    def _keyword_scores(self, q: str) -> Dict[str, float]:
+        scores = {db: 0.0 for db in self.databases}
+        for db, keywords in ROUTE_KEYWORDS.items():
+            if db in scores:
+                scores[db] += ROUTER_KEYWORD_WEIGHT * sum(k in q for k in keywords)
+        return scores
+
+    def _keyword_ranking(self, query: str) -> List[Tuple[str, float]]:
+        """Databases a question names or keyword-matches, best first; CrossDBError if none."""
+        q = query.lower()
+        scores = self._keyword_scores(q)
+        for db in scores:
+            if db.replace(".db", "") in q:
+                scores[db] += 1.0
+        ranked = sorted(((db, s) for db, s in scores.items() if s > 0), key=lambda kv: (-kv[1], kv[0]))
+        if not ranked:
+            raise CrossDBError(
+                f"Cannot pick {self.cross.max_attached} of {len(scores)} databases without "
+                "an embedding backend: name them in explicit_db"
+            )
+        return ranked
+
+    def _route_db(self, query: str) -> str:
+        return self._rank_db(query).best
+
+    def _followup_db(self, query: str, previous: str) -> str:
+        """A follow-up stays on the previous turn's database unless it names or keyword-matches another."""
+        q = query.lower()
+        mentioned = self._mentioned_db(q)
+        if mentioned is not None:
+            return mentioned
+        scores = self._keyword_scores(q)
+        best = max(scores, key=scores.get, default=previous)
+        return best if scores[best] > scores.get(previous, 0.0) else previous
 
 
     # ------------------------------------------------------------------
@@ -110,35 +324,110 @@ class MultiDBAgent:
         banned = ["DROP", "DELETE", "UPDATE", "INSERT", "ALTER"]
         return not any(b in sql.upper() for b in banned)
 
-    def _generate_sql(self, query: str, db_name: str) -> str:
-        schema = self._get_db_schema(db_name)
+    def _cross_rules(self, db_name: str) -> str:
+        if not self.cross.is_target(db_name):
+            return ""
+        return (
+            "- Tables belong to ATTACHed databases: always schema-qualify them "
+            '(e.g. chinook.Artist, northwind."Order Details")\n'
+            "- Answer with ONE statement; do joins and aggregations in SQL\n"
+        )
 
-        prompt = f"""
-You are an expert SQLite SQL generator.
+    def _few_shot(self, query: str, db_name: str) -> list:
+        """Verified examples closest to the question (re-checked after a schema change)."""
+        if not self.examples.enabled or not self.examples.size(db_name):
+            return []  # nothing to retrieve: skip the query embedding
+        try:
+            vector = self.embeddings.embed_query(query)
+        except Exception:
+            return []  # no embedding backend: zero-shot, as before
+        return self.examples.search(
+            db_name, vector, self._schema_fingerprint(db_name),
+            compiles=lambda sql: self._compiles(db_name, sql),
+        )
 
-Database schema:
-{schema}
+    def _compiles(self, db_name: str, sql: str) -> bool:
+        # EXPLAIN never checks the schema cookie and sqlite3 reuses prepared
+        # statements by text: reload every attached schema, compile fresh text
+        fingerprint = self._schema_fingerprint(db_name)
+        with self._pool(db_name).connection() as conn:
+            for _, schema, _ in conn.execute("PRAGMA database_list").fetchall():
+                conn.execute(f'SELECT COUNT(*) FROM "{schema}".sqlite_master').fetchone()
+            return SQLPreflight.compile_error(conn, f"{sql}\n-- schema {fingerprint}") is None
+
+    def _remember_example(self, db_name: str, query: str, sql: str):
+        if not self.examples.enabled:
+            return
+        self._example_writer.submit(self._store_example, db_name, query, sql)
+
+    def _store_example(self, db_name: str, query: str, sql: str):
+        try:
+            vector = self.embeddings.embed_query(query)
+            self.examples.add(db_name, query, sql, self._schema_fingerprint(db_name), vector)
+        except Exception:
+            pass  # the store is an optimisation; the answer is already good
+
+    @staticmethod
+    def _history_block(history: Sequence[Turn]) -> str:
+        if not history:
+            return ""
+        turns = "\n".join(t.render() for t in history)
+        return f"Earlier in this conversation (resolve follow-ups against it):\n{turns}\n\n"
+
+    def _generation_prompt(
+        self, query: str, db_name: str, examples: list = (), history: Sequence[Turn] = ()
+    ) -> Tuple[str, str]:
+        """(stable prefix: rules + schema, per-turn part: examples, history, question)."""
+        # follow-ups retrieve tables for the whole conversation, not just "now only 2012"
+        retrieval = " ".join([t.question for t in history] + [query])
+        schema = self._get_prompt_schema(db_name, retrieval)
+        prefix = f"""You are an expert SQLite SQL generator.
 
 Rules:
 - Output ONLY valid SQLite SQL
 - No markdown
 - No explanations
 - Use correct table and column names only
-
-User question:
+{self._cross_rules(db_name)}
+Database schema:
+{schema}
+"""
+        shots = "".join(f"Q: {e.question}\nSQL: {e.sql}\n\n" for e in examples)
+        if shots:
+            shots = f"Verified examples for this database:\n{shots}"
+        turn = f"""{shots}{self._history_block(history)}User question:
 {query}
 """
-        resp = self.llm.invoke([HumanMessage(content=prompt)])
-        return self._clean_sql(resp.content)
+        return prefix, turn
+
+    def _generate_steps(self, query: str, db_name: str, history: Sequence[Turn] = ()) -> Steps:
+        with tracing.span("schema"):
+            examples = yield Blocking(self._few_shot, query, db_name)
+            tracing.annotate(examples=len(examples))
+            prefix, turn = yield Blocking(self._generation_prompt, query, db_name, examples, history)
+        with tracing.span("generate"):
+            content = yield LLMCall(_messages(prefix, turn), "generate", prefix=prefix)
+        return self._clean_sql(content)
+
+    def _generate_sql(self, query: str, db_name: str) -> str:
+        return self._drive(self._generate_steps(query, db_name))
 
     # ------------------------------------------------------------------
     # SELF-HEALING SQL (VERY SMALL + SAFE)
     # ------------------------------------------------------------------
-    def _repair_sql(self, sql: str, error: str, db_name: str) -> str:
-        schema = self._get_db_schema(db_name)
+    def _repair_prompt(self, sql: str, error: str, db_name: str, query: str = None) -> Tuple[str, str]:
+        """(stable prefix: rules + schema, per-turn part: failing SQL and error)."""
+        schema = self._get_prompt_schema(db_name, query or sql, sql=sql)
+        prefix = f"""You fix SQLite SQL that failed.
 
-        prompt = f"""
-The SQL below failed.
+Rules:
+- Output ONLY corrected SQL
+- No explanation
+{self._cross_rules(db_name)}
+Schema:
+{schema}
+"""
+        turn = f"""The SQL below failed.
 
 SQL:
 {sql}
@@ -146,63 +435,530 @@ SQL:
 Error:
 {error}
 
-Schema:
-{schema}
-
 Fix the SQL.
-Rules:
-- Output ONLY corrected SQL
-- No explanation
 """
-        resp = self.llm.invoke([HumanMessage(content=prompt)])
-        return self._clean_sql(resp.content)
+        return prefix, turn
+
+    def _repair_steps(self, sql: str, error: str, db_name: str, query: str = None) -> Steps:
+        with tracing.span("repair"):
+            prefix, turn = yield Blocking(self._repair_prompt, sql, error, db_name, query)
+            content = yield LLMCall(_messages(prefix, turn), "repair", prefix=prefix)
+        return self._clean_sql(content)
+
+    def _repair_sql(self, sql: str, error: str, db_name: str, query: str = None) -> str:
+        return self._drive(self._repair_steps(sql, error, db_name, query))
 
     # ------------------------------------------------------------------
-    # MAIN ENTRY
+    # PRE-FLIGHT + EXECUTION
     # ------------------------------------------------------------------
-    def run_user_query(self, query: str, explicit_db: str = None) -> Any:
+    def _preflight(self, db_name: str, sql: str) -> str:
+        """Compile-only check; returns locally fixed SQL or raises PreflightError."""
+        with tracing.span("validate"):
+            return self.preflight.check(self._pool(db_name), sql, self._snapshot(db_name))
+
+    def _run_sql(self, db_name: str, sql: str, stream: bool = False, timeout_s: float = None) -> ResultSet:
+        """
+        Execute once, under the database's QueryPolicy: LIMIT injection,
+        EXPLAIN QUERY PLAN full-scan check, then a progress-handler budget.
+
+        With stream=True the open ResultSet is returned and rows are read
+        lazily in batches; otherwise rows are buffered and the connection
+        goes straight back to the pool. Buffered results are served from
+        the result cache while the database's data version is unchanged.
+
+        timeout_s overrides the policy's wall-clock budget (0 = none), e.g.
+        for background jobs.
+        """
+        pool = self._pool(db_name)
+        snapshot = self._snapshot(db_name)
+        policy = get_policy(db_name)
+        trace = tracing.current_trace()
+        handle = self.cancellations.open(trace.request_id if trace else None)
+
+        def record(result: ResultSet):
+            # streamed results are counted when the client finishes reading
+            tracing.record_rows(db_name, result.rows_read, result.bytes_read, trace)
+            self.cancellations.close(handle)
+
+        with tracing.span("execute"):
+            try:
+                max_rows = policy.stream_max_rows if stream else policy.max_rows
+                capped = apply_limit(sql, max_rows)
+                # LIMIT was injected or lowered (apply_limit(sql, 0) only normalises)
+                limited = capped != apply_limit(sql, 0)
+                sql = capped
+                tag = self._data_tag(db_name)  # read before executing
+                cache_key = None
+                if not stream and self.result_cache.enabled:
+                    cache_key = self.result_cache.make_key(db_name, sql)
+                    cached = self.result_cache.get(cache_key, tag)
+                    if cached is not None:
+                        self.cancellations.close(handle)
+                        cached.data_tag = tag
+                        return cached
+
+                warnings = self.guard.inspect(pool, sql, snapshot, policy)
+                budget = ExecutionBudget(
+                    timeout_s=timeout_s if timeout_s is not None else (
+                        policy.stream_timeout_s if stream else policy.timeout_s
+                    ),
+                    max_vm_steps=policy.max_vm_steps,
+                    interval=policy.progress_interval,
+                    cancelled=handle.is_cancelled,
+                )
+
+                if stream:
+                    # the cursor lives in this process; batches are pulled by the caller
+                    result = ResultSet.execute(pool, sql, snapshot=snapshot, budget=budget, on_close=record)
+                else:
+                    result = self.executor.run(
+                        pool, self._exec_target(db_name), sql, snapshot, budget, handle, on_close=record
+                    )
+            except Exception:
+                self.cancellations.close(handle)
+                raise
+            if limited and not stream and len(result.rows) >= max_rows:
+                warnings.append(f"result truncated to {max_rows} rows (QUERY_MAX_ROWS)")
+            result.warnings = warnings
+            result.data_tag = tag
+            if cache_key is not None:
+                self.result_cache.put(cache_key, tag, result)
+            return result
+
+    def _data_tag(self, db_name: str) -> tuple:
+        """Data versions of the database(s) behind db_name (all members in cross mode)."""
+        if self.cross.is_target(db_name):
+            versions = get_data_versions()
+            return tuple(versions.tag(path) for path in self.cross.members(db_name).values())
+        # a resident pool answers with the version of the snapshot it serves
+        return (self._pool(db_name).data_tag(),)
+
+    def _exec_target(self, db_name: str):
+        """What an executor worker needs to open its own connection."""
+        if self.cross.is_target(db_name):
+            return dict(self.cross.members(db_name))
+        return self._db_path(db_name)
+
+    def cancel(self, request_id: str) -> int:
+        """Cancels the SQL a request is running (or starts next); returns statements interrupted."""
+        return self.cancellations.cancel(request_id)
+
+    def _result_payload(self, db_name: str, sql: str, result: ResultSet, stream: bool) -> Dict[str, Any]:
+        payload = {
+            "database": db_name,
+            "sql": result.sql or sql,
+            "columns": result.columns,
+            "types": result.types,
+            "rows": result if stream else result.rows,
+        }
+        if result.warnings:
+            payload["warnings"] = result.warnings
+        return payload
 
-        # ✅ CHAT MODE (AUTO)
-        if not self._is_db_query(query):
-            schemas = self._get_all_schemas()
-            schema_text = "\n\n".join(
-                f"Database: {db}\n{schema}"
-                for db, schema in schemas.items()
-            )
+    # ------------------------------------------------------------------
+    # PIPELINE DRIVERS
+    # ------------------------------------------------------------------
+    def _drive(self, steps: Steps) -> Any:
+        value, error = None, None
+        while True:
+            try:
+                step = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration as stop:
+                return stop.value
 
-            prompt = f"""
-You have access to the following database schemas.
+            value, error = None, None
+            try:
+                if isinstance(step, LLMCall):
+                    response = self.llm_dispatch.invoke(step.messages, step.purpose)
+                    value = response.content
+                    tracing.record_llm(
+                        step.purpose, step.messages, value, self._model_name, step.prefix, response
+                    )
+                elif isinstance(step, Race):
+                    value = self._race(step)
+                else:
+                    value = step.fn(*step.args)
+            except Exception as e:
+                error = e
+
+    def _race(self, race: Race):
+        # losers keep running in the background; their results are dropped
+        futures = [
+            self._race_pool.submit(contextvars.copy_context().run, self._drive, sub)
+            for sub in race.steps
+        ]
+        results: List[Any] = [None] * len(futures)
+        for future in as_completed(futures):
+            i = futures.index(future)
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                results[i] = e
+                continue
+            if race.won(results[i]):
+                return i, results
+        return None, results
+
+    async def _arace(self, race: Race):
+        tasks = [asyncio.ensure_future(self._adrive(sub, cancel_sql=False)) for sub in race.steps]
+        results: List[Any] = [None] * len(tasks)
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.index):
+                    i = tasks.index(task)
+                    try:
+                        results[i] = task.result()
+                    except Exception as e:
+                        results[i] = e
+                        continue
+                    if race.won(results[i]):
+                        return i, results
+            return None, results
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _adrive(self, steps: Steps, cancel_sql: bool = True) -> Any:
+        value, error = None, None
+        while True:
+            try:
+                step = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration as stop:
+                return stop.value
 
-{schema_text}
+            value, error = None, None
+            try:
+                if isinstance(step, LLMCall):
+                    response = await self.llm_dispatch.ainvoke(step.messages, step.purpose)
+                    value = response.content
+                    tracing.record_llm(
+                        step.purpose, step.messages, value, self._model_name, step.prefix, response
+                    )
+                elif isinstance(step, Race):
+                    value = await self._arace(step)
+                else:
+                    # SQLite work runs off the event loop
+                    value = await asyncio.to_thread(step.fn, *step.args)
+            except asyncio.CancelledError:
+                # client went away: the worker thread/process would keep running
+                trace = tracing.current_trace()
+                if trace is not None and cancel_sql:
+                    self.cancel(trace.request_id)
+                raise
+            except Exception as e:
+                error = e
 
-User question:
-{query}
+    # ------------------------------------------------------------------
+    # MAIN ENTRY
+    # ------------------------------------------------------------------
+    def run_user_query(
+        self, query: str, explicit_db: str = None, stream: bool = False, mode: str = "db",
+        session_id: str = None, *, timeout_s: float = None,
+    ) -> Any:
+        """
+        Returns chat text, an error string, or a dict with database, sql,
+        columns, types and rows. With stream=True, "rows" is the open
+        ResultSet, to be iterated (in batches) exactly once.
+
+        mode: "db" (auto-detects chat questions), "chat", or "cross" (the
+        relevant databases — or the comma-separated explicit_db list — are
+        ATTACHed and queried with one statement).
+
+        session_id: questions sharing one are a conversation; follow-ups
+        ("now only for 2012") see the earlier questions and their SQL.
+
+        timeout_s: wall-clock budget of the SQL instead of the database's
+        QueryPolicy (0 = none).
+
+        Raises LLMBusy when the LLM admission queue sheds the request.
+        """
+        with tracing.trace_request() as trace:
+            outcome = "exception"
+            try:
+                result = self._drive(self._query_steps(query, explicit_db, stream, mode, session_id, timeout_s))
+                outcome = self._outcome(result)
+                return result
+            except LLMBusy:
+                outcome = "busy"
+                raise
+            finally:
+                trace.finish(outcome)
+
+    async def arun_user_query(
+        self, query: str, explicit_db: str = None, stream: bool = False, mode: str = "db",
+        session_id: str = None, *, timeout_s: float = None,
+    ) -> Any:
+        """Async variant of run_user_query: ainvoke for LLM calls, SQLite in a worker thread."""
+        with tracing.trace_request() as trace:
+            outcome = "exception"
+            try:
+                result = await self._adrive(self._query_steps(query, explicit_db, stream, mode, session_id, timeout_s))
+                outcome = self._outcome(result)
+                return result
+            except LLMBusy:
+                outcome = "busy"
+                raise
+            finally:
+                trace.finish(outcome)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Counters of the agent's caches and helpers (exported on /metrics)."""
+        return {
+            "sql_cache": self.sql_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+            "llm_dispatch": self.llm_dispatch.stats(),
+            "llm_limiter": self.llm_limiter.stats(),
+            "preflight": self.preflight.stats(),
+            "catalog_qa": self.catalog_qa.stats(),
+            "examples": self.examples.stats(),
+            "schema_encoder": get_schema_encoder().stats(),
+            "cross": self.cross.stats(),
+            "speculation": self.speculation.stats(),
+            "sessions": self.sessions.stats(),
+            "executor": self.executor.stats(),
+        }
+
+    @staticmethod
+    def _shots() -> int:
+        # few-shot examples the request's generation prompt carried
+        trace = tracing.current_trace()
+        return (trace.examples or 0) if trace is not None else 0
+
+    @property
+    def _model_name(self):
+        return getattr(self.llm, "model_name", None)
+
+    @staticmethod
+    def _outcome(result: Any) -> str:
+        if isinstance(result, dict):
+            return "ok"
+        if isinstance(result, str) and result.startswith("⚠️"):
+            return "rejected"
+        if isinstance(result, str) and result.startswith("SQL failed"):
+            return "failed"
+        return "answered"
+
+    def _catalog_answer(self, query: str, history: Sequence[Turn] = ()):
+        """
+        (answer, None) when the catalog answers the question locally, else
+        (None, (prefix, turn)) — the chat prompt, carrying only the schema
+        fragment it matched.
+        """
+        snapshots = self._all_snapshots()
+        if not CATALOG_QA:
+            return None, self._chat_prompt(query, {db: s.text for db, s in snapshots.items()}, history)
+        found = self.catalog_qa.answer(query, snapshots)
+        if found.text is not None:
+            return found.text, None
+        return None, self._chat_prompt(query, self.catalog_qa.fragment(found.hits, snapshots), history)
+
+    def _chat_prompt(
+        self, query: str, schemas: Dict[str, str] = None, history: Sequence[Turn] = ()
+    ) -> Tuple[str, str]:
+        schemas = schemas if schemas is not None else self._get_all_schemas()
+        schema_text = "\n\n".join(
+            f"Database: {db}\n{schema}"
+            for db, schema in schemas.items()
+        )
 
+        prefix = f"""You have access to the following database schemas.
 If the answer is not in the schemas, say:
 "I don’t have that information."
-"""
-            return self.llm.invoke(prompt).content
 
-        # ✅ DATABASE MODE
-        db_name = explicit_db or self._route_db(query)
-        sql = self._generate_sql(query, db_name)
+{schema_text}
+"""
+        turn = f"""{self._history_block(history)}User question:
+{query}
+"""
+        return prefix, turn
+
+    def _cross_target(self, query: str, explicit_db: str = None) -> str:
+        """
+        Databases to ATTACH: the explicit comma-separated list, else all of
+        them when they fit under the attach limit, else the best-ranked by
+        schema similarity (by name and keywords without an embedding backend).
+        """
+        if explicit_db:
+            names = [n.strip() for n in explicit_db.split(",") if n.strip()]
+            unknown = [n for n in names if n not in self.db_paths]
+            if unknown:
+                raise CrossDBError(f"Unknown database(s): {', '.join(unknown)}")
+        elif len(self.db_paths) <= self.cross.max_attached:
+            names = list(self.db_paths)
+        else:
+            try:
+                ranked = get_router_index(self.embeddings).rank(query, self.db_paths).ranked
+            except Exception:
+                ranked = self._keyword_ranking(query)  # no embedding backend
+            names = [db for db, _ in ranked[:self.cross.max_attached]]
+        name = self.cross.target({n: self.db_paths[n] for n in names})
+        # warm member schemas in parallel before the combined snapshot is built
+        self.executor.snapshots(list(self.cross.members(name).values()))
+        return name
+
+    def _candidate_steps(self, query: str, db_name: str) -> Steps:
+        """One routing candidate: generate, then dry-run (compile) on its schema → (db, sql, error)."""
+        fingerprint = self._schema_fingerprint(db_name)
+        sql = self.sql_cache.get(self.sql_cache.make_key("generate", query, db_name, fingerprint))
+        if sql is None:
+            sql = yield from self._generate_steps(query, db_name)
+        if not self._is_safe_sql(sql):
+            return db_name, sql, "unsafe SQL"
+        try:
+            sql = yield Blocking(self._preflight, db_name, sql)
+        except Exception as e:
+            return db_name, sql, e
+        return db_name, sql, None
+
+    def _speculate_steps(self, query: str, route: RouteResult) -> Steps:
+        """
+        (database, validated SQL or None). With several close candidates —
+        and budget left — the first candidate whose SQL validates wins;
+        otherwise the router's favourite is used as is.
+        """
+        candidates = speculation_candidates(route)
+        extra = self.speculation.take(len(candidates) - 1) if len(candidates) > 1 else 0
+        candidates = candidates[:1 + extra]
+        if len(candidates) < 2:
+            tracing.record_route(route.ranked[:ROUTER_SPECULATE_TOP_N], route.best, False)
+            return route.best, None
+
+        with tracing.span("speculate"):
+            winner, results = yield Race(
+                [self._candidate_steps(query, db) for db, _ in candidates],
+                won=lambda r: isinstance(r, tuple) and r[2] is None,
+            )
+        self.speculation.record(winner if winner is not None else -1)
+        if winner is None:
+            tracing.record_route(candidates, None, True)
+            # keep the favourite's SQL: it goes through the normal repair path
+            first = results[0]
+            return candidates[0][0], first[1] if isinstance(first, tuple) else None
+        db_name, sql, _ = results[winner]
+        tracing.record_route(candidates, db_name, True)
+        return db_name, sql
+
+    def _query_steps(
+        self, query: str, explicit_db: str = None, stream: bool = False, mode: str = "db",
+        session_id: str = None, timeout_s: float = None,
+    ) -> Steps:
+        """_answer_steps with the session's history in, and this turn recorded after."""
+        history = self.sessions.history(session_id, self._model_name) if session_id else []
+        result = yield from self._answer_steps(query, explicit_db, stream, mode, history, timeout_s)
+        outcome = self._outcome(result)
+        if outcome == "ok":
+            self.sessions.append(session_id, Turn(query, sql=result["sql"], database=result["database"]))
+        elif outcome == "answered":
+            self.sessions.append(session_id, Turn(query, answer=result))
+        return result
+
+    def _answer_steps(
+        self, query: str, explicit_db: str = None, stream: bool = False, mode: str = "db",
+        history: Sequence[Turn] = (), timeout_s: float = None,
+    ) -> Steps:
+        # a follow-up to a SQL answer ("now only for 2012") stays in DB mode
+        previous = history[-1] if history else None
+        followup = previous is not None and previous.sql is not None
+
+        # ✅ CHAT MODE (EXPLICIT OR AUTO)
+        if mode == "chat" or (mode != "cross" and not followup and not self._is_db_query(query)):
+            tracing.annotate(mode="chat")
+            with tracing.span("schema"):
+                # metadata questions are answered from the catalog, no LLM call
+                answer, prompt = yield Blocking(self._catalog_answer, query, history)
+            if answer is not None:
+                return answer
+            prefix, turn = prompt
+            with tracing.span("chat"):
+                return (yield LLMCall(_messages(prefix, turn), "chat", prefix=prefix))
+
+        # ✅ DATABASE MODE (one database, or several ATTACHed in cross mode)
+        with tracing.span("route"):
+            if mode == "cross":
+                tracing.annotate(mode="cross")
+                try:
+                    db_name = yield Blocking(self._cross_target, query, explicit_db)
+                except CrossDBError as e:
+                    return f"⚠️ {e}"
+            elif explicit_db:
+                db_name = explicit_db
+            elif followup and previous.database in self.db_paths:
+                db_name = self._followup_db(query, previous.database)
+            else:
+                route = yield Blocking(self._rank_db, query)
+                db_name = route.best
+
+        # ✅ ambiguous route: generate + dry-run on the close candidates at once
+        speculated = None
+        if mode != "cross" and not explicit_db and not followup:
+            db_name, speculated = yield from self._speculate_steps(query, route)
+
+        tracing.annotate(database=db_name)
+        with tracing.span("schema"):
+            fingerprint = self._schema_fingerprint(db_name)
+
+        # a question read against its history is not reusable on its own:
+        # neither cached nor kept as a few-shot example
+        cacheable = not history
+        gen_key = self.sql_cache.make_key("generate", query, db_name, fingerprint)
+        sql = speculated or (self.sql_cache.get(gen_key) if cacheable else None)
+        from_cache = sql is not None and speculated is None
+        if sql is None:
+            sql = yield from self._generate_steps(query, db_name, history)
 
         if not self._is_safe_sql(sql):
             return "⚠️ Unsafe SQL after generation."
 
         try:
-            rows = self.databases[db_name].run(sql)
-            return {"database": db_name, "sql": sql, "rows": rows}
+            sql = yield Blocking(self._preflight, db_name, sql)
+            result = yield Blocking(self._run_sql, db_name, sql, stream, timeout_s)
+            self.preflight.executed(sql)
+            if not from_cache:
+                self.examples.record_outcome("first_attempt", self._shots())
+                if cacheable:
+                    self.sql_cache.put(gen_key, sql)
+                    self._remember_example(db_name, query, sql)
+            return self._result_payload(db_name, sql, result, stream)
+
+        except QueryBudgetExceeded as e:
+            # a runaway statement is not retried; the repair would likely be as slow
+            return f"⚠️ {e}"
 
         except Exception as e:
+            if from_cache:
+                self.sql_cache.discard(gen_key)
+
             # ✅ self-healing (one retry only)
             try:
-                fixed_sql = self._repair_sql(sql, str(e), db_name)
+                repair_key = self.sql_cache.make_key(
+                    "repair", f"{sql}\n{e}", db_name, fingerprint
+                )
+                fixed_sql = self.sql_cache.get(repair_key)
+                if fixed_sql is None:
+                    fixed_sql = yield from self._repair_steps(sql, str(e), db_name, query)
                 if not self._is_safe_sql(fixed_sql):
                     return "⚠️ Unsafe SQL after repair."
 
-                rows = self.databases[db_name].run(fixed_sql)
-                return {"database": db_name, "sql": fixed_sql, "rows": rows}
+                fixed_sql = yield Blocking(self._preflight, db_name, fixed_sql)
+                result = yield Blocking(self._run_sql, db_name, fixed_sql, stream, timeout_s)
+                self.preflight.executed(fixed_sql, repaired=True)
+                self.sql_cache.put(repair_key, fixed_sql)
+                if not from_cache:
+                    self.examples.record_outcome("repaired", self._shots())
+                if cacheable:
+                    self.sql_cache.put(gen_key, fixed_sql)
+                    self._remember_example(db_name, query, fixed_sql)
+                return self._result_payload(db_name, fixed_sql, result, stream)
+
+            except QueryBudgetExceeded as e2:
+                return f"⚠️ {e2}"
+
+            except LLMBusy:
+                raise  # shed, not failed: the caller answers "busy"
 
             except Exception as e2:
+                if not from_cache:
+                    self.examples.record_outcome("failed", self._shots())
                 return f"SQL failed after self-healing: {e2}"
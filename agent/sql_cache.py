@@ -0,0 +1,178 @@
+# agent/sql_cache.py
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+def normalize_question(text: str) -> str:
+    """Case/whitespace/trailing-punctuation insensitive form of a question."""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip("?.!; ")
+
+
+class SQLGenerationCache:
+    """
+    Two-tier cache of LLM-generated SQL.
+
+    - memory tier: LRU bounded by ``max_entries``
+    - disk tier (optional): SQLite file that survives restarts, bounded by
+      ``max_disk_entries``
+
+    Entries expire after ``ttl_seconds``. Keys include the schema fingerprint,
+    so a schema change never serves stale SQL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 24 * 3600,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 50_000,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+
+        self._disk: Optional[sqlite3.Connection] = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS sql_cache ("
+                " key TEXT PRIMARY KEY, sql TEXT NOT NULL,"
+                " created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._disk.commit()
+
+    @classmethod
+    def from_env(cls) -> "SQLGenerationCache":
+        return cls(
+            max_entries=int(os.getenv("SQL_CACHE_SIZE", "1024")),
+            ttl_seconds=float(os.getenv("SQL_CACHE_TTL", str(24 * 3600))),
+            disk_path=os.getenv("SQL_CACHE_PATH") or None,
+        )
+
+    # ------------------------------------------------------------------
+    # KEYS
+    # ------------------------------------------------------------------
+    @staticmethod
+    def make_key(kind: str, text: str, db_name: str, fingerprint: str) -> str:
+        raw = "\x1f".join([kind, normalize_question(text), db_name, fingerprint])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------
+    # LOOKUP / STORE
+    # ------------------------------------------------------------------
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                sql, created = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return sql
+                del self._memory[key]
+                self._stats["expired"] += 1
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT sql, created FROM sql_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    sql, created = row
+                    if not self._expired(created, now):
+                        self._disk.execute(
+                            "UPDATE sql_cache SET last_used = ? WHERE key = ?", (now, key)
+                        )
+                        self._disk.commit()
+                        self._remember(key, sql, created)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        return sql
+                    self._disk.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+                    self._disk.commit()
+                    self._stats["expired"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, sql: str):
+        """Store SQL. Callers must only pass SQL that executed successfully."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, sql, now)
+            self._stats["stores"] += 1
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO sql_cache (key, sql, created, last_used)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, sql, now, now),
+                )
+                self._disk.execute(
+                    "DELETE FROM sql_cache WHERE key IN ("
+                    " SELECT key FROM sql_cache ORDER BY last_used DESC"
+                    " LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+                self._disk.commit()
+
+    def discard(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+                self._disk.commit()
+
+    def _remember(self, key: str, sql: str, created: float):
+        # caller holds the lock
+        self._memory[key] = (sql, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    # ------------------------------------------------------------------
+    # MAINTENANCE
+    # ------------------------------------------------------------------
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM sql_cache")
+                self._disk.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            if self._disk is not None:
+                stats["disk_entries"] = self._disk.execute(
+                    "SELECT COUNT(*) FROM sql_cache"
+                ).fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
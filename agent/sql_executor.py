@@ -0,0 +1,323 @@
+# agent/sql_executor.py
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from agent.query_guard import ExecutionBudget, QueryCancelled
+from loaders.connection_pool import AttachedConnectionPool, SQLiteConnectionPool, get_pool
+from loaders.result_set import DEFAULT_BATCH_SIZE, ResultSet, batch_bytes, declared_types
+from loaders.schema_catalog import SchemaSnapshot, get_schema_catalog
+
+SQL_EXECUTOR = os.getenv("SQL_EXECUTOR", "inline")  # "inline" | "process"
+SQL_EXECUTOR_WORKERS = int(os.getenv("SQL_EXECUTOR_WORKERS", str(min(4, os.cpu_count() or 1))))
+SQL_EXECUTOR_START_METHOD = os.getenv("SQL_EXECUTOR_START_METHOD", "spawn")
+
+# cancel-flag slots shared with the workers = max statements in flight
+MAX_INFLIGHT = 256
+
+# a single database path, or {alias: path} for an ATTACHed combination
+Target = Union[str, Dict[str, str]]
+
+
+# ----------------------------------------------------------------------
+# CANCELLATION
+# ----------------------------------------------------------------------
+class CancelHandle:
+    """Cancellation flag of one running statement; hooks fire on cancel()."""
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id
+        self._event = threading.Event()
+        self._hooks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def add_hook(self, hook: Callable[[], None]):
+        with self._lock:
+            self._hooks.append(hook)
+            fire = self._event.is_set()
+        if fire:
+            hook()
+
+    def remove_hook(self, hook: Callable[[], None]):
+        with self._lock:
+            if hook in self._hooks:
+                self._hooks.remove(hook)
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            hooks = list(self._hooks)
+        for hook in hooks:
+            hook()
+
+
+class Cancellations:
+    """
+    request ID -> statements currently running for it. cancel() also
+    remembers the ID for a while, so a statement the request starts
+    afterwards (e.g. the repair retry) is cancelled immediately.
+    """
+
+    def __init__(self, remember: int = 1024):
+        self._lock = threading.Lock()
+        self._running: Dict[str, List[CancelHandle]] = {}
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._remember = remember
+
+    def open(self, request_id: Optional[str]) -> CancelHandle:
+        handle = CancelHandle(request_id)
+        if request_id is None:
+            return handle
+        with self._lock:
+            self._running.setdefault(request_id, []).append(handle)
+            cancelled = request_id in self._recent
+        if cancelled:
+            handle.cancel()
+        return handle
+
+    def close(self, handle: CancelHandle):
+        if handle.request_id is None:
+            return
+        with self._lock:
+            handles = self._running.get(handle.request_id, [])
+            if handle in handles:
+                handles.remove(handle)
+            if not handles:
+                self._running.pop(handle.request_id, None)
+
+    def cancel(self, request_id: str) -> int:
+        """Cancels the request's running statements; returns how many."""
+        with self._lock:
+            handles = list(self._running.get(request_id, []))
+            self._recent[request_id] = None
+            self._recent.move_to_end(request_id)
+            while len(self._recent) > self._remember:
+                self._recent.popitem(last=False)
+        for handle in handles:
+            handle.cancel()
+        return len(handles)
+
+
+# ----------------------------------------------------------------------
+# INLINE BACKEND
+# ----------------------------------------------------------------------
+class InlineExecutor:
+    """Runs statements on the calling thread; per-database fan-out uses threads."""
+
+    name = "inline"
+
+    def __init__(self, fanout_workers: int = 8):
+        self._fanout = ThreadPoolExecutor(max_workers=fanout_workers, thread_name_prefix="db-fanout")
+
+    def run(
+        self,
+        pool: SQLiteConnectionPool,
+        target: Target,
+        sql: str,
+        snapshot: Optional[SchemaSnapshot],
+        budget: ExecutionBudget,
+        handle: CancelHandle,
+        on_close=None,
+    ) -> ResultSet:
+        result = ResultSet.execute(pool, sql, snapshot=snapshot, budget=budget, on_close=on_close)
+        return result.materialize()
+
+    def snapshots(self, paths: List[str]) -> Dict[str, SchemaSnapshot]:
+        """Schema snapshots of many databases, introspected in parallel."""
+        catalog = get_schema_catalog()
+        return dict(zip(paths, self._fanout.map(catalog.get, paths)))
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+    def shutdown(self):
+        self._fanout.shutdown(wait=False)
+
+
+# ----------------------------------------------------------------------
+# PROCESS BACKEND (worker side)
+# ----------------------------------------------------------------------
+_worker_flags = None
+_worker_attached: "OrderedDict[tuple, AttachedConnectionPool]" = OrderedDict()
+
+
+def _init_worker(flags):
+    global _worker_flags
+    _worker_flags = flags
+
+
+def _worker_pool(target: Target) -> SQLiteConnectionPool:
+    """Long-lived read-only connections, owned by this worker process."""
+    if isinstance(target, str):
+        return get_pool(target)
+    key = tuple(sorted(target.items()))
+    pool = _worker_attached.get(key)
+    if pool is None:
+        pool = _worker_attached[key] = AttachedConnectionPool(target, max_size=1)
+        while len(_worker_attached) > 4:
+            _worker_attached.popitem(last=False)[1].close()
+    _worker_attached.move_to_end(key)
+    return pool
+
+
+def _run_job(
+    target: Target,
+    sql: str,
+    timeout_s: float,
+    max_vm_steps: int,
+    interval: int,
+    slot: int,
+    batch_size: int,
+) -> Tuple[List[str], List[List[tuple]]]:
+    budget = ExecutionBudget(
+        timeout_s=timeout_s,
+        max_vm_steps=max_vm_steps,
+        interval=interval,
+        cancelled=lambda: _worker_flags[slot] != 0,
+    )
+    with ResultSet.execute(_worker_pool(target), sql, budget=budget, batch_size=batch_size) as result:
+        return result.columns, list(result.batches())
+
+
+def _snapshot_job(path: str) -> SchemaSnapshot:
+    return get_schema_catalog().get(path)
+
+
+# ----------------------------------------------------------------------
+# PROCESS BACKEND (server side)
+# ----------------------------------------------------------------------
+class ProcessExecutor:
+    """
+    Ships validated SQL to a pool of worker processes so long aggregates do
+    not hold the serving process's GIL. Rows come back as fetchmany batches;
+    cancellation flips a flag in shared memory that the worker's progress
+    handler polls.
+    """
+
+    name = "process"
+
+    def __init__(
+        self,
+        workers: int = SQL_EXECUTOR_WORKERS,
+        start_method: str = SQL_EXECUTOR_START_METHOD,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        ctx = multiprocessing.get_context(start_method)
+        self.workers = workers
+        self.batch_size = batch_size
+        self._flags = ctx.RawArray("b", MAX_INFLIGHT)
+        self._free = list(range(MAX_INFLIGHT))
+        self._slots = threading.Condition()
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self._flags,),
+        )
+        self._stats = {"submitted": 0, "cancelled": 0, "rows": 0}
+
+    def _acquire_slot(self) -> int:
+        with self._slots:
+            while not self._free:
+                self._slots.wait()
+            slot = self._free.pop()
+        self._flags[slot] = 0
+        return slot
+
+    def _release_slot(self, slot: int):
+        with self._slots:
+            self._free.append(slot)
+            self._slots.notify()
+
+    def run(
+        self,
+        pool: SQLiteConnectionPool,
+        target: Target,
+        sql: str,
+        snapshot: Optional[SchemaSnapshot],
+        budget: ExecutionBudget,
+        handle: CancelHandle,
+        on_close=None,
+    ) -> ResultSet:
+        slot = self._acquire_slot()
+        cancel = None
+        try:
+            future = self._pool.submit(
+                _run_job, target, sql, budget.timeout_s, budget.max_vm_steps,
+                budget.interval, slot, self.batch_size,
+            )
+
+            def cancel():
+                self._flags[slot] = 1
+                future.cancel()  # still queued: never starts
+                with self._slots:
+                    self._stats["cancelled"] += 1
+
+            handle.add_hook(cancel)
+            with self._slots:
+                self._stats["submitted"] += 1
+            try:
+                columns, batches = future.result()
+            except CancelledError:
+                # cancelled while still queued: no worker ever ran it
+                raise QueryCancelled("Query cancelled") from None
+        finally:
+            if cancel is not None:
+                handle.remove_hook(cancel)  # the slot is reused after this
+            self._flags[slot] = 0
+            self._release_slot(slot)
+
+        rows = [row for batch in batches for row in batch]
+        result = ResultSet.from_rows(columns, declared_types(columns, rows, snapshot), rows)
+        result.sql = sql
+        result.bytes_read = sum(batch_bytes(batch) for batch in batches)
+        with self._slots:
+            self._stats["rows"] += len(rows)
+        if on_close is not None:
+            on_close(result)
+        return result
+
+    def snapshots(self, paths: List[str]) -> Dict[str, SchemaSnapshot]:
+        """Introspects in the workers and adopts the snapshots into the local catalog."""
+        catalog = get_schema_catalog()
+        snaps = dict(zip(paths, self._pool.map(_snapshot_job, paths)))
+        for snap in snaps.values():
+            catalog.adopt(snap)
+        return {path: catalog.get(path) for path in paths}
+
+    def stats(self) -> Dict[str, int]:
+        with self._slots:
+            stats = dict(self._stats)
+            stats["in_flight"] = MAX_INFLIGHT - len(self._free)
+        stats["workers"] = self.workers
+        return stats
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ----------------------------------------------------------------------
+# PROCESS-WIDE BACKEND
+# ----------------------------------------------------------------------
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(kind: Optional[str] = None):
+    """Shared executor; SQL_EXECUTOR picks the backend unless ``kind`` is given."""
+    global _executor
+    kind = kind or SQL_EXECUTOR
+    if kind not in ("inline", "process"):
+        raise ValueError(f"SQL_EXECUTOR must be 'inline' or 'process', got {kind!r}")
+    with _executor_lock:
+        if _executor is None or _executor.name != kind:
+            if _executor is not None:
+                _executor.shutdown()
+            _executor = ProcessExecutor() if kind == "process" else InlineExecutor()
+        return _executor
@@ -0,0 +1,216 @@
+# agent/sql_preflight.py
+import difflib
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from loaders.connection_pool import SQLiteConnectionPool
+from loaders.schema_catalog import SchemaSnapshot, quote_ident
+
+
+class PreflightError(Exception):
+    """SQL does not compile and no local fix was found."""
+
+
+# words that break an unquoted table name (e.g. northwind's "Order Details")
+_KEYWORDS = {
+    "order", "group", "select", "from", "where", "table", "index", "key",
+    "values", "limit", "join", "union", "check", "default", "references",
+}
+
+_STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_NO_SUCH_TABLE = re.compile(r"no such table: (?:main\.)?(.+)$")
+_NO_SUCH_COLUMN = re.compile(r"no such column: (.+)$")
+_SYNTAX_NEAR = re.compile(r'near "(.+?)": syntax error')
+
+
+def _needs_quotes(name: str) -> bool:
+    return not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", name) or name.lower() in _KEYWORDS
+
+
+def _ident(name: str) -> str:
+    return quote_ident(name) if _needs_quotes(name) else name
+
+
+def _table_sql(name: str, snapshot: SchemaSnapshot) -> str:
+    schema, table = snapshot.split(name)
+    return f"{schema}.{_ident(table)}" if schema else _ident(name)
+
+
+def _squash(name: str) -> str:
+    return re.sub(r"[^0-9a-z]", "", name.lower())
+
+
+def _best_match(wrong: str, candidates: Iterable[str]) -> Optional[str]:
+    """Case-insensitive, then separator-insensitive, then edit-distance match."""
+    candidates = list(dict.fromkeys(candidates))
+    for c in candidates:
+        if c.lower() == wrong.lower():
+            return c
+    squashed = [c for c in candidates if _squash(c) == _squash(wrong)]
+    if len(squashed) == 1:
+        return squashed[0]
+    close = difflib.get_close_matches(wrong, candidates, n=2, cutoff=0.8)
+    if not close:
+        lowered = {c.lower(): c for c in candidates}
+        close = [lowered[c] for c in difflib.get_close_matches(wrong.lower(), list(lowered), n=2, cutoff=0.8)]
+    return close[0] if close else None
+
+
+def _replace_outside_strings(sql: str, pattern: str, repl: str) -> str:
+    parts = _STRING_LITERAL.split(sql)
+    for i in range(0, len(parts), 2):  # even indexes are outside literals
+        parts[i] = re.sub(pattern, lambda _: repl, parts[i])
+    return "".join(parts)
+
+
+def _replace_identifier(sql: str, old: str, new: str) -> str:
+    quoted = rf'"{re.escape(old)}"|\[{re.escape(old)}\]|`{re.escape(old)}`'
+    bare = rf'(?<![\w"\[`.]){re.escape(old)}(?![\w"\]`])'
+    return _replace_outside_strings(sql, f"{quoted}|{bare}", new)
+
+
+class SQLPreflight:
+    """
+    Compiles SQL with EXPLAIN (prepare only, no data is read) and fixes
+    unknown-identifier errors locally from the schema catalog before any
+    LLM repair is attempted.
+    """
+
+    def __init__(self, max_fixes: int = 3, max_pending: int = 1024):
+        self.max_fixes = max_fixes
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._stats = {
+            "checked": 0, "clean": 0, "fixed_locally": 0, "unfixable": 0,
+            "fixes_executed": 0, "repair_fixes_executed": 0,
+        }
+        # locally fixed SQL that compiled but has not been seen to run yet
+        self._pending: "OrderedDict[str, None]" = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # COMPILE
+    # ------------------------------------------------------------------
+    @staticmethod
+    def compile_error(conn: sqlite3.Connection, sql: str) -> Optional[str]:
+        try:
+            conn.execute(f"EXPLAIN {sql}").close()
+        except sqlite3.Error as e:
+            return str(e)
+        return None
+
+    # ------------------------------------------------------------------
+    # LOCAL FIXES
+    # ------------------------------------------------------------------
+    def _fix_table(self, sql: str, wrong: str, snapshot: SchemaSnapshot) -> Optional[str]:
+        match = _best_match(wrong, snapshot.tables)
+        if match is None and snapshot.schemas:
+            # attached databases: the schema alias may be missing or wrong
+            schema, bare = snapshot.split(wrong)
+            by_bare: Dict[str, List[str]] = {}
+            for key in snapshot.tables:
+                key_schema, key_bare = snapshot.split(key)
+                if schema is None or key_schema == schema:
+                    by_bare.setdefault(key_bare, []).append(key)
+            name = _best_match(bare if schema else wrong.rpartition(".")[2], by_bare)
+            if name is not None and len(by_bare[name]) == 1:
+                match = by_bare[name][0]
+        if match is None:
+            return None
+        return _replace_identifier(sql, wrong, _table_sql(match, snapshot))
+
+    def _fix_column(self, sql: str, wrong: str, snapshot: SchemaSnapshot) -> Optional[str]:
+        qualifier, _, column = wrong.rpartition(".")
+        tables = snapshot.referenced_tables(sql) or list(snapshot.tables)
+        local = [c.name for t in tables for c in snapshot.tables[t].columns]
+        everywhere = [c.name for t in snapshot.tables.values() for c in t.columns]
+        match = _best_match(column, local) or _best_match(column, everywhere)
+        if match is None:
+            return None
+        if qualifier:
+            q = re.escape(qualifier)
+            pattern = rf'(?<![\w"]){q}\.(?:"{re.escape(column)}"|{re.escape(column)}(?![\w"]))'
+            return _replace_outside_strings(sql, pattern, f"{qualifier}.{_ident(match)}")
+        return _replace_identifier(sql, column, _ident(match))
+
+    def _fix_unquoted_tables(self, sql: str, near: str, snapshot: SchemaSnapshot) -> Optional[str]:
+        """Quote table names with spaces or keyword names written bare."""
+        for name in sorted(snapshot.tables, key=len, reverse=True):
+            schema, table = snapshot.split(name)
+            if not _needs_quotes(table):
+                continue
+            words = table.split()
+            if near.lower() not in (w.lower() for w in words):
+                continue
+            prefix = rf"(?<![\w\.]){re.escape(schema)}\s*\.\s*" if schema else r'(?<![\w"\[`.])'
+            pattern = prefix + r"\s+".join(map(re.escape, words)) + r'(?![\w"\]`])'
+            fixed = _replace_outside_strings(sql, pattern, _table_sql(name, snapshot) if schema else quote_ident(name))
+            if fixed != sql:
+                return fixed
+        return None
+
+    def fix(self, sql: str, error: str, snapshot: SchemaSnapshot) -> Optional[str]:
+        m = _NO_SUCH_TABLE.search(error)
+        if m:
+            return self._fix_table(sql, m.group(1).strip(), snapshot)
+        m = _NO_SUCH_COLUMN.search(error)
+        if m:
+            return self._fix_column(sql, m.group(1).strip(), snapshot)
+        m = _SYNTAX_NEAR.search(error)
+        if m:
+            return self._fix_unquoted_tables(sql, m.group(1), snapshot)
+        return None
+
+    # ------------------------------------------------------------------
+    # ENTRY
+    # ------------------------------------------------------------------
+    def check(self, pool: SQLiteConnectionPool, sql: str, snapshot: SchemaSnapshot) -> str:
+        """Returns compilable SQL (possibly fixed) or raises PreflightError."""
+        with pool.connection() as conn:
+            original = sql
+            for _ in range(self.max_fixes + 1):
+                error = self.compile_error(conn, sql)
+                if error is None:
+                    if sql == original:
+                        self._count("clean")
+                    else:
+                        self._count("fixed_locally")
+                        self._remember_fix(sql)
+                    return sql
+                fixed = self.fix(sql, error, snapshot)
+                if fixed is None or fixed == sql:
+                    break
+                sql = fixed
+
+        self._count("unfixable")
+        raise PreflightError(error)
+
+    def _remember_fix(self, sql: str):
+        with self._lock:
+            self._pending[sql] = None
+            self._pending.move_to_end(sql)
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+
+    def executed(self, sql: str, repaired: bool = False):
+        """Called once ``sql`` has run successfully. A local fix only counts
+        as an avoided LLM repair when the fixed statement actually executes,
+        and only on a first attempt: fixing the LLM's repair avoided nothing."""
+        with self._lock:
+            if sql in self._pending:
+                del self._pending[sql]
+                self._stats["repair_fixes_executed" if repaired else "fixes_executed"] += 1
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self._stats["checked"] += 1
+            self._stats[outcome] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """fixes_executed is the number of LLM repair round-trips avoided."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["llm_repairs_avoided"] = stats["fixes_executed"]
+        return stats
@@ -0,0 +1,146 @@
+# benchmarks/run.py
+"""
+Offline benchmark runner.
+
+    python -m benchmarks.run --presets small,wide --latency-ms 50
+    python -m benchmarks.run --compare benchmarks/results/baseline.json
+
+Writes one JSON file per run to benchmarks/results/ and, with --compare,
+exits non-zero when a latency grows or a throughput drops by more than
+--threshold against the baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+# per-query JSON trace lines would flood the console at 100-way concurrency
+os.environ.setdefault("TRACE_LOG_LEVEL", "WARNING")
+
+from benchmarks import scenarios
+from benchmarks.synthetic import CORPUS_PRESETS, generate_corpus
+
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+
+
+def run(args) -> Dict[str, Any]:
+    db_dir = os.path.join(args.work_dir, "databases")
+    presets = args.presets.split(",")
+    corpus = generate_corpus(db_dir, presets, seed=args.seed)
+    agent = scenarios.make_agent(db_dir, args.latency_ms / 1000)
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    report: Dict[str, Any] = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "databases": {},
+    }
+    if not args.skip_startup:
+        print("▶ startup")
+        report["startup"] = scenarios.startup(db_dir)
+    for db_name in corpus:
+        print(f"▶ {db_name}")
+        entry = {"stages": scenarios.stage_latency(agent, db_name, args.repeats)}
+        if not args.skip_resident:
+            entry["resident"] = scenarios.resident_latency(corpus[db_name], args.repeats)
+        if not args.skip_throughput:
+            entry["agent_throughput"] = scenarios.agent_throughput(
+                agent, db_name, levels, args.requests
+            )
+            if not args.skip_api:
+                entry["api_throughput"] = scenarios.api_throughput(
+                    agent, db_name, levels, args.requests
+                )
+        report["databases"][db_name] = entry
+
+    report["llm_dispatch"] = agent.llm_dispatch.stats()
+    report["preflight"] = agent.preflight.stats()
+    return report
+
+
+# ----------------------------------------------------------------------
+# REGRESSION CHECK
+# ----------------------------------------------------------------------
+def _metrics(report: Dict[str, Any]) -> Dict[str, float]:
+    """Flattens a report into {name: value}; names ending in _rps are higher-is-better."""
+    flat = {}
+    for key, value in report.get("startup", {}).items():
+        if key.endswith("_ms"):
+            flat[f"startup/{key}"] = value
+    for db, entry in report.get("databases", {}).items():
+        for stage, summary in entry.get("stages", {}).items():
+            if "p50_ms" in summary:
+                flat[f"{db}/stage/{stage}/p50_ms"] = summary["p50_ms"]
+                flat[f"{db}/stage/{stage}/p95_ms"] = summary["p95_ms"]
+        for mode in ("file", "resident"):
+            summary = entry.get("resident", {}).get(mode, {})
+            if "p50_ms" in summary:
+                flat[f"{db}/resident/{mode}/p50_ms"] = summary["p50_ms"]
+        for kind in ("agent_throughput", "api_throughput"):
+            for run in entry.get(kind, []):
+                flat[f"{db}/{kind}/c{run['concurrency']}/throughput_rps"] = run["throughput_rps"]
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    now, base = _metrics(current), _metrics(baseline)
+    regressions = []
+    for name in sorted(now.keys() & base.keys()):
+        old, new = base[name], now[name]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = change < -threshold if name.endswith("_rps") else change > threshold
+        if worse:
+            regressions.append(f"{name}: {old} → {new} ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline SQL agent benchmarks")
+    parser.add_argument("--presets", default="small,wide", help=f"comma list of {sorted(CORPUS_PRESETS)}")
+    parser.add_argument("--work-dir", default=os.path.join(PROJECT_ROOT, "benchmarks", ".corpus"))
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="stub LLM latency per call")
+    parser.add_argument("--concurrency", default="1,10,100")
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--repeats", type=int, default=5, help="per-stage samples per question")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-throughput", action="store_true")
+    parser.add_argument("--skip-api", action="store_true", help="skip the FastAPI scenarios")
+    parser.add_argument("--skip-startup", action="store_true", help="skip the cold-start scenario")
+    parser.add_argument("--skip-resident", action="store_true", help="skip the file vs in-memory comparison")
+    parser.add_argument("--out", default=None, help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="baseline result file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+
+    out = args.out or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"✅ results written to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            return 1
+        print("✅ no regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
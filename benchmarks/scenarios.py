@@ -0,0 +1,311 @@
+# benchmarks/scenarios.py
+import asyncio
+import importlib
+import os
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks.stubs import StubChatModel, StubEmbeddings
+from benchmarks.synthetic import table_name
+
+# ----------------------------------------------------------------------
+# WORKLOAD
+# Canned question → SQL pairs that hold for every corpus preset (all
+# presets have at least the first four entity tables).
+# ----------------------------------------------------------------------
+T0, T1, T2, T3 = (table_name(i) for i in range(4))
+
+WORKLOAD: Dict[str, str] = {
+    f"count {T0} rows": f"SELECT COUNT(*) FROM {T0}",
+    f"list {T2} names": f"SELECT id, {T2}_2_text FROM {T2}",
+    f"show {T1} per {T0}": (
+        f'SELECT c.id, COUNT(*) AS n FROM "{T1}" o JOIN {T0} c ON o.{T0}_id = c.id '
+        f"GROUP BY c.id ORDER BY n DESC LIMIT 10"
+    ),
+    f"top {T3} by value": f"SELECT * FROM {T3} ORDER BY {T3}_1_real DESC LIMIT 10",
+}
+
+# a question whose first SQL fails and needs one LLM repair round-trip
+BROKEN_QUESTION = f"show {T3} labels"
+BROKEN_SQL = f"SELECT qqq FROM {T3}"
+FIXED_SQL = f"SELECT {T3}_2_text FROM {T3}"
+
+# repeated aggregate queries for the file-backed vs resident comparison
+ANALYTICAL: List[str] = [
+    f'SELECT c.id, COUNT(*) AS n, AVG(o.{T1}_1_real) FROM "{T1}" o '
+    f"JOIN {T0} c ON o.{T0}_id = c.id GROUP BY c.id ORDER BY n DESC LIMIT 10",
+    f"SELECT {T0}_0_integer % 10 AS bucket, COUNT(*), SUM({T0}_1_real) FROM {T0} GROUP BY bucket",
+    f'SELECT substr({T1}_3_date, 1, 4) AS year, COUNT(*) FROM "{T1}" GROUP BY year ORDER BY year',
+]
+
+STAGES = ["route", "schema", "generate", "validate", "execute", "execute_cached", "repair"]
+
+
+def make_stub_llm(latency_s: float) -> StubChatModel:
+    answers = dict(WORKLOAD)
+    answers[BROKEN_QUESTION] = BROKEN_SQL
+    return StubChatModel(answers, repairs={BROKEN_SQL: FIXED_SQL}, latency_s=latency_s)
+
+
+def make_agent(db_dir: str, latency_s: float):
+    from agent.sql_agent import MultiDBAgent
+
+    agent = MultiDBAgent(llm=make_stub_llm(latency_s), db_dir=db_dir)
+    agent._embeddings = StubEmbeddings()
+    return agent
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(pct(0.50) * 1000, 3),
+        "p95_ms": round(pct(0.95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _timed(fn: Callable, *args) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    value = fn(*args)
+    return value, time.perf_counter() - start
+
+
+# ----------------------------------------------------------------------
+# PER-STAGE LATENCY
+# ----------------------------------------------------------------------
+def stage_latency(agent, db_name: str, repeats: int = 5) -> Dict[str, Dict[str, float]]:
+    """
+    Times each pipeline stage in isolation through the agent's own methods,
+    bypassing the SQL cache so every generation reaches the (stub) LLM.
+    "execute" runs against an empty result cache, "execute_cached" repeats it.
+    """
+    samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+
+    for _ in range(repeats):
+        for question in WORKLOAD:
+            _, t = _timed(agent._route_db, question)
+            samples["route"].append(t)
+
+            _, t = _timed(agent._generation_prompt, question, db_name)
+            samples["schema"].append(t)
+
+            sql, t = _timed(agent._generate_sql, question, db_name)
+            samples["generate"].append(t)
+
+            sql, t = _timed(agent._preflight, db_name, sql)
+            samples["validate"].append(t)
+
+            agent.result_cache.clear()
+            _, t = _timed(agent._run_sql, db_name, sql)
+            samples["execute"].append(t)
+
+            _, t = _timed(agent._run_sql, db_name, sql)
+            samples["execute_cached"].append(t)
+
+        _, t = _timed(agent._repair_sql, BROKEN_SQL, "no such column: qqq", db_name, BROKEN_QUESTION)
+        samples["repair"].append(t)
+
+    return {stage: summarize(values) for stage, values in samples.items()}
+
+
+def _fetch_all(pool, sql: str) -> list:
+    with pool.connection() as conn:
+        return conn.execute(sql).fetchall()
+
+
+def resident_latency(db_path: str, repeats: int = 5) -> Dict[str, Any]:
+    """
+    Repeated analytical queries through a file-backed pool and a resident
+    pool (in-memory snapshot) of the same database, both warmed up first.
+    """
+    from loaders.connection_pool import ResidentBudget, ResidentConnectionPool, SQLiteConnectionPool
+
+    pools = {
+        "file": SQLiteConnectionPool(db_path, max_size=1),
+        "resident": ResidentConnectionPool(db_path, max_size=1, budget=ResidentBudget(None)),
+    }
+    report: Dict[str, Any] = {}
+    try:
+        for mode, pool in pools.items():
+            for sql in ANALYTICAL:
+                _fetch_all(pool, sql)
+            samples = []
+            for _ in range(repeats):
+                for sql in ANALYTICAL:
+                    samples.append(_timed(_fetch_all, pool, sql)[1])
+            report[mode] = summarize(samples)
+        report["snapshot_ms"] = round(pools["resident"].stats()["snapshot_seconds"] * 1000, 3)
+        resident_p50 = report["resident"]["p50_ms"]
+        report["speedup_p50"] = round(report["file"]["p50_ms"] / resident_p50, 2) if resident_p50 else None
+    finally:
+        for pool in pools.values():
+            pool.close()
+    return report
+
+
+# ----------------------------------------------------------------------
+# THROUGHPUT
+# ----------------------------------------------------------------------
+def _questions(total: int, unique: bool) -> List[str]:
+    base = list(WORKLOAD) + [BROKEN_QUESTION]
+    # a numeric suffix defeats the generation cache without changing the SQL
+    return [
+        f"{base[i % len(base)]} #{i}" if unique else base[i % len(base)]
+        for i in range(total)
+    ]
+
+
+async def _run_concurrent(call, questions: List[str], concurrency: int) -> Dict[str, Any]:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(q: str):
+        nonlocal errors
+        async with sem:
+            start = time.perf_counter()
+            ok = await call(q)
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in questions))
+    wall = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(questions),
+        "errors": errors,
+        "wall_s": round(wall, 4),
+        "throughput_rps": round(len(questions) / wall, 2) if wall else 0.0,
+        "latency": summarize(latencies),
+    }
+
+
+def agent_throughput(
+    agent,
+    db_name: str,
+    concurrency_levels=(1, 10, 100),
+    requests_per_level: int = 100,
+    unique: bool = True,
+) -> List[Dict[str, Any]]:
+    """End-to-end arun_user_query throughput at each concurrency level."""
+    from agent.llm_limiter import LLMBusy
+
+    async def call(q: str) -> bool:
+        try:
+            return isinstance(await agent.arun_user_query(q, explicit_db=db_name), dict)
+        except LLMBusy:
+            return False  # shed by admission control: counted as an error
+
+    results = []
+    for level in concurrency_levels:
+        agent.sql_cache.clear()
+        agent.result_cache.clear()
+        agent.examples.clear()
+        llm = agent.llm
+        calls_before = llm.calls
+        run = asyncio.run(_run_concurrent(call, _questions(requests_per_level, unique), level))
+        run["llm_calls"] = llm.calls - calls_before
+        results.append(run)
+    return results
+
+
+def load_fastapi_app(agent):
+    """Imports web.fastapi_app with ``agent`` registered as the one it serves."""
+    from agent.registry import set_agent
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    set_agent(agent)
+    return importlib.import_module("web.fastapi_app")
+
+
+def api_throughput(
+    agent,
+    db_name: str,
+    concurrency_levels=(1, 10, 100),
+    requests_per_level: int = 100,
+    unique: bool = True,
+) -> List[Dict[str, Any]]:
+    """End-to-end POST /query throughput, in-process over httpx's ASGI transport."""
+    import httpx
+
+    module = load_fastapi_app(agent)
+
+    async def level_run(level: int) -> Dict[str, Any]:
+        transport = httpx.ASGITransport(app=module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+            async def call(q: str) -> bool:
+                resp = await client.post("/query", json={"query": q, "explicit_db": db_name})
+                return resp.status_code == 200 and isinstance(resp.json().get("result"), dict)
+
+            return await _run_concurrent(call, _questions(requests_per_level, unique), level)
+
+    results = []
+    for level in concurrency_levels:
+        agent.sql_cache.clear()
+        agent.result_cache.clear()
+        agent.examples.clear()
+        results.append(asyncio.run(level_run(level)))
+    return results
+
+
+# ----------------------------------------------------------------------
+# STARTUP
+# Measured in a fresh interpreter: import costs only show up once.
+# ----------------------------------------------------------------------
+_STARTUP_PROBE = """
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+out = {{}}
+t = time.perf_counter()
+import web.fastapi_app
+out["import_app_ms"] = (time.perf_counter() - t) * 1000
+heavy = ("langchain", "langchain_community", "langchain_openai", "pandas", "sqlalchemy")
+out["heavy_modules_after_import"] = sorted(m for m in heavy if m in sys.modules)
+from agent.registry import get_agent
+t = time.perf_counter()
+agent = get_agent({db_dir!r})
+names = list(agent.databases)
+out["first_agent_ms"] = (time.perf_counter() - t) * 1000
+reruns = []
+for _ in range({reruns}):
+    t = time.perf_counter()
+    agent = get_agent({db_dir!r})
+    names = list(agent.databases)
+    reruns.append((time.perf_counter() - t) * 1000)
+out["rerun_ms"] = sum(reruns) / len(reruns)
+t = time.perf_counter()
+agent.databases[names[0]]
+out["first_sql_database_ms"] = (time.perf_counter() - t) * 1000
+print(json.dumps(out))
+"""
+
+
+def startup(db_dir: str, reruns: int = 20) -> Dict[str, Any]:
+    """
+    Cold-start cost of the serving stack: importing the FastAPI app, the
+    first get_agent(), a Streamlit-style rerun (get_agent + listing the
+    databases) and the first per-database SQLDatabase.
+    """
+    import json
+    import subprocess
+    import sys
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = _STARTUP_PROBE.format(root=root, db_dir=os.path.abspath(db_dir), reruns=reruns)
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-benchmark")}
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    out = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {k: round(v, 3) if isinstance(v, float) else v for k, v in out.items()}
@@ -0,0 +1,107 @@
+# benchmarks/stubs.py
+import asyncio
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage
+
+from rag.embeddings import HashingEmbeddings
+
+_QUESTION = re.compile(r"User question:\s*(.+?)\s*$", re.S)
+_FAILED_SQL = re.compile(r"The SQL below failed\.\s*SQL:\s*(.+?)\s*Error:", re.S)
+
+
+def _prompt_text(messages: Any) -> str:
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(getattr(m, "content", str(m)) for m in messages)
+
+
+class StubChatModel:
+    """
+    Deterministic offline stand-in for ChatOpenAI.
+
+    ``answers`` maps a question substring to canned SQL; ``repairs`` maps a
+    failing SQL string to its fix. Every call sleeps ``latency_s`` to mimic
+    a provider round-trip. Supports invoke / ainvoke / batch / abatch.
+    """
+
+    def __init__(
+        self,
+        answers: Dict[str, str],
+        default_sql: str = "SELECT 1",
+        repairs: Optional[Dict[str, str]] = None,
+        latency_s: float = 0.05,
+        chat_reply: str = "I don’t have that information.",
+    ):
+        self.answers = answers
+        self.default_sql = default_sql
+        self.repairs = repairs or {}
+        self.latency_s = latency_s
+        self.chat_reply = chat_reply
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.batch_calls = 0
+        self.prompt_chars = 0
+
+    def _respond(self, messages: Any) -> AIMessage:
+        text = _prompt_text(messages)
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(text)
+
+        m = _FAILED_SQL.search(text)
+        if m is not None:
+            failed = m.group(1).strip()
+            return AIMessage(content=self.repairs.get(failed, self.default_sql))
+
+        m = _QUESTION.search(text)
+        if m is None:
+            return AIMessage(content=self.chat_reply)
+        question = m.group(1).lower()
+        for key, sql in self.answers.items():
+            if key.lower() in question:
+                return AIMessage(content=sql)
+        if "SQL generator" in text:
+            return AIMessage(content=self.default_sql)
+        return AIMessage(content=self.chat_reply)
+
+    def invoke(self, messages: Any, **kwargs) -> AIMessage:
+        time.sleep(self.latency_s)
+        return self._respond(messages)
+
+    async def ainvoke(self, messages: Any, **kwargs) -> AIMessage:
+        await asyncio.sleep(self.latency_s)
+        return self._respond(messages)
+
+    def batch(self, inputs: List[Any], return_exceptions: bool = False, **kwargs) -> List[AIMessage]:
+        with self._lock:
+            self.batch_calls += 1
+        time.sleep(self.latency_s)
+        return [self._respond(m) for m in inputs]
+
+    async def abatch(self, inputs: List[Any], return_exceptions: bool = False, **kwargs) -> List[AIMessage]:
+        with self._lock:
+            self.batch_calls += 1
+        await asyncio.sleep(self.latency_s)
+        return [self._respond(m) for m in inputs]
+
+
+class StubEmbeddings(HashingEmbeddings):
+    """Offline stand-in for OpenAIEmbeddings with a configurable latency."""
+
+    def __init__(self, latency_s: float = 0.0, dim: int = 512):
+        super().__init__(dim=dim)
+        self.latency_s = latency_s
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return super().embed_query(text)
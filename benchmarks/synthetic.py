@@ -0,0 +1,100 @@
+# benchmarks/synthetic.py
+import os
+import random
+import sqlite3
+from typing import Dict, List
+
+from loaders.schema_catalog import quote_ident
+
+# entity names give retrieval/routing something realistic to match on
+ENTITIES = [
+    "customer", "order", "product", "supplier", "employee", "invoice",
+    "payment", "shipment", "warehouse", "category", "region", "store",
+    "promotion", "review", "vendor", "account", "ledger", "budget",
+    "department", "contract", "ticket", "campaign", "asset", "license",
+]
+
+COLUMN_KINDS = [
+    ("INTEGER", lambda r, i: r.randint(0, 1_000_000)),
+    ("REAL", lambda r, i: round(r.uniform(0, 10_000), 2)),
+    ("TEXT", lambda r, i: f"name_{r.randint(0, 50_000)}"),
+    ("DATE", lambda r, i: f"20{r.randint(10, 24):02d}-{r.randint(1, 12):02d}-{r.randint(1, 28):02d}"),
+]
+
+# presets: tables × columns × rows
+CORPUS_PRESETS: Dict[str, Dict[str, int]] = {
+    "small": {"tables": 6, "columns": 6, "rows": 1_000},
+    "medium": {"tables": 12, "columns": 10, "rows": 100_000},
+    "wide": {"tables": 200, "columns": 40, "rows": 100},
+    "large": {"tables": 4, "columns": 8, "rows": 2_000_000},
+}
+
+
+def table_name(i: int) -> str:
+    base = ENTITIES[i % len(ENTITIES)]
+    return base if i < len(ENTITIES) else f"{base}_{i // len(ENTITIES)}"
+
+
+def generate_database(
+    path: str,
+    tables: int = 6,
+    columns: int = 6,
+    rows: int = 1_000,
+    seed: int = 0,
+    chunk: int = 50_000,
+) -> str:
+    """
+    Build a synthetic SQLite file. Every table has an INTEGER PRIMARY KEY
+    ``id``, an indexed foreign key to a parent table and ``columns`` typed
+    payload columns.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    for t in range(tables):
+        name = table_name(t)
+        # FK graph is a shallow tree (fan-out 4), like a real star/snowflake
+        parent = table_name((t - 1) // 4) if t else None
+        kinds = [COLUMN_KINDS[c % len(COLUMN_KINDS)] for c in range(columns)]
+        cols = ["id INTEGER PRIMARY KEY"]
+        if parent:
+            cols.append(f"{parent}_id INTEGER REFERENCES {quote_ident(parent)}(id)")
+        cols += [f"{name}_{c}_{kind[0].lower()} {kind[0]}" for c, kind in enumerate(kinds)]
+        conn.execute(f"CREATE TABLE {quote_ident(name)} ({', '.join(cols)})")
+        if parent:
+            conn.execute(f"CREATE INDEX idx_{name}_{parent} ON {quote_ident(name)}({parent}_id)")
+
+        width = len(cols)
+        insert = f"INSERT INTO {quote_ident(name)} VALUES ({', '.join('?' * width)})"
+        for start in range(0, rows, chunk):
+            batch = []
+            for i in range(start, min(rows, start + chunk)):
+                row: List = [i + 1]
+                if parent:
+                    row.append(rnd.randint(1, rows))
+                row += [gen(rnd, i) for _, gen in kinds]
+                batch.append(row)
+            conn.executemany(insert, batch)
+        conn.commit()
+
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def generate_corpus(out_dir: str, presets: List[str] = None, seed: int = 0) -> Dict[str, str]:
+    """One database per preset: {db_name: path}. Existing files are reused."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for preset in presets or ["small", "medium", "wide"]:
+        spec = CORPUS_PRESETS[preset]
+        path = os.path.join(out_dir, f"{preset}.db")
+        if not os.path.exists(path):
+            generate_database(path, seed=seed, **spec)
+        paths[f"{preset}.db"] = path
+    return paths
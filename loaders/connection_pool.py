@@ -0,0 +1,580 @@
+# loaders/connection_pool.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+from loaders.data_version import DataTag, get_data_versions
+
+# ----------------------------------------------------------------------
+# SETTINGS
+# ----------------------------------------------------------------------
+DEFAULT_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # negative = KiB
+    "temp_store": "MEMORY",
+    "query_only": 1,
+}
+
+ALLOWED_PRAGMAS = {"mmap_size", "cache_size", "temp_store", "query_only"}
+
+# databases served from an in-memory snapshot: "auto" (any that fits the
+# budget), a comma list of file names, or empty for none
+SQLITE_RESIDENT = os.getenv("SQLITE_RESIDENT", "")
+SQLITE_RESIDENT_BUDGET_MB = float(os.getenv("SQLITE_RESIDENT_BUDGET_MB", "256"))
+# how often a resident snapshot compares itself with the file
+SQLITE_RESIDENT_CHECK_SECONDS = float(os.getenv("SQLITE_RESIDENT_CHECK_SECONDS", "5"))
+
+# per-database overrides, keyed by file name (e.g. "imdb.db")
+_db_settings: Dict[str, Dict[str, Any]] = {}
+
+
+def _load_env_settings():
+    """SQLITE_DB_PRAGMAS='{"imdb.db": {"mmap_size": 1073741824}}'"""
+    raw = os.getenv("SQLITE_DB_PRAGMAS")
+    if not raw:
+        return
+    for db_name, pragmas in json.loads(raw).items():
+        configure_database(db_name, **pragmas)
+
+
+def configure_database(
+    db_name: str, pool_size: Optional[int] = None, resident: Optional[bool] = None, **pragmas
+):
+    """Set pool size / residency / pragmas for one database. Applies to pools created afterwards."""
+    unknown = set(pragmas) - ALLOWED_PRAGMAS
+    if unknown:
+        raise ValueError(f"Unsupported pragmas for {db_name}: {sorted(unknown)}")
+    settings = _db_settings.setdefault(db_name, {})
+    settings.update(pragmas)
+    if pool_size is not None:
+        settings["pool_size"] = pool_size
+    if resident is not None:
+        settings["resident"] = bool(resident)
+
+
+def _settings_for(db_path: str) -> Dict[str, Any]:
+    return _db_settings.get(os.path.basename(db_path), {})
+
+
+def _wants_resident(db_path: str, setting: Optional[bool] = None) -> bool:
+    if setting is not None:
+        return setting
+    spec = SQLITE_RESIDENT.strip()
+    if spec.lower() == "auto":
+        return True
+    return os.path.basename(db_path) in {n.strip() for n in spec.split(",") if n.strip()}
+
+
+def _pragma_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int):
+        return str(value)
+    value = str(value)
+    if not value.isidentifier():
+        raise ValueError(f"Invalid pragma value: {value!r}")
+    return value
+
+
+# ----------------------------------------------------------------------
+# POOLED CONNECTION
+# ----------------------------------------------------------------------
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool."""
+
+    _pool: Optional["SQLiteConnectionPool"] = None
+    _idle: bool = False
+    _generation: int = 0  # resident snapshot the connection reads
+
+    def close(self):
+        pool = self._pool
+        if pool is None:
+            super().close()
+        else:
+            pool.release(self)
+
+    def close_for_real(self):
+        self._pool = None
+        super().close()
+
+
+# ----------------------------------------------------------------------
+# POOL
+# ----------------------------------------------------------------------
+class SQLiteConnectionPool:
+    """
+    Read-only (mode=ro) connections to one SQLite file, opened lazily up to
+    ``max_size`` and reused for the life of the process. Safe to share
+    between threads: a connection is used by one thread at a time.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        pragmas: Optional[Dict[str, Any]] = None,
+        max_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = 30.0,
+    ):
+        self.db_path = os.path.abspath(db_path)
+        self.uri = f"file:{quote(self.db_path)}?mode=ro"
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self.max_size = max_size
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._idle: List[PooledConnection] = []
+        self._size = 0
+        self._closed = False
+        self._engine = None
+        self._sql_databases: Dict[type, Any] = {}
+
+        self._stats = {
+            "opened": 0,
+            "acquired": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "connect_seconds": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # RAW CONNECTIONS
+    # ------------------------------------------------------------------
+    def _open(self) -> PooledConnection:
+        start = time.perf_counter()
+        conn = sqlite3.connect(
+            self.uri,
+            uri=True,
+            check_same_thread=False,
+            factory=PooledConnection,
+        )
+        self._prepare(conn)
+        conn._pool = self
+        with self._cond:
+            self._stats["opened"] += 1
+            self._stats["connect_seconds"] += time.perf_counter() - start
+        return conn
+
+    def _prepare(self, conn: sqlite3.Connection):
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {_pragma_value(value)}")
+        # parse the schema now so the first real query doesn't pay for it
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError(f"Connection pool closed: {self.db_path}")
+                if self._idle:
+                    self._stats["acquired"] += 1
+                    conn = self._idle.pop()
+                    conn._idle = False
+                    return conn
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                self._stats["waits"] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    self._stats["timeouts"] += 1
+                    raise TimeoutError(
+                        f"No free connection for {os.path.basename(self.db_path)} "
+                        f"after {timeout:.1f}s (pool size {self.max_size})"
+                    )
+
+        try:
+            conn = self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["acquired"] += 1
+        return conn
+
+    def release(self, conn: PooledConnection):
+        if conn._idle:
+            return  # double close
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                conn.close_for_real()
+                return
+            conn._idle = True
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[PooledConnection]:
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    # ------------------------------------------------------------------
+    # SQLALCHEMY / LANGCHAIN
+    # ------------------------------------------------------------------
+    @property
+    def engine(self):
+        """SQLAlchemy engine that borrows connections from this pool."""
+        if self._engine is None:
+            from sqlalchemy import create_engine
+            from sqlalchemy.pool import NullPool
+
+            # NullPool closes the DBAPI connection on checkin, which
+            # PooledConnection turns into a release back to this pool.
+            self._engine = create_engine(
+                f"sqlite:///{self.db_path}",
+                creator=self.acquire,
+                poolclass=NullPool,
+            )
+        return self._engine
+
+    def sql_database(self, cls=None, **kwargs):
+        """One SQLDatabase (or subclass) instance per pool."""
+        if cls is None:
+            from langchain_community.utilities import SQLDatabase as cls
+        with self._cond:
+            db = self._sql_databases.get(cls)
+        if db is None:
+            db = cls(self.engine, **kwargs)
+            with self._cond:
+                db = self._sql_databases.setdefault(cls, db)
+        return db
+
+    def data_tag(self) -> DataTag:
+        """Version of the data this pool serves (see loaders.data_version)."""
+        return get_data_versions().tag(self.db_path)
+
+    # ------------------------------------------------------------------
+    # STATS / SHUTDOWN
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            stats["max_size"] = self.max_size
+        return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close_for_real()
+        if self._engine is not None:
+            self._engine.dispose()
+
+
+# pragmas that are per schema (apply to each ATTACHed database separately)
+_SCHEMA_PRAGMAS = {"mmap_size", "cache_size"}
+
+
+class AttachedConnectionPool(SQLiteConnectionPool):
+    """
+    Pool of connections to an empty in-memory main database with several
+    read-only files ATTACHed under schema aliases, so one statement can
+    join across databases (``SELECT ... FROM chinook.Artist JOIN ...``).
+    """
+
+    def __init__(
+        self,
+        attached: Dict[str, str],
+        pragmas: Optional[Dict[str, Any]] = None,
+        max_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = 30.0,
+    ):
+        super().__init__(":memory:", pragmas=pragmas, max_size=max_size, timeout=timeout)
+        for alias in attached:
+            if not alias.isidentifier():
+                raise ValueError(f"Invalid schema alias: {alias!r}")
+        self.attached = {alias: os.path.abspath(path) for alias, path in attached.items()}
+        self.db_path = "+".join(self.attached)  # label for errors and stats
+        self.uri = "file::memory:"
+
+    def _prepare(self, conn: sqlite3.Connection):
+        for alias, path in self.attached.items():
+            conn.execute("ATTACH DATABASE ? AS " + alias, (f"file:{quote(path)}?mode=ro",))
+        for name, value in self.pragmas.items():
+            value = _pragma_value(value)
+            if name in _SCHEMA_PRAGMAS:
+                for alias in self.attached:
+                    conn.execute(f"PRAGMA {alias}.{name} = {value}")
+            else:
+                conn.execute(f"PRAGMA {name} = {value}")
+        for alias in self.attached:
+            conn.execute(f"SELECT COUNT(*) FROM {alias}.sqlite_master").fetchone()
+
+    @property
+    def engine(self):
+        """
+        Not available: there is no single database file for SQLAlchemy to
+        reflect, so sql_database() cannot wrap an attached pool either. Use
+        connection() and the combined snapshot from agent.cross_db instead.
+        """
+        raise TypeError("AttachedConnectionPool has no SQLAlchemy engine; query it through connection()")
+
+
+# ----------------------------------------------------------------------
+# RESIDENT (IN-MEMORY) SNAPSHOTS
+# ----------------------------------------------------------------------
+class ResidentBudget:
+    """Bytes of in-memory snapshots allowed process-wide (None = unbounded)."""
+
+    def __init__(self, limit_bytes: Optional[int]):
+        self.limit_bytes = limit_bytes
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def resize(self, old: int, new: int) -> bool:
+        """Swap a reservation of ``old`` bytes for ``new``; False (unchanged) if it does not fit."""
+        with self._lock:
+            if self.limit_bytes is not None and self.used - old + new > self.limit_bytes:
+                return False
+            self.used += new - old
+            return True
+
+
+_resident_budget = ResidentBudget(int(SQLITE_RESIDENT_BUDGET_MB * 1024 * 1024))
+
+
+class ResidentConnectionPool(SQLiteConnectionPool):
+    """
+    Serves reads from a shared-cache in-memory copy of the file, made with
+    the backup API on first use.
+
+    Every ``check_seconds`` the file's data version is compared with the
+    snapshot's; on a change a new snapshot is built (by one caller, the
+    others keep reading the current one) and swapped in. Connections to the
+    previous snapshot are closed as they come back, which frees it. A
+    database that does not fit the memory budget is read from the file.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        pragmas: Optional[Dict[str, Any]] = None,
+        max_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = 30.0,
+        check_seconds: float = SQLITE_RESIDENT_CHECK_SECONDS,
+        budget: ResidentBudget = None,
+    ):
+        super().__init__(db_path, pragmas=pragmas, max_size=max_size, timeout=timeout)
+        self.file_uri = self.uri
+        self.check_seconds = check_seconds
+        self.budget = budget or _resident_budget
+        self.resident = True  # False once demoted to file reads
+
+        self._name = "sqlagent-" + hashlib.sha1(self.db_path.encode("utf-8")).hexdigest()[:12]
+        self._generation = 0
+        self._keeper: Optional[sqlite3.Connection] = None  # keeps the memory db alive
+        self._tag: Optional[DataTag] = None
+        self._nbytes = 0
+        self._last_check = 0.0
+        self._refresh_lock = threading.Lock()
+        self._stats.update({"snapshots": 0, "snapshot_seconds": 0.0, "demoted": 0})
+
+    # ------------------------------------------------------------------
+    # SNAPSHOTS
+    # ------------------------------------------------------------------
+    def _maybe_refresh(self):
+        if not self.resident:
+            return
+        if self._keeper is not None and time.monotonic() - self._last_check < self.check_seconds:
+            return
+        # the first snapshot is waited for; later ones are built by one caller
+        if not self._refresh_lock.acquire(blocking=self._keeper is None):
+            return
+        try:
+            if not self.resident or (
+                self._keeper is not None and time.monotonic() - self._last_check < self.check_seconds
+            ):
+                return
+            self._last_check = time.monotonic()
+            tag = get_data_versions().tag(self.db_path)  # read before copying
+            if self._keeper is None or tag != self._tag:
+                self._snapshot(tag)
+        finally:
+            self._refresh_lock.release()
+
+    def _snapshot(self, tag: DataTag):
+        nbytes = os.path.getsize(self.db_path)
+        if not self.budget.resize(self._nbytes, nbytes):
+            # outgrew the budget: give back what it held and read the file
+            self.budget.resize(self._nbytes, 0)
+            self._swap(None, self.file_uri, None, 0)
+            return
+
+        start = time.perf_counter()
+        uri = f"file:{self._name}-{self._generation + 1}?mode=memory&cache=shared"
+        keeper = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        try:
+            source = sqlite3.connect(self.file_uri, uri=True)
+            try:
+                source.backup(keeper)
+            finally:
+                source.close()
+        except Exception:
+            keeper.close()
+            self.budget.resize(nbytes, self._nbytes)
+            raise
+        self._swap(keeper, uri, tag, nbytes)
+        with self._cond:
+            self._stats["snapshots"] += 1
+            self._stats["snapshot_seconds"] += time.perf_counter() - start
+
+    def _swap(self, keeper: Optional[sqlite3.Connection], uri: str, tag: Optional[DataTag], nbytes: int):
+        with self._cond:
+            old = self._keeper
+            self._keeper, self._tag, self._nbytes = keeper, tag, nbytes
+            self.uri = uri
+            self._generation += 1
+            if keeper is None:
+                self.resident = False
+                self._stats["demoted"] += 1
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close_for_real()
+        if old is not None:
+            old.close()  # in-use connections keep the old snapshot until released
+
+    # ------------------------------------------------------------------
+    # CONNECTIONS
+    # ------------------------------------------------------------------
+    def _open(self) -> PooledConnection:
+        while True:
+            generation = self._generation
+            conn = super()._open()
+            if generation == self._generation:
+                conn._generation = generation
+                return conn
+            conn.close_for_real()  # swapped while connecting
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        self._maybe_refresh()
+        return super().acquire(timeout)
+
+    def release(self, conn: PooledConnection):
+        if conn._idle:
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            if not self._closed and conn._generation == self._generation:
+                conn._idle = True
+                self._idle.append(conn)
+                self._cond.notify()
+                return
+            self._size -= 1
+            self._cond.notify()
+        conn.close_for_real()
+
+    def data_tag(self) -> DataTag:
+        """Version of the snapshot being served (the file's once demoted)."""
+        self._maybe_refresh()
+        tag = self._tag
+        return tag if tag is not None else super().data_tag()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._cond:
+            stats["resident"] = int(self.resident)
+            stats["resident_bytes"] = self._nbytes
+            stats["generation"] = self._generation
+        return stats
+
+    def close(self):
+        super().close()
+        with self._cond:
+            keeper, self._keeper = self._keeper, None
+            nbytes, self._nbytes = self._nbytes, 0
+            self._generation += 1
+        if keeper is not None:
+            keeper.close()
+        self.budget.resize(nbytes, 0)
+
+
+# ----------------------------------------------------------------------
+# PROCESS-WIDE REGISTRY
+# ----------------------------------------------------------------------
+_pools: Dict[str, SQLiteConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> SQLiteConnectionPool:
+    path = os.path.abspath(db_path)
+    pool = _pools.get(path)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Database not found: {path}")
+            settings = dict(_settings_for(path))
+            max_size = settings.pop("pool_size", DEFAULT_POOL_SIZE)
+            resident = _wants_resident(path, settings.pop("resident", None))
+            cls = ResidentConnectionPool if resident else SQLiteConnectionPool
+            pool = cls(path, pragmas=settings, max_size=max_size)
+            _pools[path] = pool
+        return pool
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {os.path.basename(p.db_path): p.stats() for p in pools}
+
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class SQLDatabases(Mapping):
+    """
+    {db_name: SQLDatabase} whose values are built on first access.
+
+    Listing names is free; an SQLDatabase reflects every table of its
+    database when constructed, so it is only paid for by callers that use it.
+    """
+
+    def __init__(self, db_paths: Dict[str, str], cls=None):
+        self._paths = db_paths
+        self._cls = cls
+
+    def __getitem__(self, db_name: str):
+        return get_pool(self._paths[db_name]).sql_database(self._cls)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._paths)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+
+_load_env_settings()
@@ -0,0 +1,63 @@
+# loaders/data_version.py
+import os
+import sqlite3
+import threading
+from typing import Dict, Tuple
+from urllib.parse import quote
+
+# (PRAGMA data_version, file mtime_ns)
+DataTag = Tuple[int, int]
+
+
+class DataVersionTracker:
+    """
+    Cheap "has this database changed?" checks.
+
+    ``PRAGMA data_version`` only changes when *another* connection commits,
+    and its value is meaningful only on the connection that read it — so
+    every database gets one dedicated, long-lived read-only connection that
+    is never used for queries. The file mtime is folded in for writers that
+    replace the file instead of committing to it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conns: Dict[str, Tuple[sqlite3.Connection, threading.Lock]] = {}
+
+    def _conn(self, path: str) -> Tuple[sqlite3.Connection, threading.Lock]:
+        with self._lock:
+            entry = self._conns.get(path)
+            if entry is None:
+                conn = sqlite3.connect(
+                    f"file:{quote(path)}?mode=ro", uri=True, check_same_thread=False
+                )
+                entry = self._conns[path] = (conn, threading.Lock())
+            return entry
+
+    def tag(self, db_path: str) -> DataTag:
+        path = os.path.abspath(db_path)
+        mtime_ns = os.stat(path).st_mtime_ns
+        conn, lock = self._conn(path)
+        with lock:
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+        return version, mtime_ns
+
+    def forget(self, db_path: str):
+        with self._lock:
+            entry = self._conns.pop(os.path.abspath(db_path), None)
+        if entry is not None:
+            entry[0].close()
+
+    def close(self):
+        with self._lock:
+            entries = list(self._conns.values())
+            self._conns.clear()
+        for conn, _ in entries:
+            conn.close()
+
+
+_tracker = DataVersionTracker()
+
+
+def get_data_versions() -> DataVersionTracker:
+    return _tracker
@@ -2,6 +2,10 @@
 import os
 from langchain_community.utilities import SQLDatabase
 
+from loaders.connection_pool import get_pool
+from loaders.schema_catalog import get_schema_catalog
+from loaders.schema_encoder import get_schema_encoder
+
 
 class PatchedSQLDatabase(SQLDatabase):
     """SQLDatabase with patched get_table_info signature compatible with LangChain tools."""
@@ -9,8 +13,12 @@ class PatchedSQLDatabase(SQLDatabase):
     def get_table_info(self, table_names=None):
         """
         Accepts None, string, comma-separated string, or list.
-        Safely quotes names with spaces before running PRAGMA.
+        Columns come from the shared schema catalog, so names with spaces
+        or mixed case need no PRAGMA quoting here; tables are rendered in
+        the compact, token-budgeted form of the agent's prompts.
         """
+        snapshot = get_schema_catalog().get(self._engine.url.database)
+
         # No tables specified → ALL tables
         if table_names is None:
             tables = self.get_usable_table_names()
@@ -19,25 +27,20 @@ class PatchedSQLDatabase(SQLDatabase):
         else:
             tables = table_names
 
-        result_parts = []
+        found, result_parts = [], []
         for table in tables:
-            try:
-                # quote table names that contain spaces or special characters
-                if " " in table or "-" in table or table.lower() != table:
-                    table_quoted = f'"{table}"'
-                else:
-                    table_quoted = table
-
-                rows = self.run(f"PRAGMA table_info({table_quoted});")
-                col_lines = "\n".join([f"- {r[1]} ({r[2]})" for r in rows])
-                result_parts.append(f"Table: {table}\nColumns:\n{col_lines}\n")
-            except Exception as e:
-                result_parts.append(f"Table: {table}\nError: {e}\n")
+            info = snapshot.table(table)
+            if info is None:
+                result_parts.append(f"Error: no such table: {table}")
+            elif info.name not in found:
+                found.append(info.name)
+        if found:
+            result_parts.insert(0, get_schema_encoder().encode(snapshot, found))
         return "\n".join(result_parts)
 
 
 class DatabaseManager:
-    """Loads .db files from databases/ folder using PatchedSQLDatabase."""
+    """Loads .db files from databases/ folder using PatchedSQLDatabase over the shared pool."""
 
     def __init__(self, base_path="databases"):
         self.base_path = base_path
@@ -49,5 +52,4 @@ class DatabaseManager:
         db_path = os.path.join(self.base_path, db_name)
         if not os.path.exists(db_path):
             raise FileNotFoundError(f"Database not found: {db_path}")
-        uri = f"sqlite:///{db_path}"
-        return PatchedSQLDatabase.from_uri(uri)
+        return get_pool(db_path).sql_database(PatchedSQLDatabase)
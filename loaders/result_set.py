@@ -0,0 +1,224 @@
+# loaders/result_set.py
+import sqlite3
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from loaders.connection_pool import SQLiteConnectionPool
+from loaders.schema_catalog import SchemaSnapshot
+
+DEFAULT_BATCH_SIZE = 1000
+
+_PY_TO_SQLITE = {int: "INTEGER", float: "REAL", str: "TEXT", bytes: "BLOB"}
+
+
+def declared_types(
+    columns: Sequence[str],
+    rows: Sequence[tuple],
+    snapshot: Optional[SchemaSnapshot] = None,
+) -> List[str]:
+    """
+    Column types for a result set.
+
+    SQLite's Python driver does not expose sqlite3_column_decltype, so a
+    result column takes the declared type of the schema column with the same
+    name when that name is unambiguous, else the storage class of its first
+    non-NULL value.
+    """
+    by_name: Dict[str, set] = {}
+    if snapshot is not None:
+        for table in snapshot.tables.values():
+            for col in table.columns:
+                if col.type:  # a typeless column says nothing; its values do
+                    by_name.setdefault(col.name.lower(), set()).add(col.type.upper())
+
+    types = []
+    for i, name in enumerate(columns):
+        decl = by_name.get(name.lower(), set())
+        if len(decl) == 1:
+            types.append(next(iter(decl)))
+            continue
+        sample = next((r[i] for r in rows if r[i] is not None), None)
+        types.append(_PY_TO_SQLITE.get(type(sample), ""))
+    return types
+
+
+def batch_bytes(batch: Sequence[tuple]) -> int:
+    """Approximate payload size: text/blob length, 8 bytes for anything else."""
+    n = 0
+    for row in batch:
+        for v in row:
+            n += len(v) if isinstance(v, (str, bytes)) else 8
+    return n
+
+
+def _reraise(error: Exception, budget):
+    translated = budget.translate(error) if budget is not None else error
+    if translated is error:
+        raise error
+    raise translated from error
+
+
+class ResultSet:
+    """
+    Typed, streaming result of one statement.
+
+    The statement runs once; rows are read from the cursor in batches of
+    ``batch_size`` with fetchmany and the pooled connection is released as
+    soon as the cursor is exhausted or close() is called.
+    """
+
+    def __init__(
+        self,
+        columns: List[str],
+        types: List[str],
+        first_batch: List[tuple],
+        cursor: Optional[sqlite3.Cursor] = None,
+        release=None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        budget=None,
+        on_close: Optional[Callable[["ResultSet"], None]] = None,
+    ):
+        self.columns = columns
+        self.types = types
+        self.batch_size = batch_size
+        self.rows_read = len(first_batch)
+        self.bytes_read = 0
+        self.sql: Optional[str] = None  # statement actually executed
+        self.warnings: List[str] = []
+        self.data_tag: Optional[tuple] = None  # data version read before executing
+        self._first = first_batch
+        self._cursor = cursor
+        self._release = release
+        self._budget = budget
+        self._consumed = False
+        self._on_close = on_close
+
+    @classmethod
+    def execute(
+        cls,
+        pool: SQLiteConnectionPool,
+        sql: str,
+        snapshot: Optional[SchemaSnapshot] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        budget=None,
+        on_close: Optional[Callable[["ResultSet"], None]] = None,
+    ) -> "ResultSet":
+        """
+        ``budget`` (optional) is installed on the connection for the life of
+        the cursor: an object with install(conn), remove(conn) and
+        translate(error), e.g. agent.query_guard.ExecutionBudget.
+
+        ``on_close`` is called once with the result when the cursor is
+        released (rows_read / bytes_read are final by then).
+        """
+        conn = pool.acquire()
+
+        def release():
+            if budget is not None:
+                budget.remove(conn)
+            pool.release(conn)
+
+        try:
+            if budget is not None:
+                budget.install(conn)
+            cur = conn.execute(sql)
+            first = cur.fetchmany(batch_size)
+        except Exception as e:
+            release()
+            _reraise(e, budget)
+
+        columns = [d[0] for d in cur.description or []]
+        result = cls(
+            columns=columns,
+            types=declared_types(columns, first, snapshot),
+            first_batch=first,
+            cursor=cur,
+            release=release,
+            batch_size=batch_size,
+            budget=budget,
+            on_close=on_close,
+        )
+        result.sql = sql
+        result.bytes_read = batch_bytes(first)
+        if len(first) < batch_size:
+            result._close_cursor()
+        return result
+
+    @classmethod
+    def from_rows(cls, columns: List[str], types: List[str], rows: List[tuple]) -> "ResultSet":
+        return cls(columns=columns, types=types, first_batch=list(rows))
+
+    # ------------------------------------------------------------------
+    # READING
+    # ------------------------------------------------------------------
+    def batches(self) -> Iterator[List[tuple]]:
+        if self._consumed:
+            raise RuntimeError("ResultSet can only be iterated once")
+        self._consumed = True
+        try:
+            if self._first:
+                yield self._first
+            self._first = []
+            while self._cursor is not None:
+                try:
+                    batch = self._cursor.fetchmany(self.batch_size)
+                except Exception as e:
+                    _reraise(e, self._budget)
+                if not batch:
+                    break
+                self.rows_read += len(batch)
+                self.bytes_read += batch_bytes(batch)
+                yield batch
+        finally:
+            self._close_cursor()
+
+    def __iter__(self) -> Iterator[tuple]:
+        for batch in self.batches():
+            yield from batch
+
+    def fetchall(self) -> List[tuple]:
+        return [row for batch in self.batches() for row in batch]
+
+    def materialize(self) -> "ResultSet":
+        """Read everything and free the connection; returns a replayable copy."""
+        copy = ResultSet.from_rows(self.columns, self.types, self.fetchall())
+        copy.sql = self.sql
+        copy.warnings = self.warnings
+        copy.data_tag = self.data_tag
+        copy.bytes_read = self.bytes_read
+        return copy
+
+    @property
+    def rows(self) -> List[tuple]:
+        """Rows of a fully-buffered result (see materialize())."""
+        if self._cursor is not None:
+            raise RuntimeError("ResultSet is still streaming; call materialize() first")
+        return self._first
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"columns": self.columns, "types": self.types, "rows": self.rows}
+
+    # ------------------------------------------------------------------
+    # CLEANUP
+    # ------------------------------------------------------------------
+    def _close_cursor(self):
+        cur, self._cursor = self._cursor, None
+        if cur is not None:
+            cur.close()
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close(self)
+
+    def close(self):
+        self._close_cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self._close_cursor()
@@ -0,0 +1,251 @@
+# loaders/schema_catalog.py
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from loaders.connection_pool import get_pool
+
+
+# ----------------------------------------------------------------------
+# STRUCTURED SCHEMA
+# ----------------------------------------------------------------------
+@dataclass(frozen=True)
+class ColumnInfo:
+    name: str
+    type: str
+    notnull: bool = False
+    pk: int = 0  # 1-based position in the primary key, 0 if not part of it
+
+
+@dataclass(frozen=True)
+class ForeignKey:
+    column: str
+    ref_table: str
+    ref_column: Optional[str] = None
+
+
+@dataclass
+class TableInfo:
+    name: str
+    columns: List[ColumnInfo] = field(default_factory=list)
+    foreign_keys: List[ForeignKey] = field(default_factory=list)
+    sql: Optional[str] = None  # CREATE TABLE statement from sqlite_master
+
+    @property
+    def primary_key(self) -> List[str]:
+        pk_cols = sorted((c for c in self.columns if c.pk), key=lambda c: c.pk)
+        return [c.name for c in pk_cols]
+
+
+_SQL_IDENT = re.compile(r'"([^"]+)"|\[([^\]]+)\]|(\w+)')
+_QUALIFIED = re.compile(r'(\w+)\s*\.\s*(?:"([^"]+)"|\[([^\]]+)\]|(\w+))')
+
+
+@dataclass
+class SchemaSnapshot:
+    """One introspection of a database file, valid for a (schema_version, mtime) pair."""
+    db_path: str
+    schema_version: int
+    mtime_ns: int
+    tables: Dict[str, TableInfo]
+    text: str  # rendered prompt text
+    fingerprint: str = ""  # content hash of the DDL, stable across mtime-only changes
+    # ATTACHed snapshots only: {schema alias: file}; table keys are "alias.table"
+    schemas: Dict[str, str] = field(default_factory=dict)
+
+    def table(self, name: str) -> Optional[TableInfo]:
+        """Case-insensitive table lookup."""
+        if name in self.tables:
+            return self.tables[name]
+        lowered = name.lower()
+        for tname, info in self.tables.items():
+            if tname.lower() == lowered:
+                return info
+        return None
+
+    def referenced_tables(self, sql: str) -> List[str]:
+        """Table keys named anywhere in a statement (bare, quoted or schema-qualified)."""
+        names = [a or b or c for a, b, c in _SQL_IDENT.findall(sql)]
+        if self.schemas:
+            names += [f"{schema}.{a or b or c}" for schema, a, b, c in _QUALIFIED.findall(sql)]
+        found = []
+        for name in names:
+            info = self.table(name)
+            if info is not None and info.name not in found:
+                found.append(info.name)
+        return found
+
+    def split(self, name: str) -> Tuple[Optional[str], str]:
+        """(schema alias, bare table name); the alias is None for a single database."""
+        schema, dot, table = name.partition(".")
+        if dot and schema in self.schemas:
+            return schema, table
+        return None, name
+
+    def table_ref(self, name: str) -> str:
+        """SQL reference to a table key, schema-qualified when attached."""
+        schema, table = self.split(name)
+        return f"{schema}.{quote_ident(table)}" if schema else quote_ident(name)
+
+    def path_of(self, name: str) -> str:
+        """File the table lives in."""
+        schema, _ = self.split(name)
+        return self.schemas[schema] if schema else self.db_path
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def schema_fingerprint(tables: Dict[str, TableInfo]) -> str:
+    h = hashlib.sha256()
+    for table in tables.values():
+        h.update(table.name.encode("utf-8"))
+        h.update((table.sql or "").encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+_PLAIN_IDENT = re.compile(r"[A-Za-z_]\w*\Z")
+
+
+def _ident(name: str) -> str:
+    return name if _PLAIN_IDENT.match(name) else quote_ident(name)
+
+
+def table_label(name: str, schemas: Optional[Dict[str, str]] = None) -> str:
+    """Table name as shown to the LLM: quoted only when needed, "alias.table" when attached."""
+    schema, dot, table = name.partition(".")
+    if dot and schemas and schema in schemas:
+        return f"{schema}.{_ident(table)}"
+    return _ident(name)
+
+
+def render_table(
+    table: TableInfo,
+    types: bool = True,
+    columns: Optional[Set[str]] = None,
+    schemas: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    Compact one-line form: ``Album(AlbumId INTEGER pk, ArtistId INTEGER→Artist.ArtistId)``.
+    FK arrows carry the join graph. ``columns`` keeps only those columns
+    (the rest are marked "…"); ``types=False`` drops the declared types.
+    """
+    fks = {fk.column: fk for fk in table.foreign_keys}
+    kept = [c for c in table.columns if columns is None or c.name in columns]
+    parts = []
+    for col in kept:
+        text = _ident(col.name)
+        if types and col.type:
+            text += f" {col.type}"
+        if col.pk:
+            text += " pk"
+        fk = fks.get(col.name)
+        if fk is not None:
+            target = table_label(fk.ref_table, schemas)
+            text += f"→{target}.{_ident(fk.ref_column)}" if fk.ref_column else f"→{target}"
+        parts.append(text)
+    if len(kept) < len(table.columns):
+        parts.append("…")
+    return f"{table_label(table.name, schemas)}({', '.join(parts)})"
+
+
+def render_schema(tables: Dict[str, TableInfo], schemas: Optional[Dict[str, str]] = None) -> str:
+    """Prompt layout used by the agent: one compact line per table (see render_table)."""
+    return "\n".join(render_table(table, schemas=schemas) for table in tables.values())
+
+
+# ----------------------------------------------------------------------
+# INTROSPECTION
+# ----------------------------------------------------------------------
+def introspect(conn: sqlite3.Connection) -> Dict[str, TableInfo]:
+    cur = conn.cursor()
+    tables: Dict[str, TableInfo] = {}
+    rows = cur.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type='table';"
+    ).fetchall()
+
+    for name, ddl in rows:
+        cols = [
+            ColumnInfo(name=c[1], type=c[2] or "", notnull=bool(c[3]), pk=c[5])
+            for c in cur.execute(f"PRAGMA table_info({quote_ident(name)})")
+        ]
+        # foreign_key_list: (id, seq, table, from, to, on_update, on_delete, match)
+        fks = [
+            ForeignKey(column=f[3], ref_table=f[2], ref_column=f[4])
+            for f in cur.execute(f"PRAGMA foreign_key_list({quote_ident(name)})")
+        ]
+        tables[name] = TableInfo(name=name, columns=cols, foreign_keys=fks, sql=ddl)
+    return tables
+
+
+# ----------------------------------------------------------------------
+# CATALOG CACHE
+# ----------------------------------------------------------------------
+class SchemaCatalog:
+    """
+    Process-wide schema cache.
+
+    Each database is introspected once; the snapshot is reused until the
+    file mtime or PRAGMA schema_version changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, SchemaSnapshot] = {}
+        self._db_locks: Dict[str, threading.Lock] = {}
+
+    def _db_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            return self._db_locks.setdefault(path, threading.Lock())
+
+    def get(self, db_path: str) -> SchemaSnapshot:
+        path = os.path.abspath(db_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Database not found: {path}")
+
+        with self._db_lock(path), get_pool(path).connection() as conn:
+            mtime_ns = os.stat(path).st_mtime_ns
+            version = conn.execute("PRAGMA schema_version").fetchone()[0]
+
+            snap = self._snapshots.get(path)
+            if snap and snap.mtime_ns == mtime_ns and snap.schema_version == version:
+                return snap
+
+            tables = introspect(conn)
+            snap = SchemaSnapshot(
+                db_path=path,
+                schema_version=version,
+                mtime_ns=mtime_ns,
+                tables=tables,
+                text=render_schema(tables),
+                fingerprint=schema_fingerprint(tables),
+            )
+            self._snapshots[path] = snap
+            return snap
+
+    def adopt(self, snap: SchemaSnapshot):
+        """Install a snapshot introspected elsewhere (a worker process); get() still validates it."""
+        with self._lock:
+            current = self._snapshots.get(snap.db_path)
+            if current is None or (current.mtime_ns, current.schema_version) != (snap.mtime_ns, snap.schema_version):
+                self._snapshots[snap.db_path] = snap
+
+    def invalidate(self, db_path: Optional[str] = None):
+        with self._lock:
+            if db_path is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(os.path.abspath(db_path), None)
+
+
+
+_catalog = SchemaCatalog()
+
+
+def get_schema_catalog() -> SchemaCatalog:
+    return _catalog
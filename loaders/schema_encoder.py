@@ -0,0 +1,208 @@
+# loaders/schema_encoder.py
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from loaders.schema_catalog import SchemaSnapshot, TableInfo, render_table
+from utils.tracing import count_tokens
+
+# token budget for the schema part of a prompt (0 = unlimited)
+SCHEMA_TOKEN_BUDGET = int(os.getenv("SCHEMA_TOKEN_BUDGET", "4000"))
+# per-model overrides as JSON, matched on the longest model-name prefix,
+# e.g. {"gpt-4o": 8000, "gpt-3.5-turbo": 2000}
+SCHEMA_TOKEN_BUDGETS: Dict[str, int] = json.loads(os.getenv("SCHEMA_TOKEN_BUDGETS") or "{}")
+# (database, schema version, model) encodings kept in memory
+SCHEMA_ENCODING_CACHE = int(os.getenv("SCHEMA_ENCODING_CACHE", "256"))
+
+# degradation steps, in order; a prompt gets the first one that fits
+LEVELS = ("full", "untyped", "pruned_columns", "pruned_tables")
+
+_WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def schema_budget(model: Optional[str] = None) -> int:
+    if model:
+        matches = [k for k in SCHEMA_TOKEN_BUDGETS if model.startswith(k)]
+        if matches:
+            return int(SCHEMA_TOKEN_BUDGETS[max(matches, key=len)])
+    return SCHEMA_TOKEN_BUDGET
+
+
+def _terms(text: str) -> Set[str]:
+    """Lower-case word stems of a question or identifier ("InvoiceLines" → invoice, line)."""
+    words = (w.lower() for w in _WORD.findall(text or ""))
+    return {w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words if len(w) > 1}
+
+
+class _Encoded:
+    """Per-table lines of one schema version, with their token counts."""
+
+    __slots__ = ("full", "untyped", "column_terms", "table_terms")
+
+    def __init__(self):
+        self.full: Dict[str, Tuple[str, int]] = {}
+        self.untyped: Dict[str, Tuple[str, int]] = {}
+        self.column_terms: Dict[str, Dict[str, Set[str]]] = {}
+        self.table_terms: Dict[str, Set[str]] = {}
+
+
+class SchemaEncoder:
+    """
+    Renders the tables of a snapshot for a prompt within a token budget.
+
+    Tables use the compact ``Table(col TYPE pk, col→Other.col)`` form. Over
+    budget, the output degrades step by step: column types are dropped,
+    then columns unrelated to the question (keys and join columns stay),
+    then the least relevant tables. Per-table lines and their token counts
+    are cached per (database, schema fingerprint, model).
+    """
+
+    def __init__(self, maxsize: int = SCHEMA_ENCODING_CACHE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str, str], _Encoded]" = OrderedDict()
+        self._stats = {"encodes": 0, "cache_hits": 0, "cache_misses": 0, **{level: 0 for level in LEVELS}}
+
+    def _encoded(self, snapshot: SchemaSnapshot, model: Optional[str]) -> _Encoded:
+        key = (snapshot.db_path, snapshot.fingerprint, model or "")
+        with self._lock:
+            encoded = self._cache.get(key)
+            if encoded is not None:
+                self._cache.move_to_end(key)
+                self._stats["cache_hits"] += 1
+                return encoded
+            encoded = self._cache[key] = _Encoded()
+            self._stats["cache_misses"] += 1
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return encoded
+
+    def _line(self, encoded: _Encoded, snapshot: SchemaSnapshot, name: str,
+              types: bool, model: Optional[str]) -> Tuple[str, int]:
+        lines = encoded.full if types else encoded.untyped
+        line = lines.get(name)
+        if line is None:
+            text = render_table(snapshot.tables[name], types=types, schemas=snapshot.schemas)
+            line = lines[name] = (text, count_tokens(text, model))
+        return line
+
+    def _column_terms(self, encoded: _Encoded, table: TableInfo) -> Dict[str, Set[str]]:
+        terms = encoded.column_terms.get(table.name)
+        if terms is None:
+            terms = encoded.column_terms[table.name] = {c.name: _terms(c.name) for c in table.columns}
+        return terms
+
+    def _table_terms(self, encoded: _Encoded, name: str) -> Set[str]:
+        terms = encoded.table_terms.get(name)
+        if terms is None:
+            terms = encoded.table_terms[name] = _terms(name.rpartition(".")[2])
+        return terms
+
+    @staticmethod
+    def _fits(costs: Iterable[int], budget: int) -> bool:
+        costs = list(costs)
+        return sum(costs) + max(0, len(costs) - 1) <= budget  # + one newline per line
+
+    def encode(
+        self,
+        snapshot: SchemaSnapshot,
+        tables: Optional[Sequence[str]] = None,
+        question: str = "",
+        model: Optional[str] = None,
+        budget: Optional[int] = None,
+        keep: Sequence[str] = (),
+    ) -> str:
+        """
+        Prompt text for ``tables`` (all when None), given in relevance order.
+        Tables in ``keep`` (e.g. those the failing SQL references) are never
+        dropped.
+        """
+        names = [t for t in (tables if tables is not None else snapshot.tables) if t in snapshot.tables]
+        budget = schema_budget(model) if budget is None else budget
+        encoded = self._encoded(snapshot, model)
+
+        # 1. full, 2. without column types — both independent of the question
+        for level, types in (("full", True), ("untyped", False)):
+            lines = [self._line(encoded, snapshot, t, types, model) for t in names]
+            if budget <= 0 or self._fits((cost for _, cost in lines), budget):
+                self._count(level)
+                return "\n".join(text for text, _ in lines)
+
+        # 3. only keys, join columns and columns the question mentions
+        wanted = _terms(question)
+        joined: Dict[str, Set[str]] = {}
+        for t in names:
+            for fk in snapshot.tables[t].foreign_keys:
+                if fk.ref_column:
+                    joined.setdefault(fk.ref_table, set()).add(fk.ref_column)
+        pruned: List[Tuple[str, str, int]] = []
+        for t in names:
+            table = snapshot.tables[t]
+            fk_cols = {fk.column for fk in table.foreign_keys}
+            columns = {
+                name for name, terms in self._column_terms(encoded, table).items()
+                if name in fk_cols or terms & wanted
+            }
+            columns.update(c.name for c in table.columns if c.pk)
+            columns.update(joined.get(t, ()))
+            text = render_table(table, types=False, columns=columns, schemas=snapshot.schemas)
+            pruned.append((t, text, count_tokens(text, model)))
+        if self._fits((cost for _, _, cost in pruned), budget):
+            self._count("pruned_columns")
+            return "\n".join(text for _, text, _ in pruned)
+
+        # 4. drop whole tables, least relevant first: question overlap, then the given order
+        rank = {t: i for i, t in enumerate(names)}
+        relevance = {
+            t: len(wanted & self._table_terms(encoded, t)) * 2
+            + sum(bool(terms & wanted) for terms in self._column_terms(encoded, snapshot.tables[t]).values())
+            for t in names
+        }
+        order = sorted(names, key=lambda t: (t not in keep, -relevance[t], rank[t]))
+        costs = {t: cost for t, _, cost in pruned}
+        kept = list(order)
+        note = 0
+        while len(kept) > 1 and kept[-1] not in keep:
+            omitted = len(names) - len(kept)
+            note = count_tokens(f"… {omitted} more tables omitted", model) + 1 if omitted else 0
+            if self._fits((costs[t] for t in kept), budget - note):
+                break
+            kept.pop()
+        self._count("pruned_tables")
+        texts = {t: text for t, text, _ in pruned}
+        lines = [texts[t] for t in sorted(kept, key=rank.get)]
+        if len(kept) < len(names):
+            lines.append(f"… {len(names) - len(kept)} more tables omitted")
+        return "\n".join(lines)
+
+    def _count(self, level: str):
+        with self._lock:
+            self._stats["encodes"] += 1
+            self._stats[level] += 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "cached_schemas": len(self._cache)}
+
+
+# ----------------------------------------------------------------------
+# PROCESS-WIDE ENCODER
+# ----------------------------------------------------------------------
+_encoder: Optional[SchemaEncoder] = None
+_encoder_lock = threading.Lock()
+
+
+def get_schema_encoder() -> SchemaEncoder:
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = SchemaEncoder()
+    return _encoder
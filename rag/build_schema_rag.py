@@ -1,5 +1,6 @@
 import sys
 import os
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -8,45 +9,31 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
 sys.path.append(PROJECT_ROOT)
 
 from loaders.db_loader import DatabaseManager
-from rag.schema_loader import SchemaRAG
+from rag.index_builder import IncrementalIndexBuilder
 
-dbm = DatabaseManager()
-rag = SchemaRAG()
-
-print("\n🔍 Building schema RAG index...\n")
-
-for db_name in dbm.list_databases():
-    print(f"[BUILD] Extracting schema for: {db_name}")
-
-    db = dbm.load_database(db_name)
-    schema_text = db.get_table_info()
-
-    rag.build_schema_index(db_name, schema_text)
-
-print("\n🎉 DONE — All schemas indexed!")
-import sys
-import os
-from dotenv import load_dotenv
-load_dotenv()
-
-# Allow project-wide imports
-PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
-sys.path.append(PROJECT_ROOT)
-
-from loaders.db_loader import DatabaseManager
-from rag.schema_loader import SchemaRAG
+# --full re-embeds every table even if its DDL hash is unchanged
+full = "--full" in sys.argv
 
 dbm = DatabaseManager()
-rag = SchemaRAG()
+builder = IncrementalIndexBuilder()
 
 print("\n🔍 Building schema RAG index...\n")
 
-for db_name in dbm.list_databases():
-    print(f"[BUILD] Extracting schema for: {db_name}")
-
-    db = dbm.load_database(db_name)
-    schema_text = db.get_table_info()
-
-    rag.build_schema_index(db_name, schema_text)
-
-print("\n🎉 DONE — All schemas indexed!")
+start = time.perf_counter()
+databases = {
+    db_name: os.path.join(dbm.base_path, db_name)
+    for db_name in dbm.list_databases()
+}
+for report in builder.build_all(databases, full=full, prune=True):
+    if "error" in report:
+        print(f"[FAIL] {report['db']}: {report['error']}")
+    elif report.get("removed"):
+        print(f"[DROP] {report['db']}: database removed")
+    else:
+        print(
+            f"[BUILD] {report['db']}: {report['tables']} tables, "
+            f"{report['embedded']} embedded, {report['dropped']} dropped"
+        )
+
+elapsed = time.perf_counter() - start
+print(f"\n🎉 DONE — All schemas indexed! ({elapsed:.1f}s)" if databases else "\n🎉 DONE — nothing to index")
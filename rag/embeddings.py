@@ -0,0 +1,134 @@
+# rag/embeddings.py
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# "openai" | "huggingface" | "hashing"
+DEFAULT_BACKEND = os.getenv("SCHEMA_EMBEDDINGS", "openai")
+
+
+def split_identifiers(text: str) -> List[str]:
+    """'OrderDetails.unit_price' → ['order', 'details', 'unit', 'price']"""
+    words = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", text)
+    return [w.lower() for w in words]
+
+
+class HashingEmbeddings:
+    """
+    Offline, deterministic embeddings: identifier-aware tokens hashed into a
+    fixed-size signed bag of words. No model download, no network — meant for
+    tests and air-gapped runs, not for semantic quality.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _tokens(self, text: str) -> List[str]:
+        tokens = []
+        for w in split_identifiers(text):
+            tokens.append(w)
+            if len(w) > 3 and w.endswith("s"):
+                tokens.append(w[:-1])  # crude singular
+        return tokens
+
+    def _embed(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for tok in self._tokens(text):
+            h = int.from_bytes(hashlib.md5(tok.encode("utf-8")).digest()[:8], "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        if norm:
+            vec /= norm
+        return vec.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class CachedEmbeddings:
+    """Wraps an embedding backend with an LRU over embed_query, so a repeated
+    question is embedded once for routing and table retrieval alike."""
+
+    def __init__(self, inner, maxsize: int = 2048):
+        self.inner = inner
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = " ".join(text.lower().split())
+        with self._lock:
+            vec = self._queries.get(key)
+            if vec is not None:
+                self._queries.move_to_end(key)
+                self._stats["hits"] += 1
+                return vec
+            self._stats["misses"] += 1
+
+        vec = self.inner.embed_query(text)
+        with self._lock:
+            self._queries[key] = vec
+            while len(self._queries) > self.maxsize:
+                self._queries.popitem(last=False)
+        return vec
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "size": len(self._queries)}
+
+
+def _make_backend(backend: str):
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings()
+    if backend == "huggingface":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+        )
+    if backend == "hashing":
+        return HashingEmbeddings()
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+_shared: Dict[str, CachedEmbeddings] = {}
+_shared_lock = threading.Lock()
+
+
+def get_embeddings(backend: str = None) -> CachedEmbeddings:
+    """
+    Process-wide embedding backend for schema retrieval (SCHEMA_EMBEDDINGS
+    env var), with a query-embedding LRU in front of it.
+    """
+    backend = (backend or DEFAULT_BACKEND).lower()
+    with _shared_lock:
+        emb = _shared.get(backend)
+        if emb is None:
+            emb = CachedEmbeddings(
+                _make_backend(backend),
+                maxsize=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048")),
+            )
+            _shared[backend] = emb
+        return emb
+
+
+def shared_backend(embeddings) -> Optional[str]:
+    """Backend name if ``embeddings`` is the shared get_embeddings() instance
+    of that backend, else None (ad-hoc instances, test stubs)."""
+    with _shared_lock:
+        for backend, emb in _shared.items():
+            if emb is embeddings:
+                return backend
+    return None
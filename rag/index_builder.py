@@ -0,0 +1,200 @@
+# rag/index_builder.py
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from loaders.schema_catalog import SchemaSnapshot, TableInfo, get_schema_catalog
+from rag.embeddings import DEFAULT_BACKEND, get_embeddings
+from rag.table_index import table_document
+
+MANIFEST_NAME = "manifest.json"
+SCHEMA_INDEX_ROOT = os.path.join(os.path.dirname(os.path.dirname(__file__)), "rag_store", "schema_index")
+
+
+def table_hash(table: TableInfo) -> str:
+    """Content hash of a table's DDL (falls back to its rendered document)."""
+    content = table.sql or table_document(table)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+class IncrementalIndexBuilder:
+    """
+    Keeps rag_store/schema_index in sync with the databases, one vector per
+    table. A manifest of per-table DDL hashes lives next to the per-database
+    Chroma stores; only added or changed tables are re-embedded (in batches)
+    and vectors of dropped tables are deleted. Databases are processed in
+    parallel on a bounded thread pool.
+    """
+
+    def __init__(
+        self,
+        persist_root: str = SCHEMA_INDEX_ROOT,
+        backend: str = None,
+        embeddings=None,
+        batch_size: int = 64,
+        max_workers: int = 4,
+    ):
+        self.persist_root = persist_root
+        self.backend = (backend or DEFAULT_BACKEND).lower()
+        self.emb = embeddings or get_embeddings(self.backend)
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # MANIFEST
+    # ------------------------------------------------------------------
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.persist_root, MANIFEST_NAME)
+
+    def load_manifest(self) -> Dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {"backend": self.backend, "databases": {}}
+        if manifest.get("backend") != self.backend:
+            # vectors from another embedding model are useless → rebuild all
+            return {"backend": self.backend, "databases": {}}
+        return manifest
+
+    def _save_manifest(self, manifest: Dict):
+        os.makedirs(self.persist_root, exist_ok=True)
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    # ------------------------------------------------------------------
+    # PER DATABASE
+    # ------------------------------------------------------------------
+    def _store(self, db_name: str):
+        from langchain_community.vectorstores import Chroma
+
+        path = os.path.join(self.persist_root, db_name)
+        os.makedirs(path, exist_ok=True)
+        return Chroma(persist_directory=path, embedding_function=self.emb)
+
+    def build_database(self, db_name: str, db_path: str, previous: Dict[str, str]) -> Dict:
+        snapshot = get_schema_catalog().get(db_path)
+        hashes = {name: table_hash(t) for name, t in snapshot.tables.items()}
+
+        changed = [t for t, h in hashes.items() if previous.get(t) != h]
+        dropped = [t for t in previous if t not in hashes]
+        report = {
+            "db": db_name,
+            "tables": len(hashes),
+            "embedded": len(changed),
+            "dropped": len(dropped),
+            "hashes": hashes,
+        }
+        if not changed and not dropped:
+            return report  # nothing to do; the store is not even opened
+
+        store = self._store(db_name)
+        if dropped:
+            store.delete(ids=dropped)
+        for i in range(0, len(changed), self.batch_size):
+            batch = changed[i:i + self.batch_size]
+            # add_texts embeds the whole batch in one embed_documents call
+            # and upserts by id, so changed tables replace their old vector
+            store.add_texts(
+                texts=[table_document(snapshot.tables[t]) for t in batch],
+                metadatas=[{"db": db_name, "table": t, "hash": hashes[t]} for t in batch],
+                ids=batch,
+            )
+        return report
+
+    def stored_vectors(self, db_name: str, snapshot: SchemaSnapshot) -> Dict[str, List[float]]:
+        """
+        Persisted vectors of the tables whose DDL hash is unchanged since the
+        last build, keyed by table name. Tables that are new or changed are
+        left out for the caller to embed.
+        """
+        known = self.load_manifest()["databases"].get(db_name, {})
+        wanted = {}
+        for name, table in snapshot.tables.items():
+            digest = table_hash(table)
+            if known.get(name) == digest:
+                wanted[name] = digest
+        if not wanted or not os.path.isdir(os.path.join(self.persist_root, db_name)):
+            return {}
+
+        found = self._store(db_name).get(ids=list(wanted), include=["embeddings", "metadatas"])
+        vectors = {}
+        for name, vector, meta in zip(found["ids"], found["embeddings"], found["metadatas"]):
+            # the per-vector hash guards against a manifest newer than the store
+            if (meta or {}).get("hash") == wanted.get(name):
+                vectors[name] = vector
+        return vectors
+
+    # ------------------------------------------------------------------
+    # ALL DATABASES
+    # ------------------------------------------------------------------
+    def build_all(self, databases: Dict[str, str], full: bool = False, prune: bool = False) -> List[Dict]:
+        """
+        databases: {db_name: db_path}. Returns one report per database.
+        full re-embeds everything; prune treats ``databases`` as the complete
+        set and removes stores of databases that no longer exist.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            manifest = self.load_manifest()
+            if full:
+                manifest["databases"] = {}
+                for db in databases:
+                    shutil.rmtree(os.path.join(self.persist_root, db), ignore_errors=True)
+            known = manifest["databases"]
+
+            workers = max(1, min(self.max_workers, len(databases)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    db: pool.submit(self.build_database, db, path, known.get(db, {}))
+                    for db, path in databases.items()
+                }
+
+            reports = []
+            for db, future in futures.items():
+                try:
+                    report = future.result()
+                except Exception as e:
+                    # keep the old manifest entry so the next run retries it
+                    reports.append({"db": db, "error": str(e)})
+                    continue
+                known[db] = report.pop("hashes")
+                reports.append(report)
+
+            if prune:
+                for db in [d for d in known if d not in databases]:
+                    del known[db]
+                    shutil.rmtree(os.path.join(self.persist_root, db), ignore_errors=True)
+                    reports.append({"db": db, "removed": True})
+            self._save_manifest(manifest)
+
+        elapsed = time.perf_counter() - start
+        for report in reports:
+            report["elapsed_s"] = round(elapsed, 3)
+        return reports
+
+
+# ----------------------------------------------------------------------
+# PROCESS-WIDE BUILDERS (one per embedding backend)
+# ----------------------------------------------------------------------
+_builders: Dict[str, IncrementalIndexBuilder] = {}
+_builders_lock = threading.Lock()
+
+
+def get_index_builder(backend: str = None) -> IncrementalIndexBuilder:
+    backend = (backend or DEFAULT_BACKEND).lower()
+    with _builders_lock:
+        builder = _builders.get(backend)
+        if builder is None:
+            builder = IncrementalIndexBuilder(backend=backend)
+            _builders[backend] = builder
+        return builder
@@ -1,15 +1,20 @@
 # rag/retriever.py
 import os
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 
+from rag.embeddings import get_embeddings
+from rag.index_builder import SCHEMA_INDEX_ROOT
+from rag.router_index import RouteResult, get_router_index
+
 ROOT = os.path.dirname(os.path.dirname(__file__))
-SCHEMA_INDEX_ROOT = os.path.join(ROOT, "rag_store", "schema_index")
+DATABASES_ROOT = os.path.join(ROOT, "databases")
 
 class SchemaRetriever:
-    def __init__(self, index_root=SCHEMA_INDEX_ROOT):
+    def __init__(self, index_root=SCHEMA_INDEX_ROOT, embeddings=None, db_root=DATABASES_ROOT):
         self.index_root = index_root
-        self.emb = OpenAIEmbeddings()
+        self.db_root = db_root
+        self.emb = embeddings or get_embeddings()
+        self.router_index = get_router_index(self.emb)
 
     def _index_path(self, db_name):
         return os.path.join(self.index_root, db_name)
@@ -19,18 +24,14 @@ class SchemaRetriever:
         vect = Chroma(persist_directory=path, embedding_function=self.emb)
         return vect.as_retriever(search_kwargs={"k": k})
 
+    def rank_databases(self, query, db_list) -> RouteResult:
+        """All candidate databases scored in one vectorized pass, best first."""
+        paths = {
+            db: os.path.join(self.db_root, db)
+            for db in db_list
+            if os.path.exists(os.path.join(self.db_root, db))
+        }
+        return self.router_index.rank(query, paths)
+
     def best_match_db(self, query, db_list):
-        best_db = None
-        best_score = -1e9
-        for db in db_list:
-            path = self._index_path(db)
-            if not os.path.exists(path):
-                continue
-            vect = Chroma(persist_directory=path, embedding_function=self.emb)
-            res = vect.similarity_search_with_score(query, k=1)
-            if res:
-                score = res[0][1]
-                if score > best_score:
-                    best_score = score
-                    best_db = db
-        return best_db
+        return self.rank_databases(query, db_list).best
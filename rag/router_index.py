@@ -0,0 +1,135 @@
+# rag/router_index.py
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from loaders.schema_catalog import get_schema_catalog
+from rag.table_index import get_table_index
+
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.05"))
+ROUTER_REFRESH_SECONDS = float(os.getenv("ROUTER_REFRESH_SECONDS", "30"))
+# weight of the best-matching table vs. the whole-database centroid
+ROUTER_TABLE_WEIGHT = 0.7
+
+
+class RouteResult:
+    def __init__(self, ranked: List[Tuple[str, float]]):
+        self.ranked = ranked  # [(db_name, score)], best first
+
+    @property
+    def best(self) -> Optional[str]:
+        return self.ranked[0][0] if self.ranked else None
+
+    @property
+    def margin(self) -> float:
+        """Score gap between the top two candidates (1.0 if only one)."""
+        if len(self.ranked) < 2:
+            return 1.0 if self.ranked else 0.0
+        return self.ranked[0][1] - self.ranked[1][1]
+
+    @property
+    def ambiguous(self) -> bool:
+        return self.margin < ROUTER_MIN_MARGIN
+
+    def __repr__(self):
+        return f"RouteResult(best={self.best!r}, margin={self.margin:.3f})"
+
+
+class RouterIndex:
+    """
+    Every database's table vectors stacked into one normalized matrix, plus
+    one centroid row per database. A query is embedded once and scored
+    against all databases with a single matrix product.
+    """
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self._lock = threading.Lock()
+        self._paths: Dict[str, str] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self._checked_at = 0.0
+
+        self.db_names: List[str] = []
+        self.table_matrix = np.zeros((0, 0), dtype=np.float32)
+        self.owners = np.zeros(0, dtype=np.int64)  # row → index into db_names
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+
+    # ------------------------------------------------------------------
+    # BUILD
+    # ------------------------------------------------------------------
+    def _current_fingerprints(self, paths: Dict[str, str]) -> Dict[str, str]:
+        catalog = get_schema_catalog()
+        return {db: catalog.get(path).fingerprint for db, path in paths.items()}
+
+    def _build(self, paths: Dict[str, str]):
+        catalog = get_schema_catalog()
+        names, blocks, owners, centroids = [], [], [], []
+        for db, path in sorted(paths.items()):
+            index = get_table_index(catalog.get(path), self.embeddings)
+            if not index.tables:
+                continue
+            i = len(names)
+            names.append(db)
+            blocks.append(index.matrix)
+            owners.append(np.full(len(index.tables), i, dtype=np.int64))
+            centroid = index.matrix.mean(axis=0)
+            n = np.linalg.norm(centroid)
+            centroids.append(centroid / n if n else centroid)
+
+        self.db_names = names
+        if names:
+            self.table_matrix = np.vstack(blocks)
+            self.owners = np.concatenate(owners)
+            self.centroids = np.vstack(centroids)
+
+    def ensure(self, paths: Dict[str, str]):
+        """(Re)build when the database set or any schema fingerprint changed."""
+        with self._lock:
+            now = time.monotonic()
+            fresh = paths == self._paths and now - self._checked_at < ROUTER_REFRESH_SECONDS
+            if fresh:
+                return
+            fingerprints = self._current_fingerprints(paths)
+            if paths != self._paths or fingerprints != self._fingerprints:
+                self._build(paths)
+                self._paths = dict(paths)
+                self._fingerprints = fingerprints
+            self._checked_at = now
+
+    # ------------------------------------------------------------------
+    # SCORING
+    # ------------------------------------------------------------------
+    def rank(self, query: str, paths: Dict[str, str]) -> RouteResult:
+        self.ensure(paths)
+        if not self.db_names:
+            return RouteResult([])
+
+        q = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        n = np.linalg.norm(q)
+        if n:
+            q = q / n
+
+        table_sims = self.table_matrix @ q
+        best_table = np.full(len(self.db_names), -np.inf, dtype=np.float32)
+        np.maximum.at(best_table, self.owners, table_sims)
+        scores = ROUTER_TABLE_WEIGHT * best_table + (1 - ROUTER_TABLE_WEIGHT) * (self.centroids @ q)
+
+        order = np.argsort(-scores)
+        return RouteResult([(self.db_names[i], float(scores[i])) for i in order])
+
+
+_router_indexes: Dict[int, RouterIndex] = {}
+_router_lock = threading.Lock()
+
+
+def get_router_index(embeddings) -> RouterIndex:
+    """One router index per embedding backend, shared by the whole process."""
+    with _router_lock:
+        index = _router_indexes.get(id(embeddings))
+        if index is None:
+            index = RouterIndex(embeddings)
+            _router_indexes[id(embeddings)] = index
+        return index
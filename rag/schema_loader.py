@@ -3,19 +3,20 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from rag.embeddings import get_embeddings
+from rag.index_builder import SCHEMA_INDEX_ROOT, IncrementalIndexBuilder
 
 class SchemaRAG:
-    def __init__(self, persist_root="rag_store/schema_index"):
+    def __init__(self, persist_root=SCHEMA_INDEX_ROOT, embeddings=None):
         self.persist_root = persist_root
-        self.emb = OpenAIEmbeddings()
-        self.splitter = RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=200)
+        self.emb = embeddings or get_embeddings()
+        self.builder = IncrementalIndexBuilder(persist_root, embeddings=self.emb)
 
-    def build_schema_index(self, db_name: str, schema_text: str):
-        chunks = self.splitter.split_text(schema_text)
+    def build_schema_index(self, db_name: str, db_path: str):
+        """One document per table (columns + foreign keys), id = table name.
+        Only tables whose DDL changed since the last build are re-embedded."""
+        (report,) = self.builder.build_all({db_name: db_path})
+        if "error" in report:
+            raise RuntimeError(report["error"])
         path = os.path.join(self.persist_root, db_name)
-        os.makedirs(path, exist_ok=True)
-        Chroma.from_texts(texts=chunks, embedding=self.emb, persist_directory=path)
-        print(f"[ok] indexed schema -> {path}")
+        print(f"[ok] indexed {report['tables']} tables ({report['embedded']} re-embedded) -> {path}")
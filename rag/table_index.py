@@ -0,0 +1,145 @@
+# rag/table_index.py
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from loaders.schema_catalog import SchemaSnapshot, TableInfo
+
+SCHEMA_TOP_K = int(os.getenv("SCHEMA_TOP_K", "6"))
+# databases with at most this many tables always get the full schema
+SCHEMA_FULL_THRESHOLD = int(os.getenv("SCHEMA_FULL_THRESHOLD", "15"))
+
+
+def table_document(table: TableInfo) -> str:
+    """One retrieval document per table: name, columns and foreign keys."""
+    cols = ", ".join(f"{c.name} ({c.type})" for c in table.columns)
+    lines = [f"Table: {table.name}", f"Columns: {cols}"]
+    if table.foreign_keys:
+        fks = ", ".join(
+            f"{fk.column} -> {fk.ref_table}.{fk.ref_column or '?'}"
+            for fk in table.foreign_keys
+        )
+        lines.append(f"Foreign keys: {fks}")
+    return "\n".join(lines)
+
+
+def fk_neighbours(snapshot: SchemaSnapshot) -> Dict[str, Set[str]]:
+    """Undirected FK adjacency between tables that exist in the snapshot."""
+    graph: Dict[str, Set[str]] = {name: set() for name in snapshot.tables}
+    for name, table in snapshot.tables.items():
+        for fk in table.foreign_keys:
+            ref = snapshot.table(fk.ref_table)
+            if ref is not None and ref.name != name:
+                graph[name].add(ref.name)
+                graph[ref.name].add(name)
+    return graph
+
+
+class TableIndex:
+    """Table-granular embedding index of one schema snapshot."""
+
+    def __init__(
+        self,
+        snapshot: SchemaSnapshot,
+        embeddings,
+        vectors: Optional[np.ndarray] = None,
+        stored: Optional[Dict[str, List[float]]] = None,
+    ):
+        """stored: already-computed vectors by table name; only the other
+        tables are embedded."""
+        self.snapshot = snapshot
+        self.embeddings = embeddings
+        self.tables: List[str] = list(snapshot.tables)
+        self.neighbours = fk_neighbours(snapshot)
+        self.reused = 0
+
+        if vectors is None:
+            stored = stored or {}
+            missing = [t for t in self.tables if t not in stored]
+            fresh = {}
+            if missing:
+                docs = [table_document(snapshot.tables[t]) for t in missing]
+                fresh = dict(zip(missing, embeddings.embed_documents(docs)))
+            self.reused = len(self.tables) - len(missing)
+            vectors = np.asarray(
+                [stored[t] if t in stored else fresh[t] for t in self.tables], dtype=np.float32
+            )
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = vectors / norms
+
+    def scores(self, query_vector) -> np.ndarray:
+        q = np.asarray(query_vector, dtype=np.float32)
+        n = np.linalg.norm(q)
+        return self.matrix @ (q / n if n else q)
+
+    def search(self, question: str, k: int = SCHEMA_TOP_K) -> List[Tuple[str, float]]:
+        if not self.tables:
+            return []
+        sims = self.scores(self.embeddings.embed_query(question))
+        top = np.argsort(-sims)[:k]
+        return [(self.tables[i], float(sims[i])) for i in top]
+
+    def select_tables(self, question: str, k: int = SCHEMA_TOP_K) -> List[str]:
+        """Top-k tables for the question plus their one-hop FK neighbours."""
+        selected = [name for name, _ in self.search(question, k)]
+        seen = set(selected)
+        for name in list(selected):
+            for other in sorted(self.neighbours.get(name, ())):
+                if other not in seen:
+                    seen.add(other)
+                    selected.append(other)
+        return selected
+
+
+# ----------------------------------------------------------------------
+# PROCESS-WIDE CACHE (one index per database + schema fingerprint)
+# ----------------------------------------------------------------------
+_indexes: Dict[str, Tuple[str, TableIndex]] = {}
+_build_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def _fresh(snapshot: SchemaSnapshot, embeddings) -> Optional[TableIndex]:
+    cached = _indexes.get(snapshot.db_path)
+    if cached and cached[0] == snapshot.fingerprint and cached[1].embeddings is embeddings:
+        return cached[1]
+    return None
+
+
+def _stored_vectors(snapshot: SchemaSnapshot, embeddings) -> Dict[str, List[float]]:
+    """Vectors rag/build_schema_rag.py persisted for this database's unchanged
+    tables. Only usable when ``embeddings`` is the shared backend they were
+    built with."""
+    from rag.embeddings import shared_backend
+    from rag.index_builder import get_index_builder  # index_builder imports this module
+
+    backend = shared_backend(embeddings)
+    if backend is None:
+        return {}
+    try:
+        return get_index_builder(backend).stored_vectors(os.path.basename(snapshot.db_path), snapshot)
+    except Exception:
+        # no chromadb or no readable store: embed from scratch
+        return {}
+
+
+def get_table_index(snapshot: SchemaSnapshot, embeddings) -> TableIndex:
+    with _lock:
+        index = _fresh(snapshot, embeddings)
+        if index is not None:
+            return index
+        build_lock = _build_locks.setdefault(snapshot.db_path, threading.Lock())
+
+    # one build per database: concurrent first requests wait for it instead
+    # of embedding the same tables in parallel
+    with build_lock:
+        with _lock:
+            index = _fresh(snapshot, embeddings)
+        if index is None:
+            index = TableIndex(snapshot, embeddings, stored=_stored_vectors(snapshot, embeddings))
+            with _lock:
+                _indexes[snapshot.db_path] = (snapshot.fingerprint, index)
+    return index
@@ -5,9 +5,13 @@ from rag.retriever import SchemaRetriever
 class DBRouter:
     def __init__(self):
         self.dbm = DatabaseManager()
-        self.retriever = SchemaRetriever()
+        self.retriever = SchemaRetriever(db_root=self.dbm.base_path)
+        # RouteResult of the last similarity fallback; .ambiguous / .margin
+        # tell callers when the top candidates were too close to call
+        self.last_route = None
 
     def route(self, query: str):
+        self.last_route = None
         # explicit mention
         q = query.lower()
         for db in self.dbm.list_databases():
@@ -24,5 +28,7 @@ class DBRouter:
                 return dbs[0]
         # fallback to RAG similarity
         dbs = self.dbm.list_databases()
-        best = self.retriever.best_match_db(query, dbs)
+        result = self.retriever.rank_databases(query, dbs)
+        self.last_route = result
+        best = result.best
         return best if best else (dbs[0] if dbs else None)
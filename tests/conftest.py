@@ -0,0 +1,46 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# per-query JSON trace lines are noise in test output
+os.environ.setdefault("TRACE_LOG_LEVEL", "WARNING")
+
+from benchmarks import scenarios
+from benchmarks.synthetic import generate_database
+
+
+@pytest.fixture(scope="session")
+def db_dir(tmp_path_factory):
+    """Two synthetic databases: small.db (full schema in prompts) and wide.db
+    (above SCHEMA_FULL_THRESHOLD, so prompts are pruned)."""
+    path = tmp_path_factory.mktemp("databases")
+    generate_database(str(path / "small.db"), tables=6, columns=6, rows=200)
+    generate_database(str(path / "wide.db"), tables=40, columns=8, rows=20)
+    return str(path)
+
+
+@pytest.fixture
+def agent(db_dir):
+    """MultiDBAgent over the synthetic databases with the offline stub LLM."""
+    return scenarios.make_agent(db_dir, latency_s=0)
+
+
+def drain(steps, answer=None):
+    """Drive a pipeline generator by hand, returning every yielded step.
+    Blocking steps are executed; LLM calls get ``answer``."""
+    from agent.sql_agent import Blocking
+
+    yielded, value = [], None
+    try:
+        while True:
+            step = steps.send(value)
+            yielded.append(step)
+            value = step.fn(*step.args) if isinstance(step, Blocking) else answer
+    except StopIteration as stop:
+        return yielded, stop.value
@@ -0,0 +1,72 @@
+# tests/test_async_agent.py
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from agent import registry
+from agent.llm_limiter import LLMBusy
+from benchmarks import scenarios
+from benchmarks.scenarios import BROKEN_QUESTION, FIXED_SQL, T0, T2, WORKLOAD
+
+
+@pytest.fixture
+def client(agent):
+    from web.fastapi_app import app
+
+    registry.set_agent(agent)
+    yield TestClient(app)
+    registry.reset_agents()
+
+
+def test_async_path_matches_sync(agent):
+    question = f"list {T2} names"
+    sync = agent.run_user_query(question, explicit_db="small.db")
+    agent.sql_cache.clear()
+    agent.result_cache.clear()
+    result = asyncio.run(agent.arun_user_query(question, explicit_db="small.db"))
+    assert result["sql"] == sync["sql"]
+    assert result["sql"].startswith(WORKLOAD[question])
+    assert result["rows"] == sync["rows"]
+
+
+def test_async_repair_round_trip(agent):
+    result = asyncio.run(agent.arun_user_query(BROKEN_QUESTION, explicit_db="small.db"))
+    assert result["sql"].startswith(FIXED_SQL)
+
+
+def test_concurrent_requests_share_the_event_loop(db_dir):
+    agent = scenarios.make_agent(db_dir, latency_s=0.2)
+    questions = [q for q in WORKLOAD if q.startswith(("count", "list"))] * 4
+
+    async def run_all():
+        return await asyncio.gather(
+            *(agent.arun_user_query(q, explicit_db="small.db") for q in questions)
+        )
+
+    start = time.perf_counter()
+    results = asyncio.run(run_all())
+    elapsed = time.perf_counter() - start
+
+    assert all(isinstance(r, dict) for r in results)
+    # serial would be len(questions) * 0.2s; identical prompts are coalesced too
+    assert elapsed < len(questions) * 0.2 / 2
+
+
+def test_query_route_runs_the_async_agent(client):
+    response = client.post("/query", json={"query": f"count {T0} rows", "explicit_db": "small.db"})
+    assert response.status_code == 200
+    result = response.json()["result"]
+    assert result["rows"] == [[200]]
+    assert response.headers["X-Request-ID"]
+
+
+def test_shed_requests_answer_503(client, agent, monkeypatch):
+    async def busy(*args, **kwargs):
+        raise LLMBusy("queue full", retry_after=3)
+
+    monkeypatch.setattr(agent, "arun_user_query", busy)
+    response = client.post("/query", json={"query": "anything"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
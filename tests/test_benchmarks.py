@@ -0,0 +1,78 @@
+# tests/test_benchmarks.py
+import sqlite3
+
+from benchmarks import scenarios
+from benchmarks.run import compare
+from benchmarks.scenarios import BROKEN_QUESTION, BROKEN_SQL, FIXED_SQL, T0, WORKLOAD
+from benchmarks.stubs import StubChatModel
+from benchmarks.synthetic import generate_corpus, generate_database, table_name
+
+
+def _dump(path):
+    conn = sqlite3.connect(path)
+    try:
+        tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")]
+        return {t: conn.execute(f'SELECT * FROM "{t}" ORDER BY 1').fetchall() for t in tables}
+    finally:
+        conn.close()
+
+
+def test_synthetic_databases_are_deterministic(tmp_path):
+    a = generate_database(str(tmp_path / "a.db"), tables=5, columns=4, rows=30, seed=7)
+    b = generate_database(str(tmp_path / "b.db"), tables=5, columns=4, rows=30, seed=7)
+    assert _dump(a) == _dump(b)
+
+
+def test_synthetic_tables_form_a_foreign_key_tree(tmp_path):
+    path = generate_database(str(tmp_path / "fk.db"), tables=6, columns=4, rows=10)
+    conn = sqlite3.connect(path)
+    fks = conn.execute(f'PRAGMA foreign_key_list("{table_name(5)}")').fetchall()
+    columns = [r[1] for r in conn.execute(f'PRAGMA table_info("{table_name(5)}")')]
+    conn.close()
+    assert [(fk[2], fk[3]) for fk in fks] == [(table_name(1), f"{table_name(1)}_id")]
+    assert columns[:2] == ["id", f"{table_name(1)}_id"]
+    assert len(columns) == 2 + 4
+
+
+def test_corpus_files_are_reused(tmp_path):
+    first = generate_corpus(str(tmp_path), ["small"])
+    mtime = (tmp_path / "small.db").stat().st_mtime_ns
+    assert generate_corpus(str(tmp_path), ["small"]) == first
+    assert (tmp_path / "small.db").stat().st_mtime_ns == mtime
+
+
+def test_stub_llm_answers_generation_and_repair_prompts():
+    llm = scenarios.make_stub_llm(latency_s=0)
+    assert llm.invoke(f"SQL generator\nUser question: count {T0} rows").content == WORKLOAD[f"count {T0} rows"]
+    repair = f"The SQL below failed.\nSQL: {BROKEN_SQL}\nError: no such column\nUser question: {BROKEN_QUESTION}"
+    assert llm.invoke(repair).content == FIXED_SQL
+    assert llm.invoke("hello there").content == llm.chat_reply
+    assert llm.calls == 3
+
+
+def test_stub_llm_batches():
+    llm = StubChatModel({"rows": "SELECT 2"}, latency_s=0)
+    replies = llm.batch(["User question: rows", "User question: other"])
+    assert [r.content for r in replies] == ["SELECT 2", llm.chat_reply]
+    assert (llm.batch_calls, llm.calls) == (1, 2)
+
+
+def test_workload_runs_end_to_end(agent):
+    for question, sql in WORKLOAD.items():
+        result = agent.run_user_query(question, explicit_db="small.db")
+        assert isinstance(result, dict), (question, result)
+        assert result["sql"].startswith(sql)
+
+
+def test_compare_flags_regressions_in_both_directions():
+    def report(p50, rps):
+        return {"databases": {"small.db": {
+            "stages": {"generate": {"p50_ms": p50, "p95_ms": p50}},
+            "agent_throughput": [{"concurrency": 10, "throughput_rps": rps}],
+        }}}
+
+    baseline = report(10.0, 100.0)
+    assert compare(report(11.0, 95.0), baseline, threshold=0.2) == []
+    regressions = compare(report(20.0, 50.0), baseline, threshold=0.2)
+    assert len(regressions) == 3
+    assert any("throughput_rps" in line for line in regressions)
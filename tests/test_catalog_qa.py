@@ -0,0 +1,74 @@
+# tests/test_catalog_qa.py
+import sqlite3
+
+import pytest
+
+from agent.catalog_qa import CatalogQA, tokens
+from benchmarks.synthetic import table_name
+from loaders.schema_catalog import SchemaCatalog
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+    path = str(tmp_path / "music.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE Artist (ArtistId INTEGER PRIMARY KEY, Name TEXT);
+        CREATE TABLE Album (AlbumId INTEGER PRIMARY KEY, Title TEXT,
+                            ArtistId INTEGER REFERENCES Artist(ArtistId));
+        CREATE TABLE Genre (GenreId INTEGER PRIMARY KEY, Name TEXT);
+        CREATE TABLE Track (TrackId INTEGER PRIMARY KEY, Name TEXT, ReleaseDate DATE,
+                            AlbumId INTEGER REFERENCES Album(AlbumId),
+                            GenreId INTEGER REFERENCES Genre(GenreId));
+        """
+    )
+    conn.close()
+    return {"music.db": SchemaCatalog().get(path)}
+
+
+def test_identifiers_and_questions_share_tokens():
+    assert tokens("ReleaseDate") == ["release", "date"]
+    assert tokens("order_details") == ["order", "detail"]
+    assert tokens("songs by singers") == ["track", "by", "artist"]
+
+
+def test_which_tables(snapshots):
+    answer = CatalogQA().answer("Which tables store songs?", snapshots)
+    assert answer.text == "Tables for 'track':\n- Track"
+
+
+def test_which_columns(snapshots):
+    answer = CatalogQA().answer("What columns does the album table have?", snapshots)
+    assert answer.text == "Columns for 'album':\n- Album: AlbumId (INTEGER), Title (TEXT), ArtistId (INTEGER)"
+
+
+def test_date_columns_match_by_type(snapshots):
+    answer = CatalogQA().answer("which fields are dates", snapshots)
+    assert "Track: ReleaseDate (DATE)" in answer.text
+
+
+def test_relation_follows_the_foreign_key_path(snapshots):
+    text = CatalogQA().answer("How is artist related to track?", snapshots).text
+    assert text.startswith("Artist and Track are related through:")
+    assert '"Album".ArtistId → "Artist".ArtistId' in text
+    assert '"Track".AlbumId → "Album".AlbumId' in text
+
+
+def test_unplaced_words_fall_back_with_a_fragment(snapshots):
+    qa = CatalogQA(fragment_tables=2)
+    answer = qa.answer("which tables store the lyrics of tracks", snapshots)
+    assert answer.text is None
+    assert ("music.db", "Track") in answer.hits
+    assert qa.stats() == {"answered": 0, "fallbacks": 1}
+
+    fragment = qa.fragment(answer.hits, snapshots)["music.db"]
+    assert fragment.count("\n") == 1  # capped at two tables: Track and one FK neighbour
+    assert fragment.startswith("Track(")
+
+
+def test_chat_mode_answers_schema_questions_without_the_llm(agent):
+    calls = agent.llm.calls
+    result = agent.run_user_query(f"which tables store {table_name(2)}s?", mode="chat")
+    assert table_name(2) in result
+    assert agent.llm.calls == calls
@@ -0,0 +1,137 @@
+# tests/test_connection_pool.py
+import sqlite3
+import threading
+
+import pytest
+
+from loaders import connection_pool
+from loaders.connection_pool import (
+    ResidentBudget, ResidentConnectionPool, SQLDatabases, SQLiteConnectionPool, configure_database, get_pool,
+)
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "data.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(10)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _insert(path, x):
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO t VALUES (?)", (x,))
+    conn.commit()
+    conn.close()
+
+
+def _count(pool):
+    with pool.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+
+def test_connections_are_reused(db):
+    pool = SQLiteConnectionPool(db, max_size=2)
+    first = pool.acquire()
+    first.close()  # back to the pool, not closed
+    assert pool.acquire() is first
+    assert pool.stats()["opened"] == 1
+    pool.close()
+
+
+def test_connections_are_read_only(db):
+    pool = SQLiteConnectionPool(db)
+    with pool.connection() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO t VALUES (1)")
+        assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+    pool.close()
+
+
+def test_exhausted_pool_times_out(db):
+    pool = SQLiteConnectionPool(db, max_size=1)
+    held = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.05)
+    assert pool.stats()["timeouts"] == 1
+
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire(timeout=5)))
+    waiter.start()
+    held.close()
+    waiter.join(5)
+    assert got == [held]
+    pool.close()
+
+
+def test_unknown_pragmas_are_refused():
+    with pytest.raises(ValueError):
+        configure_database("x.db", journal_mode="WAL")
+
+
+def test_per_database_settings_apply_to_new_pools(db, monkeypatch):
+    monkeypatch.setattr(connection_pool, "_db_settings", {})
+    monkeypatch.setattr(connection_pool, "_pools", {})
+    configure_database("data.db", pool_size=3, cache_size=-1024)
+    pool = get_pool(db)
+    assert get_pool(db) is pool
+    assert pool.max_size == 3
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -1024
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+    pool.close()
+
+
+def test_paths_with_uri_characters_open(tmp_path):
+    path = str(tmp_path / "sales #1?.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.close()
+    pool = SQLiteConnectionPool(path)
+    assert _count(pool) == 0
+    pool.close()
+
+
+def test_sql_databases_open_nothing_until_used(db, monkeypatch):
+    monkeypatch.setattr(connection_pool, "_pools", {})
+    databases = SQLDatabases({"data.db": db})
+    assert list(databases) == ["data.db"] and len(databases) == 1
+    assert connection_pool._pools == {}
+
+
+def test_resident_pool_serves_a_snapshot_and_refreshes(db):
+    pool = ResidentConnectionPool(db, check_seconds=0, budget=ResidentBudget(None))
+    assert _count(pool) == 10
+    assert pool.stats()["resident"] == 1 and pool.uri.startswith("file:sqlagent-")
+
+    tag = pool.data_tag()
+    _insert(db, 99)
+    assert _count(pool) == 11
+    assert pool.data_tag() != tag
+    assert pool.stats()["snapshots"] == 2
+    pool.close()
+
+
+def test_connections_to_an_old_snapshot_are_closed_on_release(db):
+    pool = ResidentConnectionPool(db, check_seconds=0, budget=ResidentBudget(None))
+    old = pool.acquire()
+    _insert(db, 99)
+    assert _count(pool) == 11  # a new snapshot, while ``old`` still reads the previous one
+    assert old.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 10
+
+    old.close()
+    assert old not in pool._idle
+    assert pool.stats()["in_use"] == 0
+    pool.close()
+
+
+def test_resident_pool_falls_back_to_the_file_over_budget(db):
+    pool = ResidentConnectionPool(db, check_seconds=0, budget=ResidentBudget(1))
+    assert _count(pool) == 10
+    stats = pool.stats()
+    assert stats["resident"] == 0 and stats["demoted"] == 1
+    pool.close()
@@ -0,0 +1,92 @@
+# tests/test_cross_db.py
+import pytest
+
+from agent.cross_db import CrossDatabases, CrossDBError, schema_alias
+from benchmarks.synthetic import table_name
+
+T0, T1 = table_name(0), table_name(1)
+
+
+def test_schema_aliases_are_identifiers():
+    assert schema_alias("Chinook.db") == "chinook"
+    assert schema_alias("sales-2024.sqlite") == "sales_2024"
+    assert schema_alias("2024.db") == "db_2024"
+
+
+def test_targets_are_named_by_their_members(db_dir):
+    cross = CrossDatabases(max_attached=2)
+    paths = {"wide.db": f"{db_dir}/wide.db", "small.db": f"{db_dir}/small.db"}
+    name = cross.target(paths)
+    assert name == "cross:small+wide"
+    assert CrossDatabases.is_target(name)
+    assert cross.target(dict(reversed(list(paths.items())))) == name
+
+    with pytest.raises(CrossDBError):
+        cross.target({**paths, "third.db": f"{db_dir}/small.db"})
+    with pytest.raises(CrossDBError):
+        cross.target({"a-b.db": f"{db_dir}/small.db", "a_b.db": f"{db_dir}/wide.db"})
+    with pytest.raises(CrossDBError):
+        cross.members("cross:unknown")
+
+
+def test_combined_snapshot_qualifies_tables_and_foreign_keys(db_dir):
+    cross = CrossDatabases()
+    name = cross.target({"small.db": f"{db_dir}/small.db", "wide.db": f"{db_dir}/wide.db"})
+    snapshot = cross.snapshot(name)
+    assert cross.snapshot(name) is snapshot
+    assert f"small.{T1}" in snapshot.tables and f"wide.{T1}" in snapshot.tables
+    fk = snapshot.tables[f"small.{T1}"].foreign_keys[0]
+    assert fk.ref_table == f"small.{T0}"
+    assert f"small.{T0}(" in snapshot.text
+    assert snapshot.referenced_tables(f"SELECT * FROM wide.{T0}") == [f"wide.{T0}"]
+    assert snapshot.path_of(f"wide.{T0}").endswith("wide.db")
+
+
+def test_pools_are_cached_and_read_only(db_dir):
+    cross = CrossDatabases(cache_size=1)
+    first = cross.target({"small.db": f"{db_dir}/small.db", "wide.db": f"{db_dir}/wide.db"})
+    pool = cross.pool(first)
+    assert cross.pool(first) is pool
+    with pool.connection() as conn:
+        count = conn.execute(f"SELECT COUNT(*) FROM small.{T0} JOIN wide.{T0} USING (id)").fetchone()[0]
+        assert count == 20
+        with pytest.raises(Exception):
+            conn.execute(f"DELETE FROM small.{T0}")
+    with pytest.raises(TypeError):
+        pool.sql_database()  # no single file for SQLAlchemy to reflect
+
+    second = cross.target({"small.db": f"{db_dir}/small.db"})
+    cross.pool(second)
+    assert cross.stats()["evictions"] == 1
+    cross.close()
+
+
+def test_agent_answers_one_statement_over_attached_databases(agent):
+    question = f"compare {T0} rows in both databases"
+    sql = f"SELECT COUNT(*) FROM small.{T0} s JOIN wide.{T0} w ON s.id = w.id"
+    agent.llm.answers = {question: sql}
+    result = agent.run_user_query(question, explicit_db="small.db, wide.db", mode="cross")
+    assert result["database"] == "cross:small+wide"
+    assert result["rows"] == [(20,)]
+
+
+def test_unknown_cross_database_is_reported(agent):
+    result = agent.run_user_query(f"count {T0} rows", explicit_db="small.db,nope.db", mode="cross")
+    assert "nope.db" in str(result)
+
+
+class NoEmbeddings:
+    def embed_documents(self, texts):
+        raise RuntimeError("no embedding backend")
+
+    def embed_query(self, text):
+        raise RuntimeError("no embedding backend")
+
+
+def test_cross_target_without_embeddings_falls_back_to_names(agent):
+    agent._embeddings = NoEmbeddings()
+    agent.cross.max_attached = 1
+    assert agent._cross_target(f"count {T0} rows in small") == "cross:small"
+
+    result = agent.run_user_query(f"count {T0} rows", mode="cross")
+    assert "explicit_db" in str(result)
@@ -0,0 +1,86 @@
+# tests/test_example_store.py
+from agent.example_store import ExampleStore
+from benchmarks.scenarios import T0
+from benchmarks.stubs import StubEmbeddings
+
+from conftest import drain
+
+EMB = StubEmbeddings()
+
+
+def _add(store, question, sql, fingerprint="f1", db="a.db"):
+    store.add(db, question, sql, fingerprint, EMB.embed_query(question))
+
+
+def _search(store, question, fingerprint="f1", db="a.db", **kwargs):
+    return [e.sql for e in store.search(db, EMB.embed_query(question), fingerprint, **kwargs)]
+
+
+def test_similar_questions_retrieve_their_sql():
+    store = ExampleStore(min_score=0.3)
+    _add(store, "how many albums per artist", "SELECT artist_id, COUNT(*) FROM album GROUP BY 1")
+    _add(store, "total invoice amount by country", "SELECT country, SUM(total) FROM invoice GROUP BY 1")
+    assert _search(store, "how many albums does each artist have", k=1) == [
+        "SELECT artist_id, COUNT(*) FROM album GROUP BY 1"
+    ]
+    assert _search(store, "albums per artist", db="b.db") == []
+
+
+def test_duplicates_are_collapsed():
+    store = ExampleStore(min_score=0)
+    _add(store, "count albums", "SELECT COUNT(*) FROM album")
+    _add(store, "Count albums?", "SELECT COUNT(*) FROM album")
+    _add(store, "number of albums", "SELECT  COUNT(*)\n  FROM album;")
+    assert store.size("a.db") == 1
+    assert store.stats()["duplicates"] == 2
+
+    _add(store, "count albums", "SELECT COUNT(album_id) FROM album")
+    assert _search(store, "count albums") == ["SELECT COUNT(album_id) FROM album"]
+
+
+def test_capacity_evicts_least_recently_used():
+    store = ExampleStore(min_score=0, max_per_db=2)
+    _add(store, "first question", "SELECT 1")
+    _add(store, "second question", "SELECT 2")
+    _search(store, "first question", k=1)
+    _add(store, "third question", "SELECT 3")
+    assert sorted(_search(store, "question", k=3)) == ["SELECT 1", "SELECT 3"]
+
+
+def test_schema_change_revalidates_examples():
+    store = ExampleStore(min_score=0)
+    _add(store, "count albums", "SELECT COUNT(*) FROM album")
+    _add(store, "count tracks", "SELECT COUNT(*) FROM track")
+    assert _search(store, "count", fingerprint="f2") == []  # not verified against f2 yet
+
+    found = _search(store, "count", fingerprint="f2", compiles=lambda sql: "album" in sql)
+    assert found == ["SELECT COUNT(*) FROM album"]
+    stats = store.stats()
+    assert (stats["revalidated"], stats["evicted_schema"]) == (1, 1)
+
+
+def test_examples_survive_a_restart(tmp_path):
+    path = str(tmp_path / "examples.sqlite")
+    _add(ExampleStore(min_score=0, disk_path=path), "count albums", "SELECT COUNT(*) FROM album")
+    assert _search(ExampleStore(min_score=0, disk_path=path), "count albums") == ["SELECT COUNT(*) FROM album"]
+
+
+def test_outcome_rates():
+    store = ExampleStore()
+    store.record_outcome("first_attempt", shots=2)
+    store.record_outcome("repaired", shots=0)
+    store.record_outcome("first_attempt", shots=0)
+    stats = store.stats()
+    assert stats["first_attempt_rate_with_examples"] == 1.0
+    assert stats["repair_rate_without_examples"] == 0.5
+
+
+def test_verified_sql_becomes_a_few_shot_example(agent):
+    agent.run_user_query(f"count {T0} rows", explicit_db="small.db")
+    agent._example_writer.submit(lambda: None).result()  # wait for the background store
+    assert agent.examples.size("small.db") == 1
+
+    yielded, _ = drain(agent._generate_steps(f"count the {T0} rows please", "small.db"), "SELECT 1")
+    prompt = yielded[-1].messages[-1].content
+    assert "Verified examples for this database:" in prompt
+    assert f"Q: count {T0} rows" in prompt
@@ -0,0 +1,137 @@
+# tests/test_index_builder.py
+import os
+import sqlite3
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_database, table_name
+from loaders.schema_catalog import get_schema_catalog
+from rag import index_builder, table_index
+from rag.embeddings import get_embeddings
+from rag.index_builder import IncrementalIndexBuilder
+from rag.table_index import TableIndex, get_table_index
+
+
+class FakeStore:
+    """In-memory stand-in for a langchain Chroma store (chromadb is an
+    optional dependency); contents survive re-opening like a persisted one."""
+
+    data = {}
+
+    def __init__(self, path, embedding_function):
+        self.rows = FakeStore.data.setdefault(path, {})
+        self.emb = embedding_function
+
+    def add_texts(self, texts, metadatas, ids):
+        for id_, vec, meta in zip(ids, self.emb.embed_documents(texts), metadatas):
+            self.rows[id_] = (vec, meta)
+
+    def delete(self, ids):
+        for id_ in ids:
+            self.rows.pop(id_, None)
+
+    def get(self, ids, include):
+        found = [i for i in ids if i in self.rows]
+        return {
+            "ids": found,
+            "embeddings": [self.rows[i][0] for i in found],
+            "metadatas": [self.rows[i][1] for i in found],
+        }
+
+
+class Counting:
+    def __init__(self, inner):
+        self.inner = inner
+        self.documents = 0
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.inner.embed_query(text)
+
+
+@pytest.fixture
+def builder(tmp_path, monkeypatch):
+    emb = get_embeddings("hashing")
+    b = IncrementalIndexBuilder(str(tmp_path / "index"), backend="hashing", embeddings=emb)
+
+    def store(db_name):
+        path = os.path.join(b.persist_root, db_name)
+        os.makedirs(path, exist_ok=True)
+        return FakeStore(path, b.emb)
+
+    monkeypatch.setattr(b, "_store", store)
+    monkeypatch.setitem(index_builder._builders, "hashing", b)
+    yield b
+    FakeStore.data.clear()
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "shop.db")
+    generate_database(path, tables=20, columns=4, rows=10)
+    return path
+
+
+def _alter(path, table):
+    conn = sqlite3.connect(path)
+    conn.execute(f'ALTER TABLE "{table}" ADD COLUMN extra TEXT')
+    conn.commit()
+    conn.close()
+
+
+def test_rebuild_embeds_only_changed_tables(builder, database):
+    (first,) = builder.build_all({"shop.db": database})
+    assert first["embedded"] == first["tables"]
+
+    (again,) = builder.build_all({"shop.db": database})
+    assert again["embedded"] == 0
+
+    _alter(database, table_name(3))
+    (changed,) = builder.build_all({"shop.db": database})
+    assert changed["embedded"] == 1 and changed["dropped"] == 0
+
+
+def test_stored_vectors_skip_changed_tables(builder, database):
+    builder.build_all({"shop.db": database})
+    _alter(database, table_name(5))
+
+    snapshot = get_schema_catalog().get(database)
+    stored = builder.stored_vectors("shop.db", snapshot)
+    assert table_name(5) not in stored
+    assert len(stored) == len(snapshot.tables) - 1
+
+
+def test_table_index_embeds_only_missing_tables(builder, database):
+    builder.build_all({"shop.db": database})
+    _alter(database, table_name(2))
+    snapshot = get_schema_catalog().get(database)
+
+    counting = Counting(builder.emb)
+    index = TableIndex(snapshot, counting, stored=builder.stored_vectors("shop.db", snapshot))
+    assert counting.documents == 1
+    assert index.reused == len(snapshot.tables) - 1
+
+    fresh = TableIndex(snapshot, builder.emb)
+    assert np.allclose(index.matrix, fresh.matrix, atol=1e-6)
+
+
+def test_get_table_index_loads_the_persisted_store(builder, database):
+    builder.build_all({"shop.db": database})
+    snapshot = get_schema_catalog().get(database)
+    table_index._indexes.pop(snapshot.db_path, None)
+
+    index = get_table_index(snapshot, builder.emb)
+    assert index.reused == len(snapshot.tables)
+
+
+def test_other_embeddings_never_reuse_stored_vectors(builder, database):
+    builder.build_all({"shop.db": database})
+    snapshot = get_schema_catalog().get(database)
+    table_index._indexes.pop(snapshot.db_path, None)
+
+    index = get_table_index(snapshot, Counting(builder.emb))
+    assert index.reused == 0
@@ -0,0 +1,156 @@
+# tests/test_jobs.py
+import csv
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from agent import jobs, query_guard
+from agent.jobs import JobQueue, _ParquetWriter
+from agent.query_guard import configure_policy
+from agent.sql_agent import MultiDBAgent
+from benchmarks.stubs import StubChatModel, StubEmbeddings
+from benchmarks.synthetic import generate_database, table_name
+
+T0 = table_name(0)
+SLOW = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n LIMIT 3000000) SELECT COUNT(*) FROM n"
+ENDLESS = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+
+ANSWERS = {
+    "list customer ids": f"SELECT id FROM {T0}",
+    "count slowly": SLOW,
+    "count forever": ENDLESS,
+}
+
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    monkeypatch.setattr(query_guard, "_policies", {})
+    generate_database(str(tmp_path / "shop.db"), tables=4, columns=4, rows=500)
+    agent = MultiDBAgent(llm=StubChatModel(ANSWERS, latency_s=0), db_dir=str(tmp_path))
+    agent._embeddings = StubEmbeddings()
+    return agent
+
+
+def _queue(agent, tmp_path, **kwargs):
+    return JobQueue(agent, directory=str(tmp_path / "jobs"), **kwargs)
+
+
+def _wait(queue, job, timeout=10):
+    deadline = time.monotonic() + timeout
+    while job.status in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_csv_export(agent, tmp_path):
+    queue = _queue(agent, tmp_path)
+    job = _wait(queue, queue.submit("list customer ids", explicit_db="shop.db"))
+
+    assert job.status == "done", job.error
+    assert job.rows == 500
+    with open(queue.artifact(job.id).path, newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["id"] and len(rows) == 501
+
+
+def test_identical_jobs_are_reused_until_the_data_changes(agent, tmp_path):
+    queue = _queue(agent, tmp_path)
+    first = _wait(queue, queue.submit("list customer ids", explicit_db="shop.db"))
+    again = queue.submit("List  customer IDs", explicit_db="shop.db")
+    assert again is first and first.reused == 1
+
+    conn = sqlite3.connect(str(tmp_path / "shop.db"))
+    conn.execute(f"DELETE FROM {T0} WHERE id > 100")
+    conn.commit()
+    conn.close()
+
+    fresh = _wait(queue, queue.submit("list customer ids", explicit_db="shop.db"))
+    assert fresh is not first and fresh.rows == 100
+
+
+def test_cancel_queued_and_running_jobs(agent, tmp_path):
+    queue = _queue(agent, tmp_path, workers=1)
+    running = queue.submit("count forever", explicit_db="shop.db")
+    queued = queue.submit("list customer ids", explicit_db="shop.db")
+    while running.status != "running":
+        time.sleep(0.01)
+
+    assert queue.cancel(queued.id).status == "cancelled"
+    queue.cancel(running.id)
+    assert _wait(queue, running).status == "cancelled"
+    assert queue.stats()["cancelled"] == 2
+
+
+def test_cancel_just_after_a_worker_picks_up_the_job(agent, tmp_path, monkeypatch):
+    picked_up = threading.Event()
+    proceed = threading.Event()
+    run = JobQueue._run
+
+    def paused_run(self, job):
+        picked_up.set()
+        proceed.wait(5)
+        run(self, job)
+
+    monkeypatch.setattr(JobQueue, "_run", paused_run)
+    queue = _queue(agent, tmp_path)
+    job = queue.submit("list customer ids", explicit_db="shop.db")
+    assert picked_up.wait(5)
+
+    queue.cancel(job.id)  # too late for future.cancel(), too early for a statement
+    proceed.set()
+    assert _wait(queue, job).status == "cancelled"
+    assert job.expires is not None and queue.stats()["cancelled"] == 1
+    assert job.id not in agent.cancellations._recent  # nothing left to cancel a later statement
+
+
+def test_jobs_have_their_own_time_budget(agent, tmp_path):
+    # far below the job's runtime: an interactive stream would be stopped
+    configure_policy("shop.db", stream_timeout_s=0.05, full_scan_rows=0)
+    queue = _queue(agent, tmp_path, timeout_s=0)
+    job = _wait(queue, queue.submit("count slowly", explicit_db="shop.db"))
+    assert job.status == "done", job.error
+
+    queue = _queue(agent, tmp_path, timeout_s=0.1)
+    job = _wait(queue, queue.submit("count forever", explicit_db="shop.db"))
+    assert job.status == "failed" and "time budget" in job.error
+
+
+def test_parquet_columns_widen_for_later_chunks(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "out.parquet")
+    writer = _ParquetWriter(path, ["n", "x"], chunk_rows=2)
+    writer.write([(1, 10), (2, 20)])
+    writer.write([(2.5, 30), (3, "n/a")])
+    writer.write([(None, 40)])
+    writer.close()
+
+    table = pq.read_table(path)
+    assert [str(t) for t in table.schema.types] == ["double", "string"]
+    assert table.column("n").to_pylist() == [1.0, 2.0, 2.5, 3.0, None]
+    assert table.column("x").to_pylist() == ["10", "20", "30", "n/a", "40"]
+    assert pq.ParquetFile(path).num_row_groups == 3
+    assert writer.retyped == 1
+
+
+def test_parquet_export(agent, tmp_path, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    conn = sqlite3.connect(str(tmp_path / "shop.db"))
+    conn.execute("CREATE TABLE mixed (v)")
+    conn.executemany("INSERT INTO mixed VALUES (?)", [(i,) for i in range(10)] + [(0.5,), ("x",)])
+    conn.commit()
+    conn.close()
+    agent.llm.answers["list mixed values"] = "SELECT v FROM mixed ORDER BY rowid"
+
+    # small row groups, so the REAL and the TEXT arrive after INTEGER ones
+    media_type = jobs.FORMATS["parquet"][0]
+    monkeypatch.setitem(
+        jobs.FORMATS, "parquet", (media_type, lambda path, columns: _ParquetWriter(path, columns, chunk_rows=4))
+    )
+    queue = _queue(agent, tmp_path)
+    job = _wait(queue, queue.submit("list mixed values", explicit_db="shop.db", format="parquet"))
+
+    assert job.status == "done", job.error
+    values = pq.read_table(job.path).column("v").to_pylist()
+    assert values[:3] == ["0", "1", "2"] and values[-2:] == ["0.5", "x"]
@@ -0,0 +1,107 @@
+# tests/test_llm_dispatch.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agent.llm_dispatch import LLMDispatcher, prompt_key
+from benchmarks.stubs import StubChatModel
+
+
+def _question(q: str) -> str:
+    return f"You are an SQL generator.\nUser question:\n{q}\n"
+
+
+@pytest.fixture
+def llm():
+    return StubChatModel({"alpha": "SELECT 'a'", "beta": "SELECT 'b'"}, latency_s=0.05)
+
+
+def test_prompt_key_distinguishes_message_roles():
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    assert prompt_key("x") == "x"
+    assert prompt_key([SystemMessage("x")]) != prompt_key([HumanMessage("x")])
+
+
+def test_sync_identical_prompts_share_one_call(llm):
+    dispatcher = LLMDispatcher(llm, window_s=0.02)
+    with ThreadPoolExecutor(8) as pool:
+        replies = list(pool.map(lambda _: dispatcher.invoke(_question("alpha")), range(8)))
+
+    assert {r.content for r in replies} == {"SELECT 'a'"}
+    assert llm.calls == 1
+    assert dispatcher.stats()["coalesced"] == 7
+
+
+def test_sync_distinct_prompts_are_batched(llm):
+    dispatcher = LLMDispatcher(llm, window_s=0.05)
+    with ThreadPoolExecutor(2) as pool:
+        a, b = pool.map(dispatcher.invoke, [_question("alpha"), _question("beta")])
+
+    assert (a.content, b.content) == ("SELECT 'a'", "SELECT 'b'")
+    assert llm.batch_calls == 1
+    assert dispatcher.stats()["batch_sizes"] == {2: 1}
+
+
+def test_async_coalescing_and_batching(llm):
+    dispatcher = LLMDispatcher(llm, window_s=0.02)
+
+    async def main():
+        prompts = [_question("alpha")] * 5 + [_question("beta")] * 5
+        replies = await asyncio.gather(*(dispatcher.ainvoke(p) for p in prompts))
+        state = next(iter(dispatcher._async_states.values()))
+        return replies, state
+
+    replies, state = asyncio.run(main())
+    assert [r.content for r in replies] == ["SELECT 'a'"] * 5 + ["SELECT 'b'"] * 5
+    assert llm.batch_calls == 1 and llm.calls == 2
+    assert dispatcher.stats()["coalesced"] == 8
+    assert not state.tasks  # batch tasks are released once done
+
+
+def test_async_batch_tasks_are_held_until_done(llm):
+    dispatcher = LLMDispatcher(llm, window_s=0)
+
+    async def main():
+        call = asyncio.ensure_future(dispatcher.ainvoke(_question("alpha")))
+        await asyncio.sleep(0.01)  # flushed, upstream call in progress
+        state = next(iter(dispatcher._async_states.values()))
+        held = len(state.tasks)
+        await call
+        return held, len(state.tasks)
+
+    assert asyncio.run(main()) == (1, 0)
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call(llm):
+    dispatcher = LLMDispatcher(llm, window_s=0.01)
+
+    async def main():
+        first = asyncio.ensure_future(dispatcher.ainvoke(_question("alpha")))
+        second = asyncio.ensure_future(dispatcher.ainvoke(_question("alpha")))
+        await asyncio.sleep(0.02)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()).content == "SELECT 'a'"
+
+
+class FailingLLM:
+    def invoke(self, messages, **kwargs):
+        raise RuntimeError("upstream down")
+
+    async def ainvoke(self, messages, **kwargs):
+        raise RuntimeError("upstream down")
+
+
+def test_upstream_errors_reach_every_waiter():
+    dispatcher = LLMDispatcher(FailingLLM(), window_s=0.01)
+    with pytest.raises(RuntimeError):
+        dispatcher.invoke("x")
+
+    async def main():
+        return await asyncio.gather(dispatcher.ainvoke("y"), dispatcher.ainvoke("y"), return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(main()))
+    assert dispatcher.stats()["errors"] == 2
@@ -0,0 +1,196 @@
+# tests/test_llm_limiter.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agent.llm_dispatch import LLMDispatcher
+from agent.llm_limiter import AdaptiveLimiter, LLMBusy, is_rate_limited
+from benchmarks.stubs import StubChatModel
+from utils import tracing
+
+
+class RateLimitError(Exception):
+    pass
+
+
+def test_rate_limit_detection():
+    class Response:
+        status_code = 429
+
+    err = Exception("x")
+    err.response = Response()
+    assert is_rate_limited(err)
+    assert is_rate_limited(RateLimitError())
+    assert not is_rate_limited(ValueError())
+
+
+def test_limit_grows_only_while_saturated():
+    limiter = AdaptiveLimiter(initial=2, max_limit=8)
+    limiter.acquire("generate")
+    limiter.release(0.1)
+    assert limiter.limit == 2  # one of two slots in use: no signal to grow
+
+    limiter.acquire("generate")
+    limiter.acquire("generate")
+    limiter.release(0.1)
+    assert limiter.limit == 2.5
+    limiter.release(0.1)
+
+
+def test_429_halves_the_limit_once_per_round_trip():
+    limiter = AdaptiveLimiter(initial=16, min_limit=2)
+    limiter.acquire("generate")
+    limiter.release(1.0)  # a round-trip takes ~1s
+    for _ in range(3):
+        limiter.acquire("generate")
+    for _ in range(3):
+        limiter.release(0.1, RateLimitError())
+    assert limiter.limit == 8
+    assert limiter.stats()["rate_limited"] == 3
+
+    limiter._last_decrease -= 1.0  # a round-trip later
+    limiter.acquire("generate")
+    limiter.release(0.1, RateLimitError())
+    assert limiter.limit == 4
+
+
+def test_latency_backoff_is_opt_in():
+    def drift(limiter):
+        for latency in [0.1] * 10 + [5.0] * 10:
+            limiter.acquire("generate")
+            limiter.release(latency)
+        return limiter.limit
+
+    assert drift(AdaptiveLimiter(initial=16)) == 16
+    assert drift(AdaptiveLimiter(initial=16, latency_tolerance=2.5)) < 16
+
+
+def test_first_attempts_are_admitted_before_repairs():
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1)
+    limiter.acquire("generate")
+    order = []
+
+    def wait(purpose):
+        limiter.acquire(purpose)
+        order.append(purpose)
+        limiter.release(0.01)
+
+    threads = [threading.Thread(target=wait, args=(p,)) for p in ("repair", "generate")]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    limiter.release(0.01)
+    for t in threads:
+        t.join(5)
+    assert order == ["generate", "repair"]
+
+
+def test_full_queue_and_timeout_shed():
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1, queue_size=0)
+    limiter.acquire("generate")
+    with pytest.raises(LLMBusy):
+        limiter.acquire("generate")
+
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1, queue_timeout_s=0.05)
+    limiter.acquire("generate")
+    with pytest.raises(LLMBusy) as info:
+        limiter.acquire("repair")
+    assert info.value.retry_after >= 1
+    assert limiter.stats()["shed_timeout"] == 1
+
+
+def test_dispatcher_takes_one_slot_per_upstream_prompt():
+    limiter = AdaptiveLimiter(initial=4)
+    llm = StubChatModel({}, latency_s=0.02)
+    dispatcher = LLMDispatcher(llm, window_s=0.02, limiter=limiter)
+
+    async def main():
+        prompts = ["a"] * 4 + ["b"] * 4
+        await asyncio.gather(*(dispatcher.ainvoke(p) for p in prompts))
+
+    asyncio.run(main())
+    stats = limiter.stats()
+    # batch() still sends one request per input: each distinct prompt holds a slot
+    assert dispatcher.stats()["batches"] == 1
+    assert stats["admitted"] == dispatcher.stats()["upstream_prompts"] == 2
+    assert stats["inflight"] == 0
+
+
+def test_queue_wait_is_the_callers_own_stage():
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1)
+    dispatcher = LLMDispatcher(StubChatModel({}, latency_s=0), window_s=0, limiter=limiter)
+    limiter.acquire("generate")  # the only slot is taken
+    threading.Timer(0.1, limiter.release, args=(0.1,)).start()
+
+    with tracing.trace_request() as trace:
+        with tracing.span("generate"):
+            dispatcher.invoke("a")
+    assert trace.stages["queue"] >= 0.09
+    assert trace.stages["generate"] < 0.05  # the wait is not counted twice
+
+
+def test_async_queue_wait_lands_on_each_callers_trace():
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1)
+    dispatcher = LLMDispatcher(StubChatModel({}, latency_s=0.05), window_s=0, limiter=limiter)
+
+    async def query(prompt):
+        with tracing.trace_request() as trace:
+            await dispatcher.ainvoke(prompt)
+        return trace
+
+    async def main():
+        return await asyncio.gather(query("a"), query("b"))
+
+    first, second = asyncio.run(main())
+    waits = sorted(t.stages.get("queue", 0.0) for t in (first, second))
+    assert waits[0] < 0.02 and waits[1] >= 0.04
+
+
+class ThrottledLLM:
+    def invoke(self, messages, **kwargs):
+        raise RateLimitError("slow down")
+
+    def batch(self, inputs, return_exceptions=False, **kwargs):
+        return [RateLimitError("slow down") if i == "b" else "ok" for i in inputs]
+
+
+def test_dispatcher_reports_429s_to_the_limiter():
+    limiter = AdaptiveLimiter(initial=8)
+    dispatcher = LLMDispatcher(ThrottledLLM(), window_s=0.05, limiter=limiter)
+
+    with pytest.raises(RateLimitError):
+        dispatcher.invoke("a")
+    assert limiter.limit == 4
+
+    results = {}
+
+    def call(prompt):
+        try:
+            results[prompt] = dispatcher.invoke(prompt)
+        except Exception as e:
+            results[prompt] = e
+
+    threads = [threading.Thread(target=call, args=(p,)) for p in ("a", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert results["a"] == "ok" and isinstance(results["b"], RateLimitError)
+    assert limiter.limit == 2  # one 429 inside the batch still counts
+    assert limiter.stats()["inflight"] == 0
+
+
+def test_shed_batches_fail_every_waiter():
+    limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=1, queue_size=0)
+    limiter.acquire("generate")  # the only slot is taken
+    dispatcher = LLMDispatcher(StubChatModel({}, latency_s=0), window_s=0, limiter=limiter)
+    with pytest.raises(LLMBusy):
+        dispatcher.invoke("a")
+
+
+def test_agent_queries_go_through_the_limiter(agent):
+    before = agent.llm_limiter.stats()["admitted"]
+    agent.run_user_query("count customer rows", explicit_db="small.db")
+    assert agent.llm_limiter.stats()["admitted"] == before + agent.llm.calls
@@ -0,0 +1,97 @@
+# tests/test_preflight.py
+import pytest
+
+from agent.sql_agent import MultiDBAgent
+from agent.sql_preflight import PreflightError, SQLPreflight
+from benchmarks.stubs import StubChatModel, StubEmbeddings
+from benchmarks.synthetic import table_name
+from loaders.connection_pool import get_pool
+from loaders.schema_catalog import get_schema_catalog
+
+T0, T1 = table_name(0), table_name(1)  # customer, "order" (a keyword)
+
+
+@pytest.fixture
+def small(db_dir):
+    path = f"{db_dir}/small.db"
+    return get_pool(path), get_schema_catalog().get(path)
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT COUNT(*) FROM customr", f"SELECT COUNT(*) FROM {T0}"),
+    ("SELECT COUNT(*) FROM customers", f"SELECT COUNT(*) FROM {T0}"),
+    (f"SELECT {T0}_1_reel FROM {T0}", f"SELECT {T0}_1_real FROM {T0}"),
+    (f"SELECT c.{T0}_1_reel FROM {T0} c", f"SELECT c.{T0}_1_real FROM {T0} c"),
+    ("SELECT COUNT(*) FROM order", f'SELECT COUNT(*) FROM "{T1}"'),
+])
+def test_local_fixes(small, sql, expected):
+    pool, snapshot = small
+    assert SQLPreflight().check(pool, sql, snapshot) == expected
+
+
+def test_string_literals_are_left_alone(small):
+    pool, snapshot = small
+    fixed = SQLPreflight().check(pool, "SELECT 'customr' FROM customr", snapshot)
+    assert fixed == f"SELECT 'customr' FROM {T0}"
+
+
+def test_unfixable_sql_raises(small):
+    pool, snapshot = small
+    preflight = SQLPreflight()
+    with pytest.raises(PreflightError):
+        preflight.check(pool, "SELECT * FROM nothing_like_it", snapshot)
+    assert preflight.stats()["unfixable"] == 1
+
+
+def test_fix_counts_as_avoided_repair_only_once_executed(small):
+    pool, snapshot = small
+    preflight = SQLPreflight()
+    fixed = preflight.check(pool, "SELECT COUNT(*) FROM customr", snapshot)
+    assert preflight.stats()["fixed_locally"] == 1
+    assert preflight.stats()["llm_repairs_avoided"] == 0
+
+    preflight.executed(fixed)
+    preflight.executed(fixed)  # counted once per fix
+    assert preflight.stats()["llm_repairs_avoided"] == 1
+
+
+def _agent(db_dir, answers, repairs=None):
+    agent = MultiDBAgent(llm=StubChatModel(answers, repairs=repairs, latency_s=0), db_dir=db_dir)
+    agent._embeddings = StubEmbeddings()
+    return agent
+
+
+def test_agent_counts_fixes_that_run(db_dir):
+    agent = _agent(db_dir, {"how many customers": "SELECT COUNT(*) FROM customr"})
+    out = agent.run_user_query("how many customers", explicit_db="small.db")
+    assert out["sql"].startswith(f"SELECT COUNT(*) FROM {T0}")
+    assert agent.preflight.stats()["llm_repairs_avoided"] == 1
+
+
+def test_agent_does_not_count_fixes_that_fail_at_runtime(db_dir):
+    broken = "SELECT json('not json') FROM customr"
+    agent = _agent(
+        db_dir,
+        {"broken customers": broken},
+        repairs={f"SELECT json('not json') FROM {T0}": f"SELECT COUNT(*) FROM {T0}"},
+    )
+    out = agent.run_user_query("broken customers", explicit_db="small.db")
+    assert out["sql"].startswith(f"SELECT COUNT(*) FROM {T0}")
+    stats = agent.preflight.stats()
+    assert stats["fixed_locally"] == 1
+    assert stats["llm_repairs_avoided"] == 0
+
+
+def test_agent_does_not_count_fixes_of_llm_repairs_as_avoided(db_dir):
+    broken = f"SELECT json('not json') FROM {T0}"
+    agent = _agent(
+        db_dir,
+        {"broken customers": broken},
+        repairs={broken: "SELECT COUNT(*) FROM customr"},
+    )
+    out = agent.run_user_query("broken customers", explicit_db="small.db")
+    assert out["sql"].startswith(f"SELECT COUNT(*) FROM {T0}")
+    stats = agent.preflight.stats()
+    assert stats["fixed_locally"] == 1
+    assert stats["llm_repairs_avoided"] == 0
+    assert stats["repair_fixes_executed"] == 1
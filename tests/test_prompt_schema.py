@@ -0,0 +1,71 @@
+# tests/test_prompt_schema.py
+import threading
+
+from agent.sql_agent import Blocking, LLMCall
+from benchmarks.stubs import StubEmbeddings
+from benchmarks.synthetic import table_name
+from loaders.schema_catalog import get_schema_catalog
+from rag import table_index
+from rag.table_index import get_table_index
+
+from conftest import drain
+
+
+class CountingEmbeddings(StubEmbeddings):
+    def __init__(self, latency_s: float = 0.0):
+        super().__init__(latency_s=latency_s)
+        self.documents = 0
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return super().embed_documents(texts)
+
+
+def test_small_database_gets_full_schema(agent):
+    schema = agent._get_prompt_schema("small.db", "anything")
+    for i in range(6):
+        assert table_name(i) in schema
+
+
+def test_wide_database_prompt_is_pruned(agent):
+    full = agent._snapshot("wide.db")
+    schema = agent._get_prompt_schema("wide.db", f"count {table_name(7)} rows")
+    kept = [t for t in full.tables if f"{t}(" in schema]
+    assert table_name(7) in kept
+    assert len(kept) < len(full.tables)
+
+
+def test_repair_schema_keeps_tables_the_sql_references(agent):
+    far = table_name(39)
+    schema = agent._get_prompt_schema("wide.db", "unrelated words", sql=f"SELECT * FROM {far}")
+    assert f"{far}(" in schema
+
+
+def test_prompts_are_built_in_blocking_steps(agent):
+    yielded, sql = drain(agent._generate_steps("count customer rows", "small.db"), "SELECT 1")
+    assert [type(s) for s in yielded] == [Blocking, Blocking, LLMCall]
+    assert yielded[1].fn == agent._generation_prompt
+    assert sql == "SELECT 1"
+
+    yielded, _ = drain(agent._repair_steps("SELECT qqq", "no such column", "small.db"), "SELECT 1")
+    assert [type(s) for s in yielded] == [Blocking, LLMCall]
+    assert yielded[0].fn == agent._repair_prompt
+
+
+def test_concurrent_index_requests_build_once(db_dir):
+    snapshot = get_schema_catalog().get(f"{db_dir}/wide.db")
+    table_index._indexes.pop(snapshot.db_path, None)
+    emb = CountingEmbeddings(latency_s=0.05)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(get_table_index(snapshot, emb)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert emb.documents == len(snapshot.tables)
+    assert all(index is results[0] for index in results)
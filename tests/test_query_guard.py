@@ -0,0 +1,88 @@
+# tests/test_query_guard.py
+import sqlite3
+
+import pytest
+
+from agent import query_guard
+from agent.query_guard import (
+    ExecutionBudget, QueryBudgetExceeded, QueryCancelled, QueryGuard, QueryPolicy,
+    QueryRejected, apply_limit, configure_policy,
+)
+from benchmarks.synthetic import table_name
+from loaders.connection_pool import get_pool
+from loaders.schema_catalog import get_schema_catalog
+
+T0 = table_name(0)
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM t", "SELECT * FROM t\nLIMIT 100"),
+    ("SELECT * FROM t;", "SELECT * FROM t\nLIMIT 100"),
+    ("-- note\nWITH x AS (SELECT 1) SELECT * FROM x", "-- note\nWITH x AS (SELECT 1) SELECT * FROM x\nLIMIT 100"),
+    ("SELECT * FROM t LIMIT 10", "SELECT * FROM t LIMIT 10"),
+    ("SELECT * FROM t LIMIT 5000", "SELECT * FROM t LIMIT 100"),
+    ("SELECT * FROM t LIMIT 5000 OFFSET 20", "SELECT * FROM t LIMIT 100 OFFSET 20"),
+    ("SELECT * FROM t LIMIT 20, 5000", "SELECT * FROM t LIMIT 20, 5000"),
+    ("PRAGMA table_info(t)", "PRAGMA table_info(t)"),
+])
+def test_apply_limit(sql, expected):
+    assert apply_limit(sql, 100) == expected
+
+
+def test_apply_limit_disabled():
+    assert apply_limit("SELECT * FROM t;", 0) == "SELECT * FROM t"
+
+
+def test_budget_interrupts_long_statement():
+    conn = sqlite3.connect(":memory:")
+    budget = ExecutionBudget(max_vm_steps=10_000, interval=1_000)
+    budget.install(conn)
+    with pytest.raises(sqlite3.OperationalError) as info:
+        conn.execute(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+            "SELECT COUNT(*) FROM (SELECT i FROM n LIMIT 10000000)"
+        ).fetchone()
+    assert isinstance(budget.translate(info.value), QueryBudgetExceeded)
+
+
+def test_budget_reports_cancellation():
+    conn = sqlite3.connect(":memory:")
+    budget = ExecutionBudget(interval=100, cancelled=lambda: True)
+    budget.install(conn)
+    with pytest.raises(sqlite3.OperationalError) as info:
+        conn.execute("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT i FROM n").fetchall()
+    assert isinstance(budget.translate(info.value), QueryCancelled)
+
+
+def test_full_scan_flag_and_reject(db_dir):
+    path = f"{db_dir}/small.db"
+    pool, snapshot = get_pool(path), get_schema_catalog().get(path)
+    guard = QueryGuard()
+    sql = f"SELECT * FROM {T0}"
+
+    flagged = guard.inspect(pool, sql, snapshot, QueryPolicy(full_scan_rows=10))
+    assert flagged and T0 in flagged[0]
+    with pytest.raises(QueryRejected):
+        guard.inspect(pool, sql, snapshot, QueryPolicy(full_scan_rows=10, full_scan_action="reject"))
+    assert guard.inspect(pool, f"SELECT * FROM {T0} WHERE id = 3", snapshot,
+                         QueryPolicy(full_scan_rows=10)) == []
+
+
+@pytest.fixture
+def capped(monkeypatch):
+    monkeypatch.setattr(query_guard, "_policies", {})
+    configure_policy("small.db", max_rows=50, full_scan_rows=0)
+
+
+def test_truncated_result_carries_a_warning(agent, capped):
+    result = agent._run_sql("small.db", f"SELECT id FROM {T0}", False)
+    assert len(result.rows) == 50
+    assert any("truncated" in w for w in result.warnings)
+
+    cached = agent._run_sql("small.db", f"SELECT id FROM {T0}", False)
+    assert any("truncated" in w for w in cached.warnings)
+
+
+def test_results_under_the_cap_are_not_flagged(agent, capped):
+    assert agent._run_sql("small.db", f"SELECT id FROM {T0} LIMIT 10", False).warnings == []
+    assert agent._run_sql("small.db", f"SELECT id FROM {T0} WHERE id <= 20", False).warnings == []
@@ -0,0 +1,81 @@
+# tests/test_result_cache.py
+import shutil
+import sqlite3
+
+import pytest
+
+from agent.result_cache import ResultCache, normalize_sql
+from benchmarks import scenarios
+from benchmarks.synthetic import generate_database, table_name
+from loaders.data_version import DataVersionTracker
+from loaders.result_set import ResultSet
+
+T0 = table_name(0)
+
+
+def _write(path, sql):
+    conn = sqlite3.connect(path)
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def test_normalize_sql_keeps_literals():
+    assert normalize_sql("SELECT  a,\n b FROM t ;") == "SELECT a, b FROM t"
+    assert normalize_sql("SELECT 'a  b'") == "SELECT 'a  b'"
+
+
+def test_stale_tags_are_not_served():
+    cache = ResultCache()
+    key = cache.make_key("db", "SELECT 1")
+    cache.put(key, (1, 1), ResultSet.from_rows(["x"], ["INTEGER"], [(1,)]))
+
+    assert cache.get(key, (1, 1)).rows == [(1,)]
+    assert cache.get(key, (2, 1)) is None
+    assert cache.get(key, (1, 1)) is None  # the stale entry was dropped
+    assert cache.stats()["stale"] == 1
+
+
+@pytest.mark.parametrize("name", ["plain.db", "with space.db", "odd?name#1.db", "per%cent.db"])
+def test_data_tag_changes_on_commit(tmp_path, name):
+    path = str(tmp_path / name)
+    _write(path, "CREATE TABLE t (x)")
+    tracker = DataVersionTracker()
+    before = tracker.tag(path)
+    assert tracker.tag(path) == before
+
+    _write(path, "INSERT INTO t VALUES (1)")
+    assert tracker.tag(path) != before
+    # the tracker's read-only connection opened this very file
+    assert [p.name for p in tmp_path.iterdir()] == [name]
+    tracker.close()
+
+
+@pytest.fixture
+def writable_agent(tmp_path):
+    generate_database(str(tmp_path / "shop.db"), tables=4, columns=4, rows=50)
+    return scenarios.make_agent(str(tmp_path), latency_s=0), str(tmp_path / "shop.db")
+
+
+def test_agent_result_cache_follows_data_changes(writable_agent):
+    agent, path = writable_agent
+    sql = f"SELECT COUNT(*) FROM {T0}"
+
+    assert agent._run_sql("shop.db", sql, False).rows == [(50,)]
+    assert agent._run_sql("shop.db", sql, False).rows == [(50,)]
+    assert agent.result_cache.stats()["hits"] == 1
+
+    _write(path, f"DELETE FROM {T0} WHERE id > 40")
+    assert agent._run_sql("shop.db", sql, False).rows == [(40,)]
+    assert agent.result_cache.stats()["stale"] == 1
+
+
+def test_replaced_database_file_invalidates(writable_agent, tmp_path):
+    agent, path = writable_agent
+    sql = f"SELECT COUNT(*) FROM {T0}"
+    assert agent._run_sql("shop.db", sql, False).rows == [(50,)]
+
+    other = str(tmp_path / "other.db")
+    generate_database(other, tables=4, columns=4, rows=30)
+    shutil.copyfile(other, path)
+    assert agent._run_sql("shop.db", sql, False).rows == [(30,)]
@@ -0,0 +1,100 @@
+# tests/test_result_set.py
+import json
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+
+from agent import registry
+from benchmarks.scenarios import T0, T2
+from loaders.connection_pool import SQLiteConnectionPool
+from loaders.result_set import ResultSet, declared_types
+from loaders.schema_catalog import SchemaCatalog
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "rows.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, price NUMERIC, label)")
+    conn.executemany("INSERT INTO t VALUES (?, ?, ?)", [(i, i * 1.5, f"r{i}") for i in range(25)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_rows_stream_in_batches_and_release_the_connection(db):
+    pool = SQLiteConnectionPool(db, max_size=1)
+    result = ResultSet.execute(pool, "SELECT id FROM t", batch_size=10)
+    assert pool.stats()["in_use"] == 1
+
+    sizes = [len(batch) for batch in result.batches()]
+    assert sizes == [10, 10, 5]
+    assert result.rows_read == 25
+    assert pool.stats()["in_use"] == 0
+    with pytest.raises(RuntimeError):
+        list(result.batches())
+    pool.close()
+
+
+def test_small_results_are_buffered_immediately(db):
+    pool = SQLiteConnectionPool(db, max_size=1)
+    result = ResultSet.execute(pool, "SELECT id FROM t WHERE id < 3", batch_size=10)
+    assert pool.stats()["in_use"] == 0
+    assert result.rows == [(0,), (1,), (2,)]
+    pool.close()
+
+
+def test_close_releases_an_unread_cursor(db):
+    pool = SQLiteConnectionPool(db, max_size=1)
+    closed = []
+    with ResultSet.execute(pool, "SELECT id FROM t", batch_size=5, on_close=closed.append) as result:
+        with pytest.raises(RuntimeError):
+            result.rows
+    assert closed == [result]
+    assert pool.stats()["in_use"] == 0
+    pool.close()
+
+
+def test_types_come_from_the_schema_then_the_values(db):
+    snapshot = SchemaCatalog().get(db)
+    rows = [(1, 1.5, "r1", 2.0, None)]
+    columns = ["id", "price", "label", "avg_price", "nothing"]
+    assert declared_types(columns, rows, snapshot) == ["INTEGER", "NUMERIC", "TEXT", "REAL", ""]
+
+
+def test_agent_returns_typed_rows(agent):
+    result = agent.run_user_query(f"list {T2} names", explicit_db="small.db")
+    assert result["columns"] == ["id", f"{T2}_2_text"]
+    assert result["types"] == ["INTEGER", "TEXT"]
+    assert all(isinstance(row, tuple) for row in result["rows"])
+
+
+def test_stream_route_writes_ndjson(agent):
+    from web.fastapi_app import app
+
+    registry.set_agent(agent)
+    try:
+        response = TestClient(app).post(
+            "/query/stream?format=ndjson", json={"query": f"count {T0} rows", "explicit_db": "small.db"}
+        )
+    finally:
+        registry.reset_agents()
+    assert response.status_code == 200
+    assert json.loads(response.headers["X-Columns"]) == ["COUNT(*)"]
+    assert [json.loads(line) for line in response.text.splitlines()] == [{"COUNT(*)": 200}]
+
+
+def test_stream_route_escapes_non_latin1_sql(agent):
+    from web.fastapi_app import app
+
+    agent.llm.answers["customers from Tokyo"] = f"SELECT COUNT(*) FROM {T0} WHERE 'Zoë 東京' <> ''"
+    registry.set_agent(agent)
+    try:
+        response = TestClient(app).post(
+            "/query/stream?format=ndjson", json={"query": "customers from Tokyo", "explicit_db": "small.db"}
+        )
+    finally:
+        registry.reset_agents()
+    assert response.status_code == 200
+    assert "'Zoë 東京'" in json.loads(response.headers["X-SQL"])
@@ -0,0 +1,80 @@
+# tests/test_router_index.py
+import sqlite3
+
+import pytest
+
+from benchmarks.stubs import StubEmbeddings
+from rag import router_index
+from rag.router_index import RouteResult, RouterIndex
+
+
+def _make_db(path, tables):
+    conn = sqlite3.connect(path)
+    for table, columns in tables.items():
+        conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, {', '.join(columns)})")
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {
+        "music.db": _make_db(tmp_path / "music.db", {
+            "artist": ["artist_name TEXT"],
+            "album": ["album_title TEXT", "artist_id INTEGER"],
+            "track": ["track_name TEXT", "album_id INTEGER", "milliseconds INTEGER"],
+        }),
+        "hr.db": _make_db(tmp_path / "hr.db", {
+            "employee": ["employee_name TEXT", "salary REAL", "department_id INTEGER"],
+            "department": ["department_name TEXT"],
+        }),
+    }
+
+
+class CountingEmbeddings(StubEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.queries = 0
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+
+def test_query_ranks_the_database_with_matching_tables(paths):
+    index = RouterIndex(StubEmbeddings())
+    assert index.rank("employee salary by department", paths).best == "hr.db"
+    ranked = index.rank("album track names for an artist", paths)
+    assert ranked.best == "music.db"
+    assert [db for db, _ in ranked.ranked] == ["music.db", "hr.db"]
+
+
+def test_one_query_embedding_scores_every_database(paths):
+    embeddings = CountingEmbeddings()
+    index = RouterIndex(embeddings)
+    index.rank("employee salary", paths)
+    assert embeddings.queries == 1
+    assert index.table_matrix.shape[0] == 5
+    assert len(index.centroids) == 2
+
+
+def test_index_rebuilds_when_a_schema_changes(paths, monkeypatch):
+    monkeypatch.setattr(router_index, "ROUTER_REFRESH_SECONDS", 0)
+    index = RouterIndex(StubEmbeddings())
+    index.rank("anything", paths)
+
+    conn = sqlite3.connect(paths["hr.db"])
+    conn.execute("CREATE TABLE payroll (id INTEGER PRIMARY KEY, amount REAL)")
+    conn.commit()
+    conn.close()
+
+    index.rank("anything", paths)
+    assert index.table_matrix.shape[0] == 6
+
+
+def test_margin_and_ambiguity():
+    assert RouteResult([("a.db", 0.9), ("b.db", 0.2)]).margin == pytest.approx(0.7)
+    assert RouteResult([("a.db", 0.50), ("b.db", 0.49)]).ambiguous
+    assert not RouteResult([("a.db", 0.5)]).ambiguous
+    assert RouteResult([]).best is None
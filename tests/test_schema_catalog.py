@@ -0,0 +1,72 @@
+# tests/test_schema_catalog.py
+import sqlite3
+
+from loaders.schema_catalog import SchemaCatalog, render_table
+
+
+def _make_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE artist (id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+        CREATE TABLE "album art" (id INTEGER PRIMARY KEY, artist_id INTEGER REFERENCES artist(id));
+        INSERT INTO artist VALUES (1, 'a');
+        """
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_snapshot_is_reused_until_schema_changes(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    _make_db(path)
+    catalog = SchemaCatalog()
+
+    first = catalog.get(path)
+    assert catalog.get(path) is first
+    assert set(first.tables) == {"artist", "album art"}
+
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE genre (id INTEGER PRIMARY KEY)")
+    conn.commit()
+    conn.close()
+
+    second = catalog.get(path)
+    assert second is not first
+    assert second.schema_version > first.schema_version
+    assert "genre" in second.tables
+    assert second.fingerprint != first.fingerprint
+
+
+def test_data_changes_keep_the_fingerprint(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    _make_db(path)
+    catalog = SchemaCatalog()
+    first = catalog.get(path)
+
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO artist VALUES (2, 'b')")
+    conn.commit()
+    conn.close()
+
+    assert catalog.get(path).fingerprint == first.fingerprint
+
+
+def test_invalidate_forces_introspection(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    _make_db(path)
+    catalog = SchemaCatalog()
+    first = catalog.get(path)
+    catalog.invalidate(path)
+    assert catalog.get(path) is not first
+
+
+def test_compact_rendering_and_lookup(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    _make_db(path)
+    snapshot = SchemaCatalog().get(path)
+
+    assert render_table(snapshot.tables["artist"]) == "artist(id INTEGER pk, name TEXT)"
+    assert render_table(snapshot.tables["album art"]) == '"album art"(id INTEGER pk, artist_id INTEGER→artist.id)'
+    assert snapshot.table("ARTIST").name == "artist"
+    assert snapshot.referenced_tables('SELECT * FROM "album art" JOIN Artist') == ["album art", "artist"]
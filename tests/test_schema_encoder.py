@@ -0,0 +1,86 @@
+# tests/test_schema_encoder.py
+import sqlite3
+
+import pytest
+
+from loaders import schema_encoder
+from loaders.schema_catalog import SchemaCatalog, render_table
+from loaders.schema_encoder import SchemaEncoder, schema_budget
+from utils.tracing import count_tokens
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = str(tmp_path / "shop.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE Customer (CustomerId INTEGER PRIMARY KEY, FirstName TEXT, LastName TEXT,
+                               Email TEXT, Country TEXT, PostalCode TEXT);
+        CREATE TABLE Invoice (InvoiceId INTEGER PRIMARY KEY, InvoiceDate DATETIME, Total NUMERIC,
+                              BillingCity TEXT, CustomerId INTEGER REFERENCES Customer(CustomerId));
+        CREATE TABLE Employee (EmployeeId INTEGER PRIMARY KEY, Title TEXT, HireDate DATETIME,
+                               Phone TEXT, Fax TEXT);
+        """
+    )
+    conn.close()
+    return SchemaCatalog().get(path)
+
+
+def _cost(snapshot, types=True):
+    costs = [count_tokens(render_table(t, types=types)) for t in snapshot.tables.values()]
+    return sum(costs) + len(costs) - 1
+
+
+def test_fitting_schema_is_rendered_in_full(snapshot):
+    encoder = SchemaEncoder()
+    assert encoder.encode(snapshot, budget=_cost(snapshot)) == snapshot.text
+    assert encoder.encode(snapshot, budget=0) == snapshot.text  # 0 = unlimited
+    assert encoder.stats()["full"] == 2
+
+
+def test_types_are_dropped_first(snapshot):
+    encoder = SchemaEncoder()
+    text = encoder.encode(snapshot, budget=_cost(snapshot, types=False))
+    assert "INTEGER" not in text and "Customer(CustomerId pk, FirstName" in text
+    assert encoder.stats()["untyped"] == 1
+
+
+def test_columns_unrelated_to_the_question_go_next(snapshot):
+    encoder = SchemaEncoder()
+    text = encoder.encode(snapshot, question="totals by country", budget=_cost(snapshot, types=False) - 1)
+    assert encoder.stats()["pruned_columns"] == 1
+    # keys, join columns and the question's columns survive
+    assert "Customer(CustomerId pk, Country, …)" in text
+    assert "Invoice(InvoiceId pk, Total, CustomerId→Customer.CustomerId, …)" in text
+    assert "Employee(EmployeeId pk, …)" in text
+
+
+def test_least_relevant_tables_are_dropped_last(snapshot):
+    encoder = SchemaEncoder()
+    expected = [
+        "Invoice(InvoiceId pk, Total, CustomerId→Customer.CustomerId, …)",
+        "Employee(EmployeeId pk, …)",  # kept: e.g. referenced by the failing SQL
+        "… 1 more tables omitted",
+    ]
+    budget = sum(count_tokens(line) for line in expected) + len(expected) - 1
+    text = encoder.encode(snapshot, question="totals", budget=budget, keep=["Employee"])
+    assert text.split("\n") == expected
+    assert encoder.stats()["pruned_tables"] == 1
+
+
+def test_encodings_are_cached_per_schema_and_model(snapshot):
+    encoder = SchemaEncoder(maxsize=1)
+    encoder.encode(snapshot, budget=0)
+    encoder.encode(snapshot, budget=0)
+    encoder.encode(snapshot, budget=0, model="gpt-4o")
+    stats = encoder.stats()
+    assert (stats["cache_hits"], stats["cache_misses"], stats["cached_schemas"]) == (1, 2, 1)
+
+
+def test_budget_per_model_prefix(monkeypatch):
+    monkeypatch.setattr(schema_encoder, "SCHEMA_TOKEN_BUDGETS", {"gpt-4": 8000, "gpt-4o-mini": 2000})
+    monkeypatch.setattr(schema_encoder, "SCHEMA_TOKEN_BUDGET", 4000)
+    assert schema_budget("gpt-4o-mini-2024") == 2000
+    assert schema_budget("gpt-4o") == 8000
+    assert schema_budget("claude") == schema_budget(None) == 4000
@@ -0,0 +1,66 @@
+# tests/test_sessions.py
+from agent import session_store
+from agent.session_store import SessionStore, Turn
+from benchmarks.scenarios import T0, T2
+
+
+def test_turns_render_sql_or_answer():
+    assert Turn("count rows", sql="SELECT\n  COUNT(*)\nFROM t", database="a.db").render() == (
+        "Q: count rows\nSQL (a.db): SELECT COUNT(*) FROM t"
+    )
+    assert Turn("hi", answer="hello").render() == "Q: hi\nA: hello"
+
+
+def test_history_is_per_session_and_oldest_first():
+    store = SessionStore()
+    store.append("s1", Turn("first"))
+    store.append("s1", Turn("second"))
+    store.append("s2", Turn("other"))
+    assert [t.question for t in store.history("s1")] == ["first", "second"]
+    assert store.history(None) == [] and store.history("unknown") == []
+    store.append(None, Turn("ignored"))
+    assert store.stats()["turns"] == 3
+
+
+def test_history_is_trimmed_to_the_token_budget():
+    store = SessionStore(max_tokens=30, max_turns=3)
+    for i in range(5):
+        store.append("s", Turn(f"question number {i} " + "word " * 10))
+    kept = store.history("s")
+    assert 0 < len(kept) < 3
+    assert kept[-1].question.startswith("question number 4")
+    assert store.stats()["trimmed_turns"] == 3 - len(kept)
+
+
+def test_idle_and_least_recent_sessions_are_dropped(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(session_store.time, "monotonic", lambda: now[0])
+    store = SessionStore(max_sessions=2, idle_seconds=60)
+    store.append("a", Turn("q"))
+    store.append("b", Turn("q"))
+    store.append("c", Turn("q"))
+    assert store.history("a") == []
+    now[0] += 61
+    assert store.history("b") == []
+    stats = store.stats()
+    assert (stats["evicted_lru"], stats["evicted_idle"], stats["sessions"]) == (1, 2, 0)
+
+
+def test_prompt_prefix_does_not_change_with_history(agent):
+    history = [Turn(f"count {T0} rows", sql=f"SELECT COUNT(*) FROM {T0}", database="small.db")]
+    prefix, turn = agent._generation_prompt("now only ids above 10", "small.db")
+    prefix2, turn2 = agent._generation_prompt("now only ids above 10", "small.db", history=history)
+    assert prefix == prefix2
+    assert "Earlier in this conversation" in turn2 and f"SQL (small.db): SELECT COUNT(*) FROM {T0}" in turn2
+    assert turn2.endswith(turn)
+
+
+def test_followup_stays_on_the_previous_database(agent):
+    first = agent.run_user_query(f"list {T2} names", session_id="s")
+    agent.llm.answers[f"now only the first five {T2}"] = f"SELECT id FROM {T2} ORDER BY id LIMIT 5"
+    second = agent.run_user_query(f"now only the first five {T2}", session_id="s")
+    assert second["database"] == first["database"]
+    assert second["rows"] == [(1,), (2,), (3,), (4,), (5,)]
+    assert agent.sessions.stats()["followups"] == 1
+    # a question read against its history is not cached on its own
+    assert agent.sql_cache.stats()["stores"] == 1
@@ -0,0 +1,55 @@
+# tests/test_speculation.py
+import pytest
+
+from agent import speculation
+from agent.speculation import SpeculationBudget, speculation_candidates
+from benchmarks.synthetic import table_name
+from rag.router_index import RouteResult
+
+ONLY_WIDE = table_name(30)  # the small database has six tables
+
+
+def test_candidates_within_the_margin():
+    route = RouteResult([("a.db", 0.80), ("b.db", 0.78), ("c.db", 0.77), ("d.db", 0.2)])
+    assert [db for db, _ in speculation_candidates(route, top_n=3, margin=0.05)] == ["a.db", "b.db", "c.db"]
+    assert [db for db, _ in speculation_candidates(route, top_n=2, margin=0.05)] == ["a.db", "b.db"]
+    assert [db for db, _ in speculation_candidates(route, top_n=3, margin=0.01)] == ["a.db"]
+
+
+def test_no_signal_means_no_speculation():
+    assert speculation_candidates(RouteResult([("a.db", 0.0), ("b.db", 0.0)])) == [("a.db", 0.0)]
+    assert speculation_candidates(RouteResult([])) == []
+
+
+def test_budget_is_a_refilling_token_bucket(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(speculation.time, "monotonic", lambda: now[0])
+    budget = SpeculationBudget(per_minute=2)
+    assert budget.take(1) == 1
+    assert budget.take(3) == 1
+    assert budget.take(1) == 0
+    now[0] += 30  # one token back
+    assert budget.take(2) == 1
+    assert budget.stats()["budget_denied"] == 1
+    assert budget.stats()["extra_generations"] == 3
+
+
+@pytest.fixture
+def ambiguous(agent, monkeypatch):
+    monkeypatch.setattr(agent, "_rank_db", lambda q: RouteResult([("small.db", 0.50), ("wide.db", 0.49)]))
+    agent.llm.answers = {f"count {ONLY_WIDE}": f"SELECT COUNT(*) FROM {ONLY_WIDE}"}
+    return agent
+
+
+def test_first_candidate_that_validates_wins(ambiguous):
+    result = ambiguous.run_user_query(f"count {ONLY_WIDE} rows")
+    assert result["database"] == "wide.db"
+    assert result["rows"] == [(20,)]
+    assert ambiguous.speculation.stats()["wins_rank_1"] == 1
+
+
+def test_without_budget_the_favourite_is_used(ambiguous):
+    ambiguous.speculation = SpeculationBudget(per_minute=0)
+    result = ambiguous.run_user_query(f"count {ONLY_WIDE} rows")
+    assert result["database"] == "small.db"  # the stub's repair answers "SELECT 1"
+    assert ambiguous.speculation.stats()["budget_denied"] == 1
@@ -0,0 +1,69 @@
+# tests/test_sql_cache.py
+import time
+
+from agent.sql_cache import SQLGenerationCache, normalize_question
+from benchmarks.scenarios import T0
+
+
+def test_questions_normalize_case_space_and_punctuation():
+    assert normalize_question("  How many   Albums?? ") == normalize_question("how many albums")
+
+
+def test_key_depends_on_database_and_fingerprint():
+    key = SQLGenerationCache.make_key("generate", "count rows", "a.db", "f1")
+    assert key == SQLGenerationCache.make_key("generate", "Count rows?", "a.db", "f1")
+    assert key != SQLGenerationCache.make_key("generate", "count rows", "b.db", "f1")
+    assert key != SQLGenerationCache.make_key("generate", "count rows", "a.db", "f2")
+    assert key != SQLGenerationCache.make_key("repair", "count rows", "a.db", "f1")
+
+
+def test_memory_tier_is_lru_bounded():
+    cache = SQLGenerationCache(max_entries=2)
+    cache.put("a", "SELECT 1")
+    cache.put("b", "SELECT 2")
+    assert cache.get("a") == "SELECT 1"
+    cache.put("c", "SELECT 3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "SELECT 1"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire(monkeypatch):
+    cache = SQLGenerationCache(ttl_seconds=10)
+    cache.put("a", "SELECT 1")
+    now = time.time()
+    monkeypatch.setattr("agent.sql_cache.time.time", lambda: now + 11)
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache" / "sql.sqlite")
+    SQLGenerationCache(disk_path=path).put("a", "SELECT 1")
+
+    cache = SQLGenerationCache(disk_path=path)
+    assert cache.get("a") == "SELECT 1"
+    assert cache.get("a") == "SELECT 1"
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_repeated_question_skips_the_llm(agent):
+    first = agent.run_user_query(f"count {T0} rows", explicit_db="small.db")
+    calls = agent.llm.calls
+    second = agent.run_user_query(f"Count {T0} rows?", explicit_db="small.db")
+    assert agent.llm.calls == calls
+    assert second["sql"] == first["sql"]
+    assert agent.sql_cache.stats()["hits"] >= 1
+
+
+def test_failing_sql_is_not_cached(agent):
+    cache = SQLGenerationCache()
+    agent.sql_cache = cache
+    # fails at run time, and so does the "repair"
+    agent.llm.answers = {}
+    agent.llm.default_sql = "SELECT json('not json')"
+    result = agent.run_user_query(f"show broken {T0} values", explicit_db="small.db")
+    assert result.startswith("SQL failed after self-healing")
+    fingerprint = agent._schema_fingerprint("small.db")
+    assert cache.get(cache.make_key("generate", f"show broken {T0} values", "small.db", fingerprint)) is None
@@ -0,0 +1,84 @@
+# tests/test_sql_executor.py
+import threading
+import time
+
+import pytest
+
+from agent.query_guard import ExecutionBudget, QueryCancelled
+from agent.sql_executor import CancelHandle, Cancellations, InlineExecutor, ProcessExecutor
+from benchmarks.synthetic import table_name
+from loaders.connection_pool import get_pool
+
+ENDLESS = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+
+
+def test_cancel_before_start_is_remembered():
+    registry = Cancellations()
+    assert registry.cancel("req-1") == 0
+    assert registry.open("req-1").is_cancelled()
+    assert not registry.open("req-2").is_cancelled()
+
+
+def test_cancel_fires_hooks_of_running_statements():
+    registry = Cancellations()
+    handle = registry.open("req")
+    fired = []
+    handle.add_hook(lambda: fired.append(1))
+    assert registry.cancel("req") == 1
+    assert fired == [1]
+    registry.close(handle)
+
+
+def test_inline_executor_materializes(db_dir):
+    path = f"{db_dir}/small.db"
+    result = InlineExecutor().run(
+        get_pool(path), path, f"SELECT id FROM {table_name(0)} LIMIT 3", None, ExecutionBudget(), CancelHandle()
+    )
+    assert result.rows == [(1,), (2,), (3,)]
+
+
+@pytest.fixture(scope="module")
+def process_executor():
+    executor = ProcessExecutor(workers=1)
+    yield executor
+    executor.shutdown()
+
+
+def test_process_executor_runs_sql(db_dir, process_executor):
+    path = f"{db_dir}/small.db"
+    result = process_executor.run(
+        get_pool(path), path, f"SELECT COUNT(*) FROM {table_name(0)}", None, ExecutionBudget(), CancelHandle()
+    )
+    assert result.rows == [(200,)]
+
+
+def test_process_executor_cancels_running_and_queued(db_dir, process_executor):
+    path = f"{db_dir}/small.db"
+    budget = ExecutionBudget(timeout_s=10, interval=1000)
+    names = ("running", "handed_over_1", "handed_over_2", "pending")
+    handles = {name: CancelHandle() for name in names}
+    errors = {}
+
+    def run(name):
+        try:
+            process_executor.run(get_pool(path), path, ENDLESS, None, budget, handles[name])
+        except Exception as e:
+            errors[name] = e
+
+    threads = {}
+    # one worker: the first statement runs, the next two sit in the pool's
+    # call queue, the fourth is still a pending future that cancel() can drop
+    for name in handles:
+        threads[name] = threading.Thread(target=run, args=(name,))
+        threads[name].start()
+        time.sleep(0.5 if name == "running" else 0.1)
+
+    handles["pending"].cancel()
+    threads["pending"].join(5)
+    assert isinstance(errors.get("pending"), QueryCancelled)
+
+    for name in names[:-1]:
+        handles[name].cancel()
+    for t in threads.values():
+        t.join(5)
+    assert all(isinstance(errors.get(name), QueryCancelled) for name in handles)
@@ -0,0 +1,40 @@
+# tests/test_startup.py
+import pytest
+
+from agent import registry
+from benchmarks import scenarios
+from loaders import connection_pool
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    registry.reset_agents()
+    yield
+    registry.reset_agents()
+
+
+def test_agent_is_built_once_per_directory(db_dir):
+    assert registry.get_agent(db_dir, create=False) is None
+    agent = registry.get_agent(db_dir)
+    assert registry.get_agent(db_dir) is agent
+    assert registry.get_agent(db_dir, create=False) is agent
+
+
+def test_registered_agent_becomes_the_default(agent):
+    registry.set_agent(agent)
+    assert registry.get_agent() is agent
+
+
+def test_construction_defers_llm_and_connections(db_dir, monkeypatch):
+    monkeypatch.setattr(connection_pool, "_pools", {})
+    agent = registry.get_agent(db_dir)
+    assert agent.llm_dispatch._llm is None
+    assert agent._embeddings is None
+    assert sorted(agent.databases) == ["small.db", "wide.db"]
+    assert connection_pool._pools == {}
+
+
+def test_importing_the_api_loads_no_heavy_modules(db_dir):
+    report = scenarios.startup(db_dir, reruns=2)
+    assert report["heavy_modules_after_import"] == []
+    assert report["rerun_ms"] < report["first_agent_ms"]
@@ -0,0 +1,100 @@
+# tests/test_tracing.py
+import pytest
+from fastapi.testclient import TestClient
+
+from agent import registry
+from benchmarks.scenarios import BROKEN_QUESTION, T0
+from utils import tracing
+from utils.metrics import Counter, Histogram, MetricsRegistry, stats_families
+from utils.tracing import PrefixTracker
+
+
+@pytest.fixture
+def traces(monkeypatch):
+    """Every Trace finished during the test, with its outcome."""
+    finished = []
+    original = tracing.Trace.finish
+
+    def finish(self, outcome):
+        finished.append((self, outcome))
+        original(self, outcome)
+
+    monkeypatch.setattr(tracing.Trace, "finish", finish)
+    return finished
+
+
+def test_counter_and_histogram_render_prometheus_text():
+    counter = Counter("jobs_total", "Jobs", ["state"])
+    counter.inc(2, 'do"ne')
+    assert counter.render()[-1] == 'jobs_total{state="do\\"ne"} 2'
+
+    histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5.0)
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "latency_seconds_count 3" in lines
+
+
+def test_broken_collectors_do_not_break_the_scrape():
+    metrics = MetricsRegistry()
+    metrics.counter("ok_total", "ok").inc()
+
+    def broken():
+        raise RuntimeError("boom")
+
+    metrics.add_collector(broken)
+    metrics.add_collector(lambda: stats_families("app", {"cache": {"hits": 3, "name": "x", "on": True}}))
+    text = metrics.render()
+    assert "ok_total 1" in text
+    assert "app_cache_hits 3" in text
+    assert "app_cache_name" not in text and "app_cache_on" not in text
+
+
+def test_stats_families_can_label_the_outer_key():
+    families = stats_families("pool", {"a.db": {"opened": 1}, "b.db": {"opened": 2}}, label="database")
+    assert families == [("pool_opened", "pool opened", "gauge", {("a.db",): 1, ("b.db",): 2}, ("database",))]
+
+
+def test_prefix_tracker_counts_repeated_long_prefixes():
+    tracker = PrefixTracker(ttl=60, min_tokens=10)
+    assert tracker.cached_tokens("schema block", 50) == 0
+    assert tracker.cached_tokens("schema block", 50) == 50
+    assert tracker.cached_tokens("short", 5) == 0
+    assert tracker.cached_tokens("short", 5) == 0
+
+
+def test_query_trace_records_stages_and_llm_calls(agent, traces):
+    agent.run_user_query(BROKEN_QUESTION, explicit_db="small.db")
+    (trace, outcome), = traces
+    assert outcome == "ok"
+    assert trace.database == "small.db"
+    assert {"generate", "execute", "repair"} <= set(trace.stages)
+    assert trace.llm_calls == 2
+    assert trace.prompt_tokens > 0 and trace.completion_tokens > 0
+
+
+def test_request_id_is_reused_by_the_trace(agent, traces):
+    with tracing.trace_request("req-42"):
+        assert tracing.current_trace().request_id == "req-42"
+    agent.run_user_query(f"count {T0} rows", explicit_db="small.db")
+    assert traces[-1][0].request_id != "req-42"
+
+
+def test_metrics_route_exposes_pipeline_and_agent_series(agent):
+    from web.fastapi_app import app
+
+    registry.set_agent(agent)
+    try:
+        client = TestClient(app)
+        client.post("/query", json={"query": f"count {T0} rows", "explicit_db": "small.db"})
+        text = client.get("/metrics").text
+    finally:
+        registry.reset_agents()
+    assert "sqlagent_requests_total{" in text
+    assert 'sqlagent_stage_seconds_bucket{stage="execute"' in text
+    assert "sqlagent_sql_cache_stores" in text
+    assert 'sqlagent_sqlite_pool_opened{database="small.db"}' in text
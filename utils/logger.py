@@ -1,6 +1,12 @@
 # utils/logger.py
+import contextvars
+import json
 import logging
 import os
+import time
+
+# set per request (FastAPI middleware / tracing.trace_request); stamped on JSON lines
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
 
 def get_logger(name: str):
     logger = logging.getLogger(name)
@@ -18,3 +24,36 @@ def get_logger(name: str):
     logger.addHandler(fh)
     logger.addHandler(ch)
     return logger
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; structured data goes in ``extra={"fields": {...}}``."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+                  + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = request_id_var.get()
+        if request_id:
+            entry["request_id"] = request_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def get_json_logger(name: str):
+    """Structured logger (stdout); level from TRACE_LOG_LEVEL (default INFO)."""
+    logger = logging.getLogger(f"json.{name}")
+    if logger.handlers:
+        return logger
+    logger.setLevel(os.getenv("TRACE_LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+    ch = logging.StreamHandler()
+    ch.setFormatter(JsonFormatter())
+    logger.addHandler(ch)
+    return logger
@@ -0,0 +1,170 @@
+# utils/metrics.py
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# seconds; covers sub-ms cache hits up to slow LLM round-trips
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][i] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._series.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus text-format registry (no client library needed).
+
+    Counters and histograms are updated inline; ``collectors`` are callables
+    returning ``[(name, doc, type, {labels_tuple: value}, label_names)]`` and
+    are evaluated only when /metrics is scraped, for gauges that already
+    live elsewhere (pool, cache and dispatcher stats).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, doc: str, labels: Iterable[str] = ()) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, doc, labels)
+            return self._metrics[name]
+
+    def histogram(self, name: str, doc: str, labels: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, doc, labels, buckets)
+            return self._metrics[name]
+
+    def add_collector(self, collector: Callable):
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception:
+                continue  # a broken collector must not break the scrape
+            for name, doc, kind, values, label_names in families:
+                lines.append(f"# HELP {name} {doc}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(values.items()):
+                    lines.append(f"{name}{_labels(label_names, labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def stats_families(prefix: str, stats: Dict[str, Dict[str, float]], label: str = None) -> List[tuple]:
+    """
+    Turns component stats dicts into gauge families for a collector.
+
+    ``stats`` is {component: {key: value}}; with ``label`` set the outer key
+    becomes that label (e.g. one series per database) instead of part of
+    the metric name. Non-numeric values are skipped.
+    """
+    families: Dict[str, Dict[LabelValues, float]] = {}
+    for outer, values in stats.items():
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if label:
+                families.setdefault(f"{prefix}_{key}", {})[(outer,)] = value
+            else:
+                families.setdefault(f"{prefix}_{outer}_{key}", {})[()] = value
+    label_names = (label,) if label else ()
+    return [
+        (name, name.replace("_", " "), "gauge", series, label_names)
+        for name, series in sorted(families.items())
+    ]
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
@@ -0,0 +1,307 @@
+# utils/tracing.py
+import contextvars
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from utils.logger import get_json_logger, request_id_var
+from utils.metrics import get_registry
+
+# token counting can be switched off if even tiktoken's cost matters
+COUNT_TOKENS = os.getenv("TRACE_COUNT_TOKENS", "1") != "0"
+# estimate of the provider's prompt cache when it does not report cached tokens:
+# a prefix of at least MIN tokens seen within TTL seconds counts as cached
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", "300"))
+
+_metrics = get_registry()
+REQUESTS = _metrics.counter(
+    "sqlagent_requests_total", "Queries handled, by mode and outcome", ["mode", "outcome"]
+)
+REQUEST_SECONDS = _metrics.histogram(
+    "sqlagent_request_seconds", "End-to-end query latency", ["mode"]
+)
+STAGE_SECONDS = _metrics.histogram(
+    "sqlagent_stage_seconds", "Latency per pipeline stage", ["stage"]
+)
+LLM_CALLS = _metrics.counter(
+    "sqlagent_llm_calls_total", "LLM calls issued by the pipeline", ["purpose"]
+)
+LLM_TOKENS = _metrics.counter(
+    "sqlagent_llm_tokens_total", "LLM tokens (tiktoken count)", ["purpose", "kind"]
+)
+SQLITE_ROWS = _metrics.counter(
+    "sqlagent_sqlite_rows_total", "Rows returned by SQLite", ["database"]
+)
+SQLITE_BYTES = _metrics.counter(
+    "sqlagent_sqlite_bytes_total", "Approximate payload bytes returned by SQLite", ["database"]
+)
+ROUTE_WINNERS = _metrics.counter(
+    "sqlagent_route_winner_total", "Routed queries by rank of the winning candidate", ["rank", "speculative"]
+)
+
+_log = get_json_logger("sql_agent")
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+
+
+# ----------------------------------------------------------------------
+# TOKEN COUNTING
+# ----------------------------------------------------------------------
+_encodings: Dict[str, Any] = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding(model: Optional[str]):
+    key = model or ""
+    if key in _encodings:
+        return _encodings[key]
+    with _encodings_lock:
+        if key not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    enc = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+                except KeyError:
+                    enc = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                enc = None  # not installed or BPE file not downloadable: estimate instead
+            _encodings[key] = enc
+    return _encodings[key]
+
+
+def message_text(messages: Any) -> str:
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(getattr(m, "content", m)) for m in messages)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+# ----------------------------------------------------------------------
+# PROMPT PREFIX CACHING
+# ----------------------------------------------------------------------
+class PrefixTracker:
+    """Recently sent prompt prefixes, to estimate provider-side prefix cache hits."""
+
+    def __init__(self, ttl: float = PROMPT_CACHE_TTL, min_tokens: int = PROMPT_CACHE_MIN_TOKENS,
+                 maxsize: int = 4096):
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.maxsize = maxsize
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cached_tokens(self, prefix: str, prefix_tokens: int) -> int:
+        key = hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.maxsize:
+                self._seen.popitem(last=False)
+        hit = seen is not None and now - seen <= self.ttl and prefix_tokens >= self.min_tokens
+        return prefix_tokens if hit else 0
+
+
+_prefixes = PrefixTracker()
+
+
+def provider_cached_tokens(response: Any) -> Optional[int]:
+    """Cached prompt tokens as reported by the provider (langchain usage metadata), if any."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    if "cache_read" in details:
+        return details["cache_read"]
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    return (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+
+
+# ----------------------------------------------------------------------
+# TRACE
+# ----------------------------------------------------------------------
+class Trace:
+    """Everything recorded for one query; logged as one JSON line on finish()."""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.mode = "db"
+        self.database: Optional[str] = None
+        self.stages: Dict[str, float] = {}
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.rows = 0
+        self.bytes = 0
+        self.route: Optional[Dict[str, Any]] = None
+        self.examples: Optional[int] = None  # few-shot examples in the generation prompt
+
+    def add_stage(self, stage: str, seconds: float):
+        # stages can repeat (validate/execute after a repair); time accumulates
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def finish(self, outcome: str):
+        elapsed = time.perf_counter() - self.started
+        REQUESTS.inc(1, self.mode, outcome)
+        REQUEST_SECONDS.observe(elapsed, self.mode)
+        _log.info("query", extra={"fields": {
+            "mode": self.mode,
+            "database": self.database,
+            "outcome": outcome,
+            "total_ms": round(elapsed * 1000, 3),
+            "stages_ms": {k: round(v * 1000, 3) for k, v in self.stages.items()},
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_tokens": self.cached_tokens,
+            "cached_prefix_ratio": (
+                round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0
+            ),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            **({"route": self.route} if self.route else {}),
+            **({"examples": self.examples} if self.examples is not None else {}),
+        }})
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def trace_request(request_id: Optional[str] = None):
+    """
+    Opens a Trace for one query and makes it (and its request ID) current
+    for every span recorded in this context, including worker threads
+    started with asyncio.to_thread.
+    """
+    request_id = request_id or request_id_var.get() or new_request_id()
+    trace = Trace(request_id)
+    trace_token = _current.set(trace)
+    id_token = request_id_var.set(request_id)
+    try:
+        yield trace
+    finally:
+        request_id_var.reset(id_token)
+        _current.reset(trace_token)
+
+
+def annotate(**attrs):
+    trace = _current.get()
+    if trace is not None:
+        for key, value in attrs.items():
+            setattr(trace, key, value)
+
+
+class _OpenSpan:
+    __slots__ = ("waited",)
+
+    def __init__(self):
+        self.waited = 0.0  # seconds recorded by record_wait() inside this span
+
+
+_open_span: contextvars.ContextVar[Optional[_OpenSpan]] = contextvars.ContextVar("open_span", default=None)
+
+
+def _record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = _current.get()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """Times a stage; waits recorded inside it (record_wait) are not counted twice."""
+    start = time.perf_counter()
+    opened, outer = _OpenSpan(), _open_span.get()
+    # set back rather than reset(): a pipeline generator may be closed in another context
+    _open_span.set(opened)
+    try:
+        yield
+    finally:
+        _open_span.set(outer)
+        _record_stage(stage, max(0.0, time.perf_counter() - start - opened.waited))
+
+
+def record_wait(stage: str, seconds: float):
+    """A wait measured by the caller (e.g. for an LLM slot), moved out of the enclosing span."""
+    _record_stage(stage, seconds)
+    opened = _open_span.get()
+    if opened is not None:
+        opened.waited += seconds
+
+
+def record_llm(
+    purpose: str,
+    messages: Any,
+    completion: str,
+    model: Optional[str] = None,
+    prefix: Optional[str] = None,
+    response: Any = None,
+):
+    """
+    Counts one LLM call. ``prefix`` is the stable leading part of the prompt;
+    cached prompt tokens come from the provider's usage data when the
+    response carries it, else from PrefixTracker's estimate.
+    """
+    LLM_CALLS.inc(1, purpose)
+    trace = _current.get()
+    if trace is not None:
+        trace.llm_calls += 1
+    if not COUNT_TOKENS:
+        return
+    prompt_tokens = count_tokens(message_text(messages), model)
+    completion_tokens = count_tokens(completion, model)
+    cached = provider_cached_tokens(response)
+    if cached is None:
+        cached = _prefixes.cached_tokens(prefix, count_tokens(prefix, model)) if prefix else 0
+    LLM_TOKENS.inc(prompt_tokens, purpose, "prompt")
+    LLM_TOKENS.inc(completion_tokens, purpose, "completion")
+    LLM_TOKENS.inc(cached, purpose, "cached")
+    if trace is not None:
+        trace.prompt_tokens += prompt_tokens
+        trace.completion_tokens += completion_tokens
+        trace.cached_tokens += cached
+
+
+def record_route(candidates, winner: Optional[str], speculative: bool):
+    """Which routing candidate answered, for tuning the router (-1 = none validated)."""
+    names = [db for db, _ in candidates]
+    rank = names.index(winner) if winner in names else -1
+    ROUTE_WINNERS.inc(1, str(rank), str(speculative).lower())
+    trace = _current.get()
+    if trace is not None:
+        trace.route = {
+            "candidates": [[db, round(score, 4)] for db, score in candidates],
+            "winner": winner,
+            "rank": rank,
+            "speculative": speculative,
+        }
+
+
+def record_rows(database: str, rows: int, nbytes: int, trace: Optional[Trace] = None):
+    SQLITE_ROWS.inc(rows, database)
+    SQLITE_BYTES.inc(nbytes, database)
+    trace = trace or _current.get()
+    if trace is not None:
+        trace.rows += rows
+        trace.bytes += nbytes
@@ -1,10 +1,14 @@
 # web/fastapi_app.py
 
+import csv
+import io
+import json
 import os
 import sys
-from typing import Optional
+from typing import Iterator, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
@@ -16,7 +20,13 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
-from agent.sql_agent import MultiDBAgent
+from agent.jobs import FORMATS as JOB_FORMATS, JobQueueFull, get_job_queue
+from agent.llm_limiter import LLMBusy
+from agent.registry import get_agent
+from loaders.connection_pool import pool_stats
+from utils.logger import request_id_var
+from utils.metrics import get_registry, stats_families
+from utils.tracing import new_request_id
 
 app = FastAPI(
     title="Multi-DB RAG SQL Agent API",
@@ -24,7 +34,49 @@ app = FastAPI(
     version="1.0.0",
 )
 
-agent = MultiDBAgent()
+# the agent (LLM client, langchain, per-database engines) is built on the
+# first request, once per worker process — see agent.registry
+
+
+# -----------------------------
+# Request IDs + metrics
+# -----------------------------
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Propagates X-Request-ID (or mints one) into logs, traces and the response."""
+    request_id = request.headers.get("x-request-id") or new_request_id()
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+def _component_metrics():
+    # evaluated at scrape time; a scrape never forces the agent to load
+    agent = get_agent(create=False)
+    jobs = get_job_queue(create=False)
+    return (
+        (stats_families("sqlagent", agent.stats()) if agent is not None else [])
+        + (stats_families("sqlagent", {"jobs": jobs.stats()}) if jobs is not None else [])
+        + stats_families("sqlagent_sqlite_pool", pool_stats(), label="database")
+    )
+
+
+get_registry().add_collector(_component_metrics)
+
+
+@app.exception_handler(LLMBusy)
+async def llm_busy_handler(request: Request, exc: LLMBusy):
+    """Shed by LLM admission control: fail fast so clients back off."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "retry_after": exc.retry_after},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
 
 
 # -----------------------------
@@ -33,7 +85,7 @@ agent = MultiDBAgent()
 
 class QueryRequest(BaseModel):
     query: str
-    session_id: str = "default"
+    session_id: Optional[str] = None  # same id = same conversation (follow-up questions)
     mode: str = "db"           # "db" | "chat" | "cross"
     explicit_db: Optional[str] = None
 
@@ -42,31 +94,178 @@ class QueryResponse(BaseModel):
     result: object
 
 
+class JobRequest(BaseModel):
+    query: str
+    mode: str = "db"           # "db" | "cross"
+    explicit_db: Optional[str] = None
+    format: str = "csv"        # "csv" | "parquet" (needs pyarrow)
+
+
 # -----------------------------
 # Routes
 # -----------------------------
 
 @app.post("/query", response_model=QueryResponse)
-def query_db(req: QueryRequest):
+async def query_db(req: QueryRequest):
     """
     Execute a query using the SQL agent.
 
+    Runs natively on the event loop: LLM calls use ainvoke and SQLite work
+    is pushed to a worker thread, so a slow LLM round-trip does not hold a
+    threadpool thread.
+
     mode:
       - db    : database-backed query
       - chat  : pure LLM response
-      - cross : cross-database reasoning
+      - cross : one SQL statement over several ATTACHed databases
+                (explicit_db may list them, comma-separated)
+
+    Answers 503 with Retry-After when the LLM queue sheds the request.
     """
 
-    res = agent.run(
+    res = await get_agent().arun_user_query(
         query=req.query,
-        session_id=req.session_id,
-        mode=req.mode,
         explicit_db=req.explicit_db,
+        mode=req.mode,
+        session_id=req.session_id,
     )
 
     return {"result": res}
 
 
+# -----------------------------
+# Streaming results
+# -----------------------------
+
+def _json_default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return str(value)
+
+
+def _ndjson_stream(result) -> Iterator[str]:
+    columns = result.columns
+    for batch in result.batches():
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), default=_json_default) + "\n"
+            for row in batch
+        )
+
+
+def _csv_stream(result) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(result.columns)
+    for batch in result.batches():
+        writer.writerows(batch)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+STREAM_FORMATS = {
+    "ndjson": ("application/x-ndjson", _ndjson_stream),
+    "csv": ("text/csv", _csv_stream),
+}
+
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest, format: str = "ndjson"):
+    """
+    Same as /query, but rows are streamed as NDJSON (one object per row) or
+    CSV while they are read from SQLite, in fetchmany batches.
+    """
+    if format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+
+    res = await get_agent().arun_user_query(
+        query=req.query,
+        explicit_db=req.explicit_db,
+        stream=True,
+        mode=req.mode,
+        session_id=req.session_id,
+    )
+    if not isinstance(res, dict):
+        raise HTTPException(status_code=422, detail=str(res))
+
+    media_type, encoder = STREAM_FORMATS[format]
+    headers = {
+        "X-Database": res["database"],
+        # JSON-escaped like the columns: header values must be latin-1
+        "X-SQL": json.dumps(" ".join(res["sql"].split())),
+        "X-Columns": json.dumps(res["columns"]),
+        "X-Column-Types": json.dumps(res["types"]),
+    }
+    return StreamingResponse(encoder(res["rows"]), media_type=media_type, headers=headers)
+
+
+@app.post("/query/{request_id}/cancel")
+def cancel_query(request_id: str):
+    """
+    Cancels the SQL of an in-flight request (identified by the X-Request-ID
+    it was sent with). Statements it starts afterwards abort immediately.
+    """
+    return {"request_id": request_id, "cancelled": get_agent().cancel(request_id)}
+
+
+# -----------------------------
+# Background jobs
+# -----------------------------
+
+def _job_or_404(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    return job
+
+
+@app.post("/jobs", status_code=202)
+def submit_job(req: JobRequest):
+    """
+    Runs the query in the background and writes its rows to a CSV or
+    Parquet file; poll GET /jobs/{job_id}, then download /jobs/{job_id}/result.
+    An identical job whose data is unchanged is returned instead of re-run.
+    """
+    try:
+        job = get_job_queue().submit(req.query, req.explicit_db, req.mode, req.format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return _job_or_404(job_id).to_dict()
+
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    """Cancels a queued job, or interrupts the SQLite statement of a running one."""
+    _job_or_404(job_id)
+    return get_job_queue().cancel(job_id).to_dict()
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = _job_or_404(job_id)
+    if get_job_queue().artifact(job_id) is None:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}, no result to download")
+    media_type = JOB_FORMATS[job.format][0]
+    return FileResponse(job.path, media_type=media_type, filename=f"{job.id}.{job.format}")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition: stage/request histograms, token and row counters, pool/cache gauges."""
+    return PlainTextResponse(
+        get_registry().render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
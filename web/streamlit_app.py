@@ -1,7 +1,7 @@
 # web/streamlit_app.py
 import os
 import sys
-import pandas as pd
+import uuid
 import streamlit as st
 from dotenv import load_dotenv
 
@@ -11,13 +11,22 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
-from agent.sql_agent import MultiDBAgent
+from agent.llm_limiter import LLMBusy
+from agent.registry import get_agent
 
 st.set_page_config(page_title="Multi-DB RAG SQL Agent", layout="wide")
 
-agent = MultiDBAgent()
 
-def render_rows(rows, sql=None, agent=None, db_name=None):
+# Streamlit re-runs this script on every interaction; the agent (and its
+# caches, LLM client and connection pools) is built once per process
+@st.cache_resource
+def load_agent():
+    return get_agent()
+
+
+agent = load_agent()
+
+def render_rows(rows, columns=None):
     if rows is None:
         st.info("No rows returned.")
         return
@@ -30,22 +39,12 @@ def render_rows(rows, sql=None, agent=None, db_name=None):
         st.info("No rows returned.")
         return
 
-    # ✅ If SQL + agent + DB available → infer column names
-    if sql and agent and db_name:
-        try:
-            db = agent.databases[db_name]
-            with db._engine.connect() as conn:
-                result = conn.execute(sql)
-                columns = result.keys()
-            df = pd.DataFrame(rows, columns=columns)
-            st.dataframe(df, use_container_width=True)
-            return
-        except Exception:
-            pass  # fallback below
-
-    # ✅ Fallback: generic columns
-    cols = [f"col_{i}" for i in range(len(rows[0]))]
-    df = pd.DataFrame(rows, columns=cols)
+    import pandas as pd  # only needed once there is something to show
+
+    # ✅ Column names come with the typed result — no re-execution needed
+    if not columns:
+        columns = [f"col_{i}" for i in range(len(rows[0]))]
+    df = pd.DataFrame(rows, columns=columns)
     st.dataframe(df, use_container_width=True)
 
 
@@ -58,25 +57,25 @@ explicit_db = st.selectbox("Database", db_names)
 if explicit_db == "auto":
     explicit_db = None
 
-#session_id = st.text_input("Session ID", value="default")
+# follow-up questions ("now only for 2012") build on earlier ones of the same session
+session_id = st.text_input("Session ID", value=st.session_state.setdefault("session_id", uuid.uuid4().hex[:8]))
 query = st.text_area("Ask your question")
 
 if st.button("Run Query") and query.strip():
     with st.spinner("Thinking..."):
-        res = agent.run_user_query(
-                query=query,
-                explicit_db=explicit_db
-            )
+        try:
+            res = agent.run_user_query(
+                    query=query,
+                    explicit_db=explicit_db,
+                    session_id=session_id,
+                )
+        except LLMBusy as e:
+            res = str(e)
 
         if isinstance(res, dict):
             st.subheader(f"Database: {res['database']}")
             st.code(res["sql"], language="sql")
-            render_rows(
-                        res["rows"],
-                        sql=res["sql"],
-                        agent=agent,
-                        db_name=res["database"]
-                    )
+            render_rows(res["rows"], columns=res.get("columns"))
 
         else:
             st.write(res)